@@ -0,0 +1,138 @@
+"""
+Query benchmark of the clustered `yellow_taxi_trips` table.
+
+Loads the same synthetic trips in their arrival order and clustered by pickup time, then pickup
+location (`TRIPS_LOAD_ORDER=clustered`, an opt-in of table_YT_trip_records_2022), and runs
+representative time-window and zone filters on both. For each query it reports the median latency
+and the rows of the row groups whose min/max zone maps overlap the filter, i.e., the rows DuckDB
+has to scan.
+
+Run from `src/de_portfolio_nyc_tlc`:
+
+    python benchmarks/clustering_benchmark.py --rows 20000000 --repeat 5
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+
+# name: (WHERE clause, {column: (low, high)} of the filter, to check the zone maps with)
+QUERIES = {
+    "1 hour window": (
+        "pickup_dtime >= '2022-06-15 08:00:00' AND pickup_dtime < '2022-06-15 09:00:00'",
+        {"pickup_dtime": ("2022-06-15 08:00:00", "2022-06-15 08:59:59")},
+    ),
+    "1 day window": (
+        "pickup_dtime >= '2022-06-15' AND pickup_dtime < '2022-06-16'",
+        {"pickup_dtime": ("2022-06-15", "2022-06-15 23:59:59")},
+    ),
+    "1 month window": (
+        "pickup_dtime >= '2022-06-01' AND pickup_dtime < '2022-07-01'",
+        {"pickup_dtime": ("2022-06-01", "2022-06-30 23:59:59")},
+    ),
+    "1 zone": (
+        "pickup_lid = 132",
+        {"pickup_lid": (132, 132)},
+    ),
+    "1 zone, 1 day window": (
+        "pickup_lid = 132 AND pickup_dtime >= '2022-06-15' AND pickup_dtime < '2022-06-16'",
+        {"pickup_lid": (132, 132), "pickup_dtime": ("2022-06-15", "2022-06-15 23:59:59")},
+    ),
+}
+
+LOAD_ORDERS = {
+    "arrival": "ORDER BY hash(i)",
+    "clustered": "ORDER BY pickup_dtime, pickup_lid",
+}
+
+
+def create_trips(conn: duckdb.DuckDBPyConnection, rows: int, order_by: str):
+    conn.sql(
+        f"""--sql
+        CREATE OR REPLACE TABLE trips AS
+            SELECT
+                TIMESTAMP '2022-01-01' + INTERVAL (hash(i) % (365 * 24 * 3600)) SECOND AS pickup_dtime,
+                (hash(i * 7) % 265 + 1)::SMALLINT AS pickup_lid,
+                (hash(i * 13) % 10000) / 100 AS total_amount,
+                i
+            FROM range({rows}) r(i)
+            {order_by}
+        """
+    )
+
+
+def count_rows_to_scan(conn: duckdb.DuckDBPyConnection, ranges: dict) -> int:
+    """
+    Rows of the row groups whose zone maps overlap every filtered column
+    """
+    overlapping = []
+    for column, (low, high) in ranges.items():
+        column_type = "TIMESTAMP" if column == "pickup_dtime" else "SMALLINT"
+        overlapping.append(
+            f"""--sql
+            SELECT row_group_id
+            FROM pragma_storage_info('trips')
+            WHERE column_name = '{column}' AND segment_type = '{column_type}'
+            GROUP BY row_group_id
+            HAVING
+                min(regexp_extract(stats, 'Min: ([^,]+),', 1)::{column_type}) <= '{high}'::{column_type}
+                AND max(regexp_extract(stats, 'Max: ([^\\]]+)\\]', 1)::{column_type}) >= '{low}'::{column_type}
+            """
+        )
+
+    return conn.sql(
+        f"""--sql
+        SELECT coalesce(sum(count), 0)
+        FROM (
+            SELECT row_group_id, sum(count) AS count
+            FROM pragma_storage_info('trips')
+            WHERE column_name = 'i' AND segment_type = 'BIGINT'
+            GROUP BY row_group_id
+        )
+        WHERE row_group_id IN ({" INTERSECT ".join(overlapping)})
+        """
+    ).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'query':<22} {'load order':<10} {'latency':>9} {'rows to scan':>14}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        connections = {}
+        for load_order, order_by in LOAD_ORDERS.items():
+            conn = duckdb.connect(str(Path(temp_dir) / f"{load_order}.duckdb"))
+            create_trips(conn, args.rows, order_by)
+            # the zone maps are only read back from a checkpointed table
+            conn.sql("CHECKPOINT")
+            connections[load_order] = conn
+
+        for name, (where, ranges) in QUERIES.items():
+            for load_order, conn in connections.items():
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    conn.sql(
+                        f"SELECT count(*), sum(total_amount) FROM trips WHERE {where}"
+                    ).fetchall()
+                    timings.append(time.perf_counter() - start)
+
+                rows_to_scan = count_rows_to_scan(conn, ranges)
+                print(
+                    f"{name:<22} {load_order:<10} {statistics.median(timings) * 1000:7.1f}ms"
+                    + f" {rows_to_scan:>14,}"
+                )
+
+        for conn in connections.values():
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Storage and scan benchmark of the compact trips schema (`TRIPS_SCHEMA=compact`).
+
+Creates the same synthetic trips with the standard types (DOUBLE money, microsecond timestamps) and
+the compact types (DECIMAL(9, 2) money, second timestamps), then reports the size of the DuckDB
+table and of the parquet file, and the median latency of a wide scan over the money columns and of a scan over the timestamps.
+
+Run from `src/de_portfolio_nyc_tlc`:
+
+    python benchmarks/compact_schema_benchmark.py --rows 10000000 --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+
+# same as helpers.trip_schema_helpers, which is not imported here to not load the whole code location
+MONEY_COLUMNS = [
+    "fare_amount",
+    "extra",
+    "mta_tax",
+    "tip_amount",
+    "tolls_amount",
+    "improvement_surcharge",
+    "total_amount",
+    "congestion_surcharge",
+    "airport_fee",
+]
+SCHEMA_TYPES = {
+    "standard": {"money": "DOUBLE", "timestamp": "TIMESTAMP"},
+    "compact": {"money": "DECIMAL(9, 2)", "timestamp": "TIMESTAMP_S"},
+}
+
+SCANS = {
+    # a wide scan over every money column
+    "money scan": f"""--sql
+        SELECT {", ".join(f"SUM({column})" for column in MONEY_COLUMNS)} FROM trips
+    """,
+    # the date functions over both timestamps
+    "time scan": """--sql
+        SELECT
+            DATE_TRUNC('month', pickup_dtime) AS pickup_month,
+            AVG(DATEDIFF('second', pickup_dtime, dropoff_dtime))
+        FROM trips
+        GROUP BY ALL
+    """,
+}
+
+
+# the money values, in cents, with distributions similar to the TLC data: the surcharges and taxes take
+#   a few fixed values, and the fares, tips and totals vary
+MONEY_CENTS = {
+    "fare_amount": "250 + hash(i * 3) % 6000",
+    "extra": "[0, 50, 100, 250][(hash(i * 5) % 4)::BIGINT + 1]",
+    "mta_tax": "50",
+    "tip_amount": "CASE WHEN hash(i * 7) % 3 = 0 THEN 0 ELSE hash(i * 11) % 1500 END",
+    "tolls_amount": "CASE WHEN hash(i * 13) % 20 = 0 THEN 655 ELSE 0 END",
+    "improvement_surcharge": "30",
+    "total_amount": "580 + hash(i * 3) % 6000 + hash(i * 11) % 1500",
+    "congestion_surcharge": "[0, 250][(hash(i * 17) % 2)::BIGINT + 1]",
+    "airport_fee": "CASE WHEN hash(i * 19) % 10 = 0 THEN 125 ELSE 0 END",
+}
+
+
+def create_trips(conn: duckdb.DuckDBPyConnection, rows: int, types: dict[str, str]):
+    money = ",\n".join(
+        f"(({MONEY_CENTS[column]}) / 100)::{types['money']} AS {column}"
+        for column in MONEY_COLUMNS
+    )
+    # the timestamps are whole seconds, like the TLC data
+    conn.sql(
+        f"""--sql
+        CREATE OR REPLACE TABLE trips AS
+            SELECT
+                (TIMESTAMP '2022-01-01' + INTERVAL (i * 2) SECOND)::{types['timestamp']} AS pickup_dtime,
+                (TIMESTAMP '2022-01-01' + INTERVAL (i * 2 + hash(i) % 3600) SECOND)::{types['timestamp']} AS dropoff_dtime,
+                {money}
+            FROM range({rows}) r(i)
+        """
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'schema':<9} {'duckdb (MB)':>12} {'parquet (MB)':>13}"
+        + "".join(f" {scan:>11}" for scan in SCANS)
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for schema, types in SCHEMA_TYPES.items():
+            database = Path(temp_dir) / f"{schema}.duckdb"
+            parquet_file = Path(temp_dir) / f"{schema}.parquet"
+
+            with duckdb.connect(str(database)) as conn:
+                create_trips(conn, args.rows, types)
+                conn.sql("CHECKPOINT")
+                conn.sql(f"COPY trips TO '{parquet_file}' (FORMAT PARQUET)")
+
+                latencies = {}
+                for scan, query in SCANS.items():
+                    timings = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        conn.sql(query).fetchall()
+                        timings.append(time.perf_counter() - start)
+                    latencies[scan] = statistics.median(timings)
+
+            print(
+                f"{schema:<9} {os.path.getsize(database) / 1_000_000:>12.1f}"
+                + f" {os.path.getsize(parquet_file) / 1_000_000:>13.1f}"
+                + "".join(
+                    f" {latency * 1000:>9.1f}ms" for latency in latencies.values()
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
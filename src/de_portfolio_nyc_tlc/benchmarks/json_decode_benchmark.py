@@ -0,0 +1,99 @@
+"""
+Decoding benchmark of the JSON pages of the Socrata API.
+
+Compares decoding the pages of a month (JSON to a pandas DataFrame to csv) on a single core, as the
+stream download of `YT_monthly_csv_2022` does on its asyncio loop, against decoding one page per
+process, as the steps of the paged graph asset (`CSV_FETCH_MODE=paged`) do with the
+`multiprocess_executor`. The pages are generated locally, so only the CPU-bound part is measured.
+
+Run from `src/de_portfolio_nyc_tlc`:
+
+    python benchmarks/json_decode_benchmark.py --rows-per-page 100000 --pages 28 --processes 4 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+
+def create_page(rows: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    records = [
+        {
+            ":id": f"row-{seed}-{i}",
+            "vendorid": str(rng.randint(1, 2)),
+            "tpep_pickup_datetime": f"2022-02-{seed % 28 + 1:02d}T{i % 24:02d}:{i % 60:02d}:00.000",
+            "tpep_dropoff_datetime": f"2022-02-{seed % 28 + 1:02d}T{i % 24:02d}:{i % 60:02d}:30.000",
+            "passenger_count": str(rng.randint(1, 4)),
+            "trip_distance": f"{rng.uniform(0.5, 20):.2f}",
+            "pulocationid": str(rng.randint(1, 265)),
+            "dolocationid": str(rng.randint(1, 265)),
+            "payment_type": str(rng.randint(1, 4)),
+            "fare_amount": f"{rng.uniform(3, 80):.2f}",
+            "total_amount": f"{rng.uniform(5, 100):.2f}",
+        }
+        for i in range(rows)
+    ]
+    return json.dumps(records).encode()
+
+
+def decode_page(page_file: str) -> int:
+    with open(page_file, "rb") as f:
+        df = pd.DataFrame.from_records(json.loads(f.read()))
+    df.to_csv(f"{page_file}.csv", index=False)
+    return len(df)
+
+
+def decode_serially(page_files: list[str], processes: int) -> int:
+    return sum(decode_page(page_file) for page_file in page_files)
+
+
+def decode_in_processes(page_files: list[str], processes: int) -> int:
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return sum(executor.map(decode_page, page_files))
+
+
+DECODERS = {
+    "single core (stream)": decode_serially,
+    "one page per process (paged)": decode_in_processes,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows-per-page", type=int, default=100_000)
+    parser.add_argument("--pages", type=int, default=28)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    total_rows = args.rows_per_page * args.pages
+    with tempfile.TemporaryDirectory() as temp_dir:
+        page_files = []
+        for page in range(args.pages):
+            page_file = Path(temp_dir) / f"page_{page}.json"
+            page_file.write_bytes(create_page(args.rows_per_page, page))
+            page_files.append(str(page_file))
+        print(f"Decoding {total_rows:,} rows ({args.pages} pages, {args.processes} processes)")
+
+        for name, decode in DECODERS.items():
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                assert decode(page_files, args.processes) == total_rows
+                timings.append(time.perf_counter() - start)
+
+            median = statistics.median(timings)
+            print(f"{name:<32} {median:7.3f}s  {total_rows / median:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
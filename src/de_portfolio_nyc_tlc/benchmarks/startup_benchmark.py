@@ -0,0 +1,85 @@
+"""
+Startup benchmark of the Dagster code location.
+
+Every step of the multiprocess_executor, and every reload of the webserver, starts a new python
+process that imports `de_portfolio_nyc_tlc`. This measures the median wall time of that import in
+fresh processes, compared to a bare interpreter and to `import dagster`, and lists the heavy
+libraries that got imported along the way.
+
+Run from `src/de_portfolio_nyc_tlc`:
+
+    python benchmarks/startup_benchmark.py --repeat 10 --max-import-seconds 3
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# the libraries that should only be imported inside the asset bodies
+HEAVY_MODULES = ["pandas", "numpy", "httpx", "pyarrow"]
+
+STATEMENTS = {
+    "python (baseline)": "pass",
+    "import dagster": "import dagster",
+    "import de_portfolio_nyc_tlc": "import de_portfolio_nyc_tlc",
+}
+
+
+def time_process(statement: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True)
+    return time.perf_counter() - start
+
+
+def get_loaded_heavy_modules() -> list[str]:
+    statement = (
+        "import sys, json, de_portfolio_nyc_tlc; "
+        + f"print(json.dumps([m for m in {HEAVY_MODULES} if m in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", statement], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-import-seconds",
+        type=float,
+        default=None,
+        help="Exit with an error when the median import time of the definitions is slower",
+    )
+    args = parser.parse_args()
+
+    medians = {}
+    for name, statement in STATEMENTS.items():
+        # warm up the file system cache and the bytecode
+        time_process(statement)
+        medians[name] = statistics.median(
+            time_process(statement) for _ in range(args.repeat)
+        )
+        print(f"{name:<32}{medians[name]:>8.3f}s")
+
+    definitions_time = medians["import de_portfolio_nyc_tlc"]
+    print(
+        f"{'definitions overhead':<32}{definitions_time - medians['import dagster']:>8.3f}s"
+    )
+    print(f"{'per-step process spawn':<32}{definitions_time:>8.3f}s")
+
+    heavy_modules = get_loaded_heavy_modules()
+    print(f"heavy modules imported on load: {heavy_modules or 'none'}")
+
+    if heavy_modules:
+        return 1
+    if args.max_import_seconds is not None and definitions_time > args.max_import_seconds:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Insert benchmark of the trip_id generation of `yellow_taxi_trips`.
+
+Compares loading the monthly trips into DuckDB with a `DEFAULT NEXTVAL('pk_seq')` trip_id, drawn
+from a global sequence while inserting, against loading the deterministic trip_id that the parquet
+stage computes (see `helpers.parquet_asset_helpers.add_trip_ids`). The precomputed IDs are also
+loaded one month per thread, which the sequence can not do without making the IDs depend on the
+load order.
+
+Run from `src/de_portfolio_nyc_tlc`:
+
+    python benchmarks/trip_id_benchmark.py --rows-per-month 1000000 --months 12 --repeat 3
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+
+# same as helpers.parquet_asset_helpers.TRIP_ID_MONTH_MULTIPLIER, which is not imported here
+#   to not load the whole code location
+TRIP_ID_MONTH_MULTIPLIER = 10_000_000_000
+
+COLUMNS = """--sql
+    vendor_id TINYINT,
+    pickup_dtime TIMESTAMP,
+    pickup_lid SMALLINT,
+    dropoff_lid SMALLINT,
+    total_amount DOUBLE
+"""
+
+
+def create_monthly_trips(rows_per_month: int, months: int) -> list[pa.Table]:
+    rng = np.random.default_rng(0)
+    tables = []
+    for month in range(1, months + 1):
+        pickup_dtime = np.datetime64(f"2022-{month:02d}-01") + np.sort(
+            rng.integers(0, 28 * 24 * 3600, rows_per_month)
+        ).astype("timedelta64[s]")
+        month_prefix = int(f"2022{month:02d}") * TRIP_ID_MONTH_MULTIPLIER
+
+        tables.append(
+            pa.table(
+                {
+                    "trip_id": month_prefix + np.arange(1, rows_per_month + 1),
+                    "vendor_id": rng.integers(1, 3, rows_per_month).astype(np.int8),
+                    "pickup_dtime": pickup_dtime,
+                    "pickup_lid": rng.integers(1, 266, rows_per_month).astype(np.int16),
+                    "dropoff_lid": rng.integers(1, 266, rows_per_month).astype(np.int16),
+                    "total_amount": rng.uniform(3, 100, rows_per_month),
+                }
+            )
+        )
+    return tables
+
+
+def load_with_sequence(conn: duckdb.DuckDBPyConnection, tables: list[pa.Table]):
+    conn.sql(
+        f"""--sql
+        CREATE OR REPLACE SEQUENCE pk_seq START 1;
+        CREATE OR REPLACE TABLE trips (trip_id BIGINT DEFAULT NEXTVAL('pk_seq'), {COLUMNS});
+        """
+    )
+    # the months are loaded one after another, so the IDs follow the load order
+    #   (duckdb scans the `monthly_trips` arrow table through a replacement scan)
+    for monthly_trips in tables:
+        conn.sql(
+            """--sql
+            INSERT INTO trips (vendor_id, pickup_dtime, pickup_lid, dropoff_lid, total_amount)
+                SELECT * EXCLUDE (trip_id) FROM monthly_trips
+            """
+        )
+
+
+def load_precomputed(conn: duckdb.DuckDBPyConnection, tables: list[pa.Table]):
+    conn.sql(f"CREATE OR REPLACE TABLE trips (trip_id BIGINT, {COLUMNS})")
+    for monthly_trips in tables:
+        conn.sql("INSERT INTO trips SELECT * FROM monthly_trips")
+
+
+def load_precomputed_concurrently(
+    conn: duckdb.DuckDBPyConnection, tables: list[pa.Table]
+):
+    conn.sql(f"CREATE OR REPLACE TABLE trips (trip_id BIGINT, {COLUMNS})")
+
+    def load_month(monthly_trips: pa.Table):
+        # each thread needs its own cursor, DuckDB appends to the table concurrently
+        cursor = conn.cursor()
+        cursor.register("monthly_trips", monthly_trips)
+        cursor.sql("INSERT INTO trips SELECT * FROM monthly_trips")
+        cursor.close()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(load_month, tables))
+
+
+LOADERS = {
+    "sequence (NEXTVAL)": load_with_sequence,
+    "precomputed trip_id": load_precomputed,
+    "precomputed trip_id, 4 months at a time": load_precomputed_concurrently,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows-per-month", type=int, default=1_000_000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tables = create_monthly_trips(args.rows_per_month, args.months)
+    total_rows = args.rows_per_month * args.months
+    print(f"Loading {total_rows:,} rows ({args.months} months)")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, load in LOADERS.items():
+            timings = []
+            for i in range(args.repeat):
+                database = Path(temp_dir) / f"{load.__name__}_{i}.duckdb"
+                with duckdb.connect(str(database)) as conn:
+                    start = time.perf_counter()
+                    load(conn, tables)
+                    timings.append(time.perf_counter() - start)
+
+                    # every loader must produce unique IDs
+                    ids, unique_ids = conn.sql(
+                        "SELECT count(trip_id), count(DISTINCT trip_id) FROM trips"
+                    ).fetchone()
+                    assert ids == unique_ids == total_rows
+
+            median = statistics.median(timings)
+            print(f"{name:<42} {median:7.3f}s  {total_rows / median:>14,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,97 @@
+import os
+
 from dagster import Definitions, load_assets_from_modules, multiprocess_executor
-from dagster_duckdb import DuckDBResource
 
 from .assets.yellow_taxi_data import (
     csv_assets,
+    csv_paged_assets,
     parquet_assets,
     table_assets,
+    table_staged_assets,
     dim_table_assets,
+    dim_table_single_scan_assets,
+    rollup_assets,
+    sample_assets,
+    cdc_assets,
+    sketch_assets,
+    maintenance_assets,
 )
 
+from .assets.yellow_taxi_data.jobs.jobs import reconcile_YT_row_counts_2022_job
+from .concurrency import executor_tag_concurrency_limits
 from .jobs import (
+    compact_taxi_trip_records_job,
     convert_to_parquet_YT_2022_job,
     fetch_YT_csv_2022_job,
+    refresh_YT_changes_2022_job,
+)
+from .schedules import (
+    daily_YT_changes_2022_schedule,
+    weekly_taxi_trip_records_compaction_schedule,
+)
+from .resources import RetryingDuckDBResource
+from .io_managers import ArrowIOManager
+
+# build the dim tables with one asset per dim ("per_table"), or with a multi-asset
+#   that builds every dim from a single scan of yellow_taxi_trips ("single_scan")
+DIM_BUILD_MODE = os.getenv("DIM_BUILD_MODE", "per_table")
+dim_assets = (
+    dim_table_single_scan_assets
+    if DIM_BUILD_MODE == "single_scan"
+    else dim_table_assets
 )
 
+# download the csv of a month with a single stream on one asyncio loop ("stream"), or with a graph asset that
+#   fetches and decodes every day of the month in its own step, across processes ("paged")
+CSV_FETCH_MODE = os.getenv("CSV_FETCH_MODE", "stream")
+csv_fetch_assets = csv_paged_assets if CSV_FETCH_MODE == "paged" else csv_assets
+
+# load yellow_taxi_trips from all the months at once ("single"), or stage every month in its own DuckDB file
+#   with one step per partition, then publish the staged months in a single transaction ("staged")
+TRIPS_LOAD_MODE = os.getenv("TRIPS_LOAD_MODE", "single")
+trips_load_assets = table_staged_assets if TRIPS_LOAD_MODE == "staged" else table_assets
+
 yellow_taxi_assets = load_assets_from_modules(
-    [csv_assets, parquet_assets, table_assets, dim_table_assets],
+    [
+        csv_fetch_assets,
+        parquet_assets,
+        trips_load_assets,
+        dim_assets,
+        rollup_assets,
+        sample_assets,
+        cdc_assets,
+        sketch_assets,
+        maintenance_assets,
+    ],
     group_name="YELLOW_TAXI_YT",
 )
 all_jobs = [
     convert_to_parquet_YT_2022_job,
     fetch_YT_csv_2022_job,
+    refresh_YT_changes_2022_job,
+    reconcile_YT_row_counts_2022_job,
+    compact_taxi_trip_records_job,
 ]
 
 
 defs = Definitions(
     assets=[*yellow_taxi_assets],
     resources={
-        "duckdb": DuckDBResource(
-            database="de_portfolio_nyc_tlc/assets/yellow_taxi_data/models/taxi_trip_records.duckdb"
-        )
+        "duckdb": RetryingDuckDBResource(
+            database="de_portfolio_nyc_tlc/assets/yellow_taxi_data/models/taxi_trip_records.duckdb",
+            # the dim builds spill here once they reach the memory limit of their profile
+            temp_directory="de_portfolio_nyc_tlc/assets/yellow_taxi_data/models/duckdb_tmp",
+        ),
+        "arrow_io_manager": ArrowIOManager(
+            base_dir="de_portfolio_nyc_tlc/assets/yellow_taxi_data/data/arrow"
+        ),
     },
     jobs=all_jobs,
-    executor=multiprocess_executor,
+    schedules=[
+        daily_YT_changes_2022_schedule,
+        weekly_taxi_trip_records_compaction_schedule,
+    ],
+    executor=multiprocess_executor.configured(
+        {"tag_concurrency_limits": executor_tag_concurrency_limits}
+    ),
 )
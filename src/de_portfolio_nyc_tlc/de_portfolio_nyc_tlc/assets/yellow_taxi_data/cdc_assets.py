@@ -0,0 +1,162 @@
+import os
+from pathlib import Path
+
+from dagster import (
+    AssetExecutionContext,
+    AssetMaterialization,
+    Failure,
+    MaterializeResult,
+    MetadataValue,
+    ResourceParam,
+    asset,
+)
+
+from ...partitions import monthly_partition
+from ...concurrency import DUCKDB_WRITER_OP_TAGS
+from ...resources import RetryingDuckDBResource
+from ...io_managers import ArrowIOManager
+
+from .parquet_assets import YT_monthly_parquet_2022
+
+from .helpers import csv_asset_helpers as csv_helper
+from .helpers import parquet_asset_helpers as parquet_helper
+from .helpers import cdc_helpers as cdc_helper
+from .helpers import plausibility_helpers as plausibility_helper
+from .helpers import staging_helpers as staging_helper
+from .helpers import table_helpers as table_helper
+from .constants import asset_names, table_names
+
+# the tag of a materialization that Dagster reads its data version from
+DATA_VERSION_TAG = "dagster/data_version"
+
+
+@asset(
+    deps=[YT_monthly_parquet_2022, asset_names.TABLE_YT_TRIP_RECORDS_2022],
+    partitions_def=monthly_partition,
+    description="""
+    The trips of the month that were corrected or added since the last download, i.e., the rows with an
+    `:updated_at` after the watermark of the month. The changes are merged by their Socrata `:id` into the
+    parquet file of the month and `yellow_taxi_trips`, then the watermark is moved forward. The implausible
+    changes are quarantined with the implausible trips of the month
+    """,
+    op_tags=DUCKDB_WRITER_OP_TAGS,
+)
+async def YT_monthly_changes_2022(
+    context: AssetExecutionContext,
+    duckdb: RetryingDuckDBResource,
+    # the IO manager of YT_monthly_parquet_2022, to replace the arrow file of the month
+    arrow_io_manager: ResourceParam[ArrowIOManager],
+) -> MaterializeResult:
+    import httpx
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    partition_key = context.partition_key
+    month_num = partition_key.split("-")[1]
+
+    DATA_FOLDER = os.path.join(os.path.dirname(__file__), "data")
+    csv_data_dir = Path(DATA_FOLDER) / "csv"
+    CHANGES_FILE = os.path.join(csv_data_dir, "changes", f"2022-{month_num}.csv")
+    PARQUET_FILE = os.path.join(DATA_FOLDER, "parquet", f"2022-{month_num}.parquet")
+
+    watermark = csv_helper.read_watermark(csv_data_dir, partition_key)
+    if watermark is None:
+        raise Failure(
+            f"There is no :updated_at watermark for {partition_key}, materialize YT_monthly_csv_2022 first"
+        )
+
+    async with httpx.AsyncClient() as client:
+        result = await csv_helper.download_monthly_csv(
+            client, partition_key, csv_data_dir, context.log, updated_after=watermark
+        )
+
+    num_changed_trips = 0
+    num_quarantined_trips = None
+    is_staged = False
+    if result["rows"] > 0:
+        changed_ids = pd.read_csv(
+            CHANGES_FILE, usecols=[parquet_helper.SOCRATA_ID_COLUMN]
+        )[parquet_helper.SOCRATA_ID_COLUMN].tolist()
+        changes, _ = parquet_helper.clean_monthly_csv(CHANGES_FILE)
+
+        # the quarantined trips of the month hold trip_ids too, and the changes can correct or add to them
+        QUARANTINE_FILE = plausibility_helper.get_quarantine_path(partition_key)
+        quarantined = (
+            pd.read_parquet(QUARANTINE_FILE) if os.path.exists(QUARANTINE_FILE) else None
+        )
+        merged, changed_trips, quarantined = cdc_helper.merge_monthly_changes(
+            pq.read_table(PARQUET_FILE), changes, changed_ids, partition_key, quarantined
+        )
+        num_changed_trips = changed_trips.num_rows
+        num_quarantined_trips = len(quarantined)
+
+        os.makedirs(os.path.dirname(QUARANTINE_FILE), exist_ok=True)
+        quarantined.to_parquet(f"{QUARANTINE_FILE}.tmp", index=False)
+        os.replace(f"{QUARANTINE_FILE}.tmp", QUARANTINE_FILE)
+
+        # replace the parquet file, and the arrow file that the downstream assets load the month from
+        pq.write_table(merged, f"{PARQUET_FILE}.tmp")
+        os.replace(f"{PARQUET_FILE}.tmp", PARQUET_FILE)
+        arrow_io_manager.write_table(
+            merged,
+            arrow_io_manager.get_path(YT_monthly_parquet_2022.key.path, partition_key),
+        )
+        # the month of YT_monthly_parquet_2022 changed, its new data version marks its downstream assets
+        #   (rollups, samples, sketches, staged month) as stale
+        context.log_event(
+            AssetMaterialization(
+                asset_key=YT_monthly_parquet_2022.key,
+                partition=partition_key,
+                description=f"Merged the changes since {watermark}",
+                metadata={
+                    "Number of records - parquet": MetadataValue.int(merged.num_rows),
+                    "Number of merged trips": MetadataValue.int(num_changed_trips),
+                },
+                tags={DATA_VERSION_TAG: f"{partition_key}@{result['watermark'] or watermark}"},
+            )
+        )
+
+        with duckdb.get_connection(profile="bulk_load") as conn:
+            conn.register(
+                cdc_helper.CHANGED_IDS,
+                pa.table({"socrata_id": pa.array(changed_ids, pa.string())}),
+            )
+            conn.register(cdc_helper.CHANGED_TRIPS, changed_trips)
+            conn.sql(cdc_helper.query_merge_changes())
+            table_helper.bump_table_version(
+                conn=conn, table_name=table_names.YELLOW_TAXI_TRIPS
+            )
+
+        # in the staged load mode (see table_staged_assets), yellow_taxi_trips is replaced by the staged months
+        #   when they are published, so the staged month must keep the changes too
+        is_staged = staging_helper.merge_changes_into_staged_month(
+            partition_key, changed_ids, changed_trips
+        )
+
+    # The watermark only moves once the changes are merged. If the merge fails, the same changes are
+    #   downloaded again by the next run, and merging them twice gives the same result
+    if result["watermark"] is not None:
+        csv_helper.write_watermark(csv_data_dir, partition_key, result["watermark"])
+    context.log.info(
+        f"2022-{month_num}: merged {num_changed_trips:,} of {result['rows']:,} changed rows since {watermark}"
+    )
+
+    return MaterializeResult(
+        metadata={
+            "Number of changed records": MetadataValue.int(result["rows"]),
+            "Number of merged trips": MetadataValue.int(num_changed_trips),
+            **(
+                {"Number of quarantined trips": MetadataValue.int(num_quarantined_trips)}
+                if num_quarantined_trips is not None
+                else {}
+            ),
+            "Number of duplicate records": MetadataValue.int(result["duplicates"]),
+            "Merged into the staged month": MetadataValue.bool(is_staged),
+            "Previous watermark (:updated_at)": MetadataValue.text(watermark),
+            "Watermark (:updated_at)": MetadataValue.text(
+                result["watermark"] or watermark
+            ),
+            "Downloaded data (MB)": MetadataValue.float(round(result["MB"], 4)),
+        }
+    )
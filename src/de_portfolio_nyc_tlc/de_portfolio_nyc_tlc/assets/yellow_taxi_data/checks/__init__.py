@@ -3,7 +3,6 @@ from dataclasses import dataclass
 from typing import Callable
 
 from dagster import AssetCheckSpec
-from pandas import DataFrame
 
 
 @dataclass
@@ -1,20 +1,26 @@
+from typing import TYPE_CHECKING
+
 from dagster import AssetCheckSpec
-from pandas import DataFrame
 from . import CheckSpec
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
 asset = "YT_monthly_parquet_2022"
 
 
 # asset check conditions
-def trip_distances_are_positive(df: DataFrame):
+def trip_distances_are_positive(df: "DataFrame"):
     return bool((df["passenger_count"] > 0).all())
 
 
-def only_paid_trips(df: DataFrame):
+def only_paid_trips(df: "DataFrame"):
     return bool((df["total_amount"] > 0).all())
 
 
-def dataframe_is_not_empty_and_invalid(df: DataFrame):
+def dataframe_is_not_empty_and_invalid(df: "DataFrame"):
+    from pandas import DataFrame
+
     return not df.empty and df is not None and isinstance(df, DataFrame)
 
 
@@ -1,9 +1,8 @@
 from duckdb import DuckDBPyConnection
-from pandas import DataFrame
 from . import AssetCheckSpec, CheckSpec
-from ..constants import table_names
+from ..constants import asset_names, table_names
 
-asset = "table_YT_trip_records_2022"
+asset = asset_names.TABLE_YT_TRIP_RECORDS_2022
 
 
 # asset check conditions
@@ -0,0 +1,3 @@
+# The assets that have several definitions, one per mode (see the *_MODE variables of the definitions). The
+#   downstream assets depend on them by name, so they do not import a definition of a mode that is not loaded
+TABLE_YT_TRIP_RECORDS_2022 = "table_YT_trip_records_2022"
@@ -4,3 +4,8 @@ DIM_TRANSACTION_FEES = "dim_transaction_fees"
 DIM_TRIP_LOCATION = "dim_trip_location"
 DIM_TRIP_MISC_DETAILS = "dim_trip_misc_details"
 TAXI_ZONE_LOOKUP = "taxi_zone_lookup"
+ROLLUP_HOURLY_PICKUP_ZONE = "rollup_hourly_pickup_zone"
+ROLLUP_HOURLY_PICKUP_BOROUGH = "rollup_hourly_pickup_borough"
+ROLLUP_DAILY_BOROUGH_PAYMENT = "rollup_daily_borough_payment"
+YELLOW_TAXI_TRIPS_SAMPLE_1_PCT = "yellow_taxi_trips_sample_1pct"
+YELLOW_TAXI_TRIPS_SAMPLE_0_1_PCT = "yellow_taxi_trips_sample_0_1pct"
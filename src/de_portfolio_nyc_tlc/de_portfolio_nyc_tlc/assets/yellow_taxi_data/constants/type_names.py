@@ -0,0 +1,4 @@
+# the ENUM types of the dictionary-encoded text columns of taxi_zone_lookup
+BOROUGH_ENUM = "borough_enum"
+ZONE_ENUM = "zone_enum"
+SERVICE_ZONE_ENUM = "service_zone_enum"
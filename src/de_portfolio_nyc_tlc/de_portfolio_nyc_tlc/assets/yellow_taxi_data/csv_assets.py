@@ -1,127 +1,113 @@
+import asyncio
 from pathlib import Path
+import time
 from dagster import (
     AssetExecutionContext,
+    BackfillPolicy,
+    DataVersion,
     asset,
     MaterializeResult,
     MetadataValue,
 )
 import os
-import httpx
 
 from .helpers import csv_asset_helpers as helper
 
-from ...utils.log_utils import log_w_header
-
 from ...partitions import monthly_partition
-from .. import constants
+from ...concurrency import partitioning_op_tags
+from ...utils.memory_utils import record_peak_memory
+from ...utils import http_cache_utils as http_cache
+
+# the raw monthly csv files, and their watermarks
+CSV_DATA_DIR = Path(f"{os.path.dirname(__file__)}/data/csv")
+# the number of months downloaded at the same time when a run materializes several partitions
+MAX_CONCURRENT_DOWNLOADS = 4
 
 
 @asset(
     partitions_def=monthly_partition,
     description="""The raw csv files for the year 2022. The files are downloaded via stream and partitioned by month to take
     advantage of the resource's API and to prevent connection timeouts""",
+    # a backfill runs every selected month in a single run, see the asset body
+    backfill_policy=BackfillPolicy.single_run(),
+    op_tags=partitioning_op_tags("medium"),
 )
 async def YT_monthly_csv_2022(
     context: AssetExecutionContext,
 ) -> MaterializeResult:
+    import httpx
 
-    start_date, end_date = helper.get_monthly_range(context.partition_key)
-    print(f"{start_date} {end_date}")
-    CSV_FILE_NAME = helper.create_file_save_path(
-        start_date, Path(f"{os.path.dirname(__file__)}/data/csv")
-    )
-
-    # API request details
-    # See this doc for $where and other API queries: https://dev.socrata.com/docs/queries/
-    app_token = os.getenv("NYC_OPEN_DATA_APP_TOKEN")
-    # request the file as JSON, but can also be requested as csv
-    file_type = "json"
-    where_query = f"tpep_pickup_datetime >= '{start_date}' AND tpep_pickup_datetime < '{end_date}'"
-    response_limit = 500_000
-    offset = 0
-    timeout = httpx.Timeout(90)
-    # construct the API request url
-    url = (
-        f"{constants.YELLOW_TAXI_TRIPS_2022_URL}.{file_type}?"
-        + f"$$app_token={app_token}"
-        + f"&$where={where_query}"
-        + f"&$limit={response_limit}"
-    )
-    # make the `offset` query params formattable since it will change value in the request loop
-    url = url + "&$offset={offset}"
-
+    # A run can materialize a range of partitions. The months share the HTTP client (and its connection pool),
+    #   and are downloaded concurrently, up to MAX_CONCURRENT_DOWNLOADS at a time
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    start_time = time.monotonic()
     async with httpx.AsyncClient() as client:
-        try:
-            # for logging and the returned metadata
-            total_records_saved = 0
-            partition_name = CSV_FILE_NAME.split("/")[-1]
 
-            # start the request loop
-            should_continue_request_loop = True
-            while should_continue_request_loop:
-                log_w_header(
-                    f"{partition_name}: requesting with {response_limit=} and {offset=}",
-                    "/",
+        async def download(partition_key: str) -> dict[str, float | str | None]:
+            async with semaphore:
+                result = await helper.download_monthly_csv(
+                    client, partition_key, CSV_DATA_DIR, context.log
                 )
-                # read the response as stream and set the value for the offset query params
-                async with client.stream(
-                    "GET",
-                    url.format(offset=offset),
-                    timeout=timeout,
-                ) as response:
-                    # handle response
-                    accumulator_limit = 100_000
-                    result = await helper.handle_stream_data_response(
-                        response=response,
-                        response_limit=response_limit,
-                        accumulator_limit=accumulator_limit,
-                        file_name=CSV_FILE_NAME,
-                        total_records_saved=total_records_saved,
-                    )
-                    should_continue_request_loop = result[0]
-                    total_records_saved = result[1]
-                    log_w_header(
-                        f"{partition_name}: End of response stream. Saved {total_records_saved} rows for this request ({should_continue_request_loop=})",
-                        "x",
-                    )
+            # the changes of the month after this download are fetched by YT_monthly_changes_2022
+            if result["watermark"] is not None:
+                helper.write_watermark(CSV_DATA_DIR, partition_key, result["watermark"])
+            return result
 
-                    # continue requesting for data if you are still reaching the line limit
-                    if should_continue_request_loop:
-                        offset += response_limit
+        partition_keys = context.partition_keys
+        results = await asyncio.gather(*(download(key) for key in partition_keys))
+    elapsed = time.monotonic() - start_time
 
-        except httpx.HTTPError as exc:
-            print(f"HTTP Exception for {exc.request.url}")
-            print(f"Error message: {exc}")
-            print(f"Response: {response=}")
-            print(f"Server error: {response.is_server_error}")
-            print(f"Client error: {response.is_client_error}")
-            raise Exception("HTTP Error")
-        finally:
-            log_w_header(
-                f"{partition_name}: Total records fetched: {total_records_saved}"
-            )
+    total_records_saved = sum(result["rows"] for result in results)
     return MaterializeResult(
         metadata={
             "Data source documentation": MetadataValue.url(
                 "https://dev.socrata.com/foundry/data.cityofnewyork.us/qp3b-zxtp"
             ),
             "Number of fetched records": MetadataValue.int(total_records_saved),
+            "Number of fetched records per partition": MetadataValue.json(
+                {key: result["rows"] for key, result in zip(partition_keys, results)}
+            ),
+            "Number of duplicate records per partition": MetadataValue.json(
+                {key: result["duplicates"] for key, result in zip(partition_keys, results)}
+            ),
+            "Downloaded data (MB)": MetadataValue.float(
+                round(sum(result["MB"] for result in results), 2)
+            ),
+            "Throughput (rows/s)": MetadataValue.float(
+                round(total_records_saved / elapsed, 2)
+            ),
+            **record_peak_memory(context, "medium"),
         }
     )
 
 
-@asset
-async def taxi_zone_lookup_csv():
+@asset(
+    description="""The taxi zone lookup csv file. The file is only downloaded again when the server reports that it
+    changed since the cached copy (ETag / Last-Modified), and its checksum is the data version of the asset""",
+)
+async def taxi_zone_lookup_csv(context: AssetExecutionContext) -> MaterializeResult:
+    import httpx
+
     url = "https://d37ci6vzurychx.cloudfront.net/misc/taxi_zone_lookup.csv"
     file_save_path = os.path.join(
         os.path.dirname(__file__), "data/csv", "taxi_zone_lookup.csv"
     )
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url)
+    # HTTP errors are raised, so taxi_zone_lookup_table is never built from a missing or partial file
+    async with httpx.AsyncClient(timeout=httpx.Timeout(60)) as client:
+        cache_info = await http_cache.fetch_cached(
+            client, url, file_save_path, context.log
+        )
 
-            with open(file_save_path, "wb") as f:
-                f.write(response.content)
-        except Exception as e:
-            print(e)
+    return MaterializeResult(
+        # the downstream assets are only stale when the content of the file changed
+        data_version=DataVersion(cache_info["sha256"]),
+        metadata={
+            "Data source": MetadataValue.url(url),
+            "Checksum (sha256)": MetadataValue.text(cache_info["sha256"]),
+            "Size (bytes)": MetadataValue.int(cache_info["bytes"]),
+            "ETag": MetadataValue.text(cache_info["etag"] or ""),
+            "Last modified": MetadataValue.text(cache_info["last_modified"] or ""),
+            "Changed": MetadataValue.bool(cache_info["changed"]),
+        },
+    )
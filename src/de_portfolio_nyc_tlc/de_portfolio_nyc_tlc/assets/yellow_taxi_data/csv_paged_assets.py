@@ -0,0 +1,26 @@
+from dagster import graph_asset
+
+from ...partitions import monthly_partition
+
+from .ops.csv_assets_ops import (
+    assemble_monthly_csv,
+    fetch_day_slice,
+    split_month_into_day_slices,
+)
+
+# the zone lookup is downloaded the same way in both fetch modes
+from .csv_assets import taxi_zone_lookup_csv  # noqa: F401
+
+
+@graph_asset(
+    name="YT_monthly_csv_2022",
+    partitions_def=monthly_partition,
+    description="""The raw csv files for the year 2022, partitioned by month. Every day of the month is fetched
+    and decoded from JSON by its own step, which the multiprocess executor runs in parallel processes,
+    then the days are assembled into the csv file of the month""",
+)
+def YT_monthly_csv_paged_2022():
+    day_slices, watermark = split_month_into_day_slices()
+    fetched_day_slices = day_slices.map(fetch_day_slice)
+
+    return assemble_monthly_csv(fetched_day_slices.collect(), watermark)
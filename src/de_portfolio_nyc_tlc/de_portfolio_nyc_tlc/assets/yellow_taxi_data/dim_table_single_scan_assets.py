@@ -0,0 +1,55 @@
+from dagster import AssetExecutionContext, AssetOut, MaterializeResult, multi_asset
+
+from .table_assets import taxi_zone_lookup_table
+from .constants import asset_names
+
+from .helpers import table_helpers as helper
+from .helpers import dim_table_helpers as dim_helper
+
+from ...concurrency import DUCKDB_WRITER_OP_TAGS
+from ...resources import RetryingDuckDBResource
+
+
+@multi_asset(
+    outs={
+        dim_name: AssetOut(
+            description=description,
+            is_required=False,
+        )
+        for dim_name, description in dim_helper.DIM_DESCRIPTIONS.items()
+    },
+    deps=[asset_names.TABLE_YT_TRIP_RECORDS_2022, taxi_zone_lookup_table],
+    can_subset=True,
+    op_tags=DUCKDB_WRITER_OP_TAGS,
+)
+def dim_tables_single_scan(
+    context: AssetExecutionContext, duckdb: RetryingDuckDBResource
+):
+    """
+    Builds the selected dim tables with a single scan of yellow_taxi_trips. The distinct values
+    of every dim are computed in one query plan via GROUPING SETS, and each dim table is then
+    created from its (much smaller) grouping set
+    """
+    dim_names = [
+        dim_name
+        for dim_name in dim_helper.DIM_DESCRIPTIONS
+        if context.asset_key_for_output(dim_name) in context.selected_asset_keys
+    ]
+
+    with duckdb.get_connection(profile="dim_build") as conn:
+        # execute the shared scan
+        conn.sql(dim_helper.query_create_dim_grouping_sets(dim_names))
+
+        for dim_name in dim_names:
+            query_create_dim = dim_helper.QUERIES_CREATE_DIM[dim_name](
+                dim_helper.dim_grouping_set_source(dim_name)
+            )
+            # execute
+            conn.sql(query_create_dim)
+            helper.bump_table_version(conn=conn, table_name=dim_name)
+            # metadata
+            metadata = helper.get_table_metadata(conn=conn, table_name=dim_name)
+
+            yield MaterializeResult(asset_key=dim_name, metadata=metadata)
+
+        conn.sql(f"DROP TABLE {dim_helper.DIM_GROUPING_SETS_TABLE}")
@@ -0,0 +1,121 @@
+from typing import TYPE_CHECKING
+
+from ..constants import table_names
+from . import parquet_asset_helpers as parquet_helper
+from . import trip_schema_helpers as schema_helper
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from pandas import DataFrame
+
+# the relations that query_merge_changes reads from, registered on the connection
+CHANGED_IDS = "changed_ids"
+CHANGED_TRIPS = "changed_trips"
+
+
+def merge_monthly_changes(
+    existing: "pa.Table",
+    changes: "DataFrame",
+    changed_ids: list[str],
+    partition_key: str,
+    quarantined: "DataFrame | None" = None,
+) -> tuple["pa.Table", "pa.Table", "DataFrame"]:
+    """
+    Merge the cleaned `changes` of a month into its `existing` trips by `socrata_id`. Every row of
+    `changed_ids` is replaced: the updated trips keep their trip_id, the new trips get the next row
+    numbers of the month, and the changed rows that did not pass the cleaning are removed.
+
+    The changed trips are scored against the plausibility thresholds of the month, and the implausible ones
+    replace their rows in the `quarantined` trips of the month instead (see `plausibility_helpers`).
+    The trip_ids of the quarantined trips are never given to a new trip.
+
+    Returns the merged month, the changed trips with the schema of `existing`, and the quarantined trips
+    """
+    from numpy import arange, int64
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    from . import plausibility_helpers as plausibility_helper
+
+    if "socrata_id" not in existing.column_names:
+        raise ValueError(
+            f"The trips of {partition_key} have no socrata_id, re-download the month with YT_monthly_csv_2022"
+        )
+    if quarantined is None:
+        quarantined = pd.DataFrame(columns=["trip_id", "socrata_id"])
+
+    is_changed = pc.is_in(existing["socrata_id"], value_set=pa.array(changed_ids, pa.string()))
+    kept = existing.filter(pc.invert(is_changed))
+    is_quarantined_changed = quarantined["socrata_id"].isin(changed_ids)
+
+    # the updated trips keep their trip_id, whether they were live or quarantined
+    previous = existing.filter(is_changed).select(["socrata_id", "trip_id"]).to_pydict()
+    trip_ids = dict(zip(previous["socrata_id"], previous["trip_id"]))
+    trip_ids.update(
+        zip(
+            quarantined.loc[is_quarantined_changed, "socrata_id"],
+            quarantined.loc[is_quarantined_changed, "trip_id"],
+        )
+    )
+
+    changes = changes.sort_values(parquet_helper.TRIP_SORT_COLUMNS, kind="stable")
+    changes.insert(0, "trip_id", changes["socrata_id"].map(trip_ids))
+    is_new = changes["trip_id"].isna()
+
+    # the new trips are numbered after the last trip of the month, live or quarantined
+    year, month = partition_key.split("-")[:2]
+    month_prefix = int(f"{year}{month}") * parquet_helper.TRIP_ID_MONTH_MULTIPLIER
+    last_trip_id = max(
+        pc.max(existing["trip_id"]).as_py() or month_prefix,
+        int(quarantined["trip_id"].max()) if len(quarantined) else month_prefix,
+    )
+    changes.loc[is_new, "trip_id"] = arange(
+        last_trip_id + 1, last_trip_id + 1 + is_new.sum(), dtype=int64
+    )
+    changes["trip_id"] = changes["trip_id"].astype(int64)
+
+    # the few changed trips are not enough to compute thresholds from, they are scored against their month
+    feature_columns = ["pickup_dtime", "dropoff_dtime", "trip_distance", "fare_amount"]
+    _, thresholds = plausibility_helper.score_trip_plausibility(
+        kept.select([col for col in feature_columns if col in kept.column_names]).to_pandas()
+    )
+    changes, quarantined_changes, _ = plausibility_helper.quarantine_implausible_trips(
+        changes, thresholds
+    )
+    quarantined = pd.concat(
+        [
+            df
+            for df in [quarantined[~is_quarantined_changed], quarantined_changes]
+            if len(df)
+        ]
+        or [quarantined.iloc[:0]],
+        ignore_index=True,
+    ).sort_values("trip_id", ignore_index=True)
+
+    changed_trips = pa.Table.from_pandas(changes, preserve_index=True)
+    if schema_helper.TRIPS_SCHEMA == "compact":
+        changed_trips = schema_helper.compact_trips_table(changed_trips)
+    changed_trips = changed_trips.select(existing.schema.names).cast(existing.schema)
+
+    merged = pa.concat_tables([kept, changed_trips]).sort_by("trip_id")
+    return merged, changed_trips, quarantined
+
+
+def query_merge_changes(table_name: str = table_names.YELLOW_TAXI_TRIPS) -> str:
+    """
+    Replace the rows of `CHANGED_IDS` in `table_name` (yellow_taxi_trips by default) with the `CHANGED_TRIPS`,
+    in one transaction
+    """
+    return f"""--sql
+        BEGIN TRANSACTION;
+
+        DELETE FROM {table_name}
+        WHERE socrata_id IN (SELECT socrata_id FROM {CHANGED_IDS});
+
+        INSERT INTO {table_name} BY NAME
+            SELECT * FROM {CHANGED_TRIPS}
+            ORDER BY trip_id;
+
+        COMMIT;
+    """
@@ -1,11 +1,24 @@
 import json
+import os
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from httpx import Response
-import pandas as pd
-
-from ....utils.log_utils import log_w_header
+from ....utils.log_utils import ProgressReporter
 from ....partitions import monthly_partition
+from ... import constants
+from . import dedup_helpers
+from .parquet_asset_helpers import SOCRATA_ID_COLUMN
+
+# httpx and numpy are imported by the assets at runtime, only the type hints are needed here
+if TYPE_CHECKING:
+    from logging import Logger
+
+    from httpx import AsyncClient, Response, Timeout
+
+    from ....utils.dedup_utils import StreamingDeduplicator
+
+# the number of keys that the duplicate detection of a download is sized for, when the row count of the month is unknown
+DEFAULT_EXPECTED_ROWS = 4_000_000
 
 
 def get_monthly_range(start_date: str) -> tuple[str, str]:
@@ -18,6 +31,13 @@ def get_monthly_range(start_date: str) -> tuple[str, str]:
     return (start_date, end_date)
 
 
+def get_pickup_range_query(start_date: str, end_date: str) -> str:
+    """
+    The `$where` query of the trips picked up within `[start_date, end_date)`
+    """
+    return f"tpep_pickup_datetime >= '{start_date}' AND tpep_pickup_datetime < '{end_date}'"
+
+
 def create_file_save_path(start_date: str, csv_data_dir: Path) -> str:
     if not csv_data_dir.exists():
         csv_data_dir.mkdir(parents=True, exist_ok=True)
@@ -25,35 +45,258 @@ def create_file_save_path(start_date: str, csv_data_dir: Path) -> str:
     month_num = start_date.split("-")[1]
     CSV_FILE_PATH = Path(f"{csv_data_dir}/2022-{month_num}.csv")
 
-    print(f"file save path: {CSV_FILE_PATH}")
-
     return str(CSV_FILE_PATH)
 
 
+def build_rows_url(
+    where_query: str,
+    response_limit: int,
+    app_token: str | None,
+    file_type: str = "json",
+) -> str:
+    """
+    The API request url of the trips matching `where_query`, `response_limit` rows at a time.
+    The url has an `{offset}` placeholder for the pages of the request loop
+    """
+    # See this doc for $where and other API queries: https://dev.socrata.com/docs/queries/
+    # the Socrata row `:id` is requested to merge the changed rows later on, and the rows are ordered
+    #   by it so that the pages of the offset are stable
+    url = (
+        f"{constants.YELLOW_TAXI_TRIPS_2022_URL}.{file_type}?"
+        + f"$$app_token={app_token}"
+        + "&$select=:id,*"
+        + f"&$where={where_query}"
+        + "&$order=:id"
+        + f"&$limit={response_limit}"
+    )
+    # make the `offset` query params formattable since it will change value in the request loop
+    return url + "&$offset={offset}"
+
+
+async def fetch_row_count(
+    client: "AsyncClient",
+    resource_url: str,
+    where_query: str,
+    app_token: str | None,
+    timeout: "Timeout",
+) -> int | None:
+    """
+    Requests the `count(*)` of the rows matching `where_query`. This is used to estimate the ETA of
+    the stream download, hence, `None` is returned instead of raising when the count is unavailable
+    """
+    url = (
+        f"{resource_url}.json?"
+        + f"$$app_token={app_token}"
+        + "&$select=count(*)"
+        + f"&$where={where_query}"
+    )
+    try:
+        response = await client.get(url, timeout=timeout)
+        response.raise_for_status()
+        # the response looks like [{"count": "3288250"}]
+        return int(response.json()[0]["count"])
+    except Exception:
+        return None
+
+
+async def fetch_max_updated_at(
+    client: "AsyncClient",
+    resource_url: str,
+    where_query: str,
+    app_token: str | None,
+    timeout: "Timeout",
+) -> str | None:
+    """
+    Requests the latest `:updated_at` of the rows matching `where_query`, i.e., the watermark of the
+    rows. `None` is returned instead of raising when it is unavailable
+    """
+    url = (
+        f"{resource_url}.json?"
+        + f"$$app_token={app_token}"
+        + "&$select=max(:updated_at) AS max_updated_at"
+        + f"&$where={where_query}"
+    )
+    try:
+        response = await client.get(url, timeout=timeout)
+        response.raise_for_status()
+        # the response looks like [{"max_updated_at": "2023-06-21T14:30:11.000Z"}]
+        return response.json()[0].get("max_updated_at")
+    except Exception:
+        return None
+
+
+def get_watermark_path(csv_data_dir: Path, partition_key: str) -> Path:
+    month = partition_key[:7]
+    return csv_data_dir / "watermarks" / f"{month}.json"
+
+
+def read_watermark(csv_data_dir: Path, partition_key: str) -> str | None:
+    """
+    The latest `:updated_at` of the rows that were downloaded for the month of `partition_key`
+    """
+    watermark_path = get_watermark_path(csv_data_dir, partition_key)
+    if not watermark_path.exists():
+        return None
+
+    with open(watermark_path) as f:
+        return json.load(f)["updated_at"]
+
+
+def write_watermark(csv_data_dir: Path, partition_key: str, watermark: str) -> None:
+    watermark_path = get_watermark_path(csv_data_dir, partition_key)
+    watermark_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(watermark_path, "w") as f:
+        json.dump({"updated_at": watermark}, f)
+
+
+async def download_monthly_csv(
+    client: "AsyncClient",
+    partition_key: str,
+    csv_data_dir: Path,
+    log: "Logger",
+    updated_after: str | None = None,
+) -> dict[str, float | str | None]:
+    """
+    Stream downloads the trips of the month of `partition_key` to a csv file, requesting
+    `response_limit` rows at a time. When `updated_after` is given, only the rows that were updated
+    since (`:updated_at > updated_after`) are downloaded, to the csv file of the `changes` folder.
+
+    The rows are deduplicated by their Socrata `:id` while downloading, since a row can be served by two pages
+    when the dataset changes during the download.
+
+    Returns the number of downloaded and duplicate rows, the download throughput and the watermark of the month,
+    i.e., its latest `:updated_at` when the download started
+    """
+    import httpx
+
+    from ....utils.dedup_utils import StreamingDeduplicator
+
+    start_date, end_date = get_monthly_range(partition_key)
+    if updated_after is None:
+        CSV_FILE_NAME = create_file_save_path(start_date, csv_data_dir)
+    else:
+        CSV_FILE_NAME = create_file_save_path(start_date, csv_data_dir / "changes")
+        # the file is only written when there are changes, so remove the changes of the last download
+        Path(CSV_FILE_NAME).unlink(missing_ok=True)
+
+    # API request details
+    app_token = os.getenv("NYC_OPEN_DATA_APP_TOKEN")
+    # request the file as JSON, but can also be requested as csv
+    file_type = "json"
+    month_query = get_pickup_range_query(start_date, end_date)
+    where_query = (
+        month_query
+        if updated_after is None
+        else f"{month_query} AND :updated_at > '{updated_after}'"
+    )
+    response_limit = 500_000
+    offset = 0
+    timeout = httpx.Timeout(90)
+    url = build_rows_url(where_query, response_limit, app_token, file_type)
+
+    # for logging and the returned metadata
+    total_records_saved = 0
+    partition_name = CSV_FILE_NAME.split("/")[-1]
+    # the expected row count is only used for the ETA of the progress logs
+    expected_rows = await fetch_row_count(
+        client,
+        constants.YELLOW_TAXI_TRIPS_2022_URL,
+        where_query,
+        app_token,
+        timeout,
+    )
+    progress = ProgressReporter(log, partition_name, expected_rows=expected_rows)
+    dedup = StreamingDeduplicator(expected_rows or DEFAULT_EXPECTED_ROWS)
+    # read before downloading, the rows updated while downloading are downloaded again with the next changes
+    watermark = await fetch_max_updated_at(
+        client,
+        constants.YELLOW_TAXI_TRIPS_2022_URL,
+        month_query,
+        app_token,
+        timeout,
+    )
+
+    try:
+        # start the request loop
+        should_continue_request_loop = True
+        while should_continue_request_loop:
+            log.debug(
+                f"{partition_name}: requesting with {response_limit=} and {offset=}"
+            )
+            # read the response as stream and set the value for the offset query params
+            async with client.stream(
+                "GET",
+                url.format(offset=offset),
+                timeout=timeout,
+            ) as response:
+                # handle response
+                accumulator_limit = 100_000
+                result = await handle_stream_data_response(
+                    response=response,
+                    response_limit=response_limit,
+                    accumulator_limit=accumulator_limit,
+                    file_name=CSV_FILE_NAME,
+                    total_records_saved=total_records_saved,
+                    progress=progress,
+                    dedup=dedup,
+                )
+                should_continue_request_loop = result[0]
+                total_records_saved = result[1]
+
+                # continue requesting for data if you are still reaching the line limit
+                if should_continue_request_loop:
+                    offset += response_limit
+
+    except httpx.HTTPError as exc:
+        log.error(
+            f"{partition_name}: HTTP Exception for {exc.request.url}. Error message: {exc}"
+        )
+        raise Exception("HTTP Error")
+    finally:
+        stats = progress.finish()
+
+    if dedup.duplicates:
+        log.warning(f"{partition_name}: skipped {dedup.duplicates:,} duplicate rows")
+
+    return {
+        "rows": total_records_saved,
+        "duplicates": dedup.duplicates,
+        "watermark": watermark,
+        **stats,
+    }
+
+
 async def handle_stream_data_response(
-    response: Response,
+    response: "Response",
     response_limit: int,
     accumulator_limit: int,
     file_name: str,
     total_records_saved: int,
+    progress: ProgressReporter | None = None,
+    dedup: "StreamingDeduplicator | None" = None,
 ):
     """
     Handles the response stream of the request. Returns a tuple that contains
     `(1) the boolean value to determine if the main request loop should continue`, and
-    `(2) the number of saved rows from the handled request loop`
+    `(2) the number of received rows from the handled request loop`
+
+    The received rows and bytes are reported to `progress`, if given, which takes care of rate limiting the logs.
+    The rows that were already received are left out of the csv file by `dedup`, if given
     """
     # Check for exceptions
     response.raise_for_status()
 
     # save every N lines, where N = accumulator_limit
     line_accumulator = []
-    # for logging
-    partition_name = file_name.split("/")[-1]
+    # for the throughput, the length of the received lines is a close enough estimate of the received bytes
+    accumulated_bytes = 0
     async for line in response.aiter_lines():
         # check for empty response, and end the request loop when there are no more rows to fetch
         if line == "[]":
             return False, total_records_saved
 
+        accumulated_bytes += len(line)
         # stream data received, clean the data
         # the data received here is a string representation of the json data
         line = line.strip(",[]")
@@ -64,12 +307,14 @@ async def handle_stream_data_response(
         if len(line_accumulator) == accumulator_limit:
             # add csv header and append to the end of file when there are existing records already
             append_flag = True if total_records_saved != 0 else False
-            save_streamed_lines(line_accumulator, file_name, append_flag)
+            save_streamed_lines(line_accumulator, file_name, append_flag, dedup)
             # clear the contents of line_accumulator for the next set of responses
             line_accumulator.clear()
-            # log progress
             total_records_saved += accumulator_limit
-            log_w_header(f"{partition_name}: Saved {total_records_saved} rows", ".")
+            # log progress
+            if progress is not None:
+                progress.update(rows=accumulator_limit, num_bytes=accumulated_bytes)
+            accumulated_bytes = 0
     # end of for loop
 
     # add the remaining lines if there are any
@@ -81,14 +326,14 @@ async def handle_stream_data_response(
     get_line_accumulator_length = len(line_accumulator)
     if get_line_accumulator_length > 0:
         append_flag = True if total_records_saved != 0 else False
-        save_streamed_lines(line_accumulator, file_name, append_flag)
+        save_streamed_lines(line_accumulator, file_name, append_flag, dedup)
         line_accumulator.clear()
         # log
         total_records_saved += get_line_accumulator_length
-        log_w_header(
-            f"{partition_name}: Saved {total_records_saved} rows after last set of records",
-            ".",
-        )
+        if progress is not None:
+            progress.update(
+                rows=get_line_accumulator_length, num_bytes=accumulated_bytes
+            )
 
         # end the request loop
         if response_limit % accumulator_limit == 0:
@@ -98,9 +343,25 @@ async def handle_stream_data_response(
     return True, total_records_saved
 
 
-def save_streamed_lines(lines: list[int], file_path: str, append_flag: bool) -> None:
+def save_streamed_lines(
+    lines: list[int],
+    file_path: str,
+    append_flag: bool,
+    dedup: "StreamingDeduplicator | None" = None,
+) -> None:
+    import pandas as pd
+
     # convert line_accumulator to a dataframe
     df = pd.DataFrame.from_records(lines)
+    # leave out the rows that were already saved, batch by batch
+    if dedup is not None:
+        df = df[
+            dedup.add(
+                dedup_helpers.hash_trip_keys(
+                    df, SOCRATA_ID_COLUMN, dedup_helpers.RAW_NATURAL_KEY_COLUMNS
+                )
+            )
+        ]
     # save the dataframe as csv. `append_flag` uses the total_saved_records to determine the values for writing mode and header
     df.to_csv(
         file_path,
@@ -0,0 +1,99 @@
+from typing import TYPE_CHECKING
+
+from .parquet_asset_helpers import TRIP_ID_MONTH_MULTIPLIER
+
+if TYPE_CHECKING:
+    from numpy import ndarray
+    from pandas import DataFrame
+    from pyarrow import Table
+
+# the columns that identify a trip when its Socrata row id is unknown, in the raw csv and in the trips table
+RAW_NATURAL_KEY_COLUMNS = [
+    "vendorid",
+    "tpep_pickup_datetime",
+    "tpep_dropoff_datetime",
+    "pulocationid",
+    "dolocationid",
+    "passenger_count",
+    "trip_distance",
+    "total_amount",
+]
+NATURAL_KEY_COLUMNS = [
+    "vendor_id",
+    "pickup_dtime",
+    "dropoff_dtime",
+    "pickup_lid",
+    "dropoff_lid",
+    "passenger_count",
+    "trip_distance",
+    "total_amount",
+]
+# the rows of the trips table that are deduplicated at once
+DEDUP_BATCH_SIZE = 1_000_000
+
+
+def hash_trip_keys(
+    df: "DataFrame", id_column: str, natural_key_columns: list[str]
+) -> "ndarray":
+    """
+    The 64-bit key hashes of the trips: the hash of the Socrata row id, or of the natural-key columns
+    for the trips without one (e.g., the trips downloaded before the row id was requested)
+    """
+    import numpy as np
+    from pandas.util import hash_pandas_object
+
+    hashes = np.empty(len(df), dtype=np.uint64)
+    has_id = (
+        df[id_column].notna().to_numpy()
+        if id_column in df.columns
+        else np.zeros(len(df), dtype=bool)
+    )
+
+    if has_id.any():
+        hashes[has_id] = hash_pandas_object(df.loc[has_id, id_column], index=False)
+    if not has_id.all():
+        columns = [col for col in natural_key_columns if col in df.columns]
+        hashes[~has_id] = hash_pandas_object(df.loc[~has_id, columns], index=False)
+
+    return hashes
+
+
+def find_duplicate_trips(monthly_trips: "Table") -> "Table":
+    """
+    The `trip_id` of the trips whose key was already seen, in a previous month or earlier in the same month.
+    The trips are read `DEDUP_BATCH_SIZE` rows at a time, and only their key columns, so the memory use is
+    bounded by the key hashes instead of the rows (see `StreamingDeduplicator`)
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    from ....utils.dedup_utils import StreamingDeduplicator
+
+    key_columns = [
+        col
+        for col in ["trip_id", "socrata_id", *NATURAL_KEY_COLUMNS]
+        if col in monthly_trips.column_names
+    ]
+    dedup = StreamingDeduplicator(monthly_trips.num_rows)
+    duplicate_trip_ids = [np.empty(0, dtype=np.int64)]
+    for batch in monthly_trips.select(key_columns).to_batches(
+        max_chunksize=DEDUP_BATCH_SIZE
+    ):
+        df = batch.to_pandas()
+        is_new = dedup.add(hash_trip_keys(df, "socrata_id", NATURAL_KEY_COLUMNS))
+        duplicate_trip_ids.append(df["trip_id"].to_numpy()[~is_new])
+
+    return pa.table({"trip_id": pa.array(np.concatenate(duplicate_trip_ids), pa.int64())})
+
+
+def count_duplicates_per_partition(duplicate_trips: "Table") -> dict[str, int]:
+    """
+    The number of duplicate trips by the month of their `trip_id`, e.g., `{"2022-03-01": 12}`
+    """
+    counts: dict[str, int] = {}
+    for trip_id in duplicate_trips["trip_id"].to_pylist():
+        yyyymm = str(trip_id // TRIP_ID_MONTH_MULTIPLIER)
+        partition_key = f"{yyyymm[:4]}-{yyyymm[4:]}-01"
+        counts[partition_key] = counts.get(partition_key, 0) + 1
+
+    return counts
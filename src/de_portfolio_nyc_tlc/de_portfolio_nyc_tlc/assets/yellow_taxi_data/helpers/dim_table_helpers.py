@@ -0,0 +1,246 @@
+from ..constants import table_names
+from .trip_schema_helpers import MONEY_TYPE, TIMESTAMP_TYPE
+
+DIM_DESCRIPTIONS = {
+    table_names.DIM_TRIP_DATETIME: """
+    The dimension table containing the date and time of the taxi trip
+    """,
+    table_names.DIM_TRIP_LOCATION: """
+    The dimension table containing the details about the pickup and dropoff location of the taxi trip
+    """,
+    table_names.DIM_TRANSACTION_FEES: """
+    The dimension table containing the details of the taxi trip payment transaction
+    """,
+    table_names.DIM_TRIP_MISC_DETAILS: """
+    The dimension table containing miscelleneous details about the trip
+    """,
+}
+
+# the columns of yellow_taxi_trips that each dim table is built from
+DIM_SOURCE_COLUMNS = {
+    table_names.DIM_TRIP_DATETIME: ["pickup_dtime", "dropoff_dtime"],
+    table_names.DIM_TRIP_LOCATION: ["pickup_lid", "dropoff_lid"],
+    table_names.DIM_TRANSACTION_FEES: [
+        "total_amount",
+        "payment_type",
+        "rate_code_id",
+        "fare_amount",
+        "mta_tax",
+        "tip_amount",
+        "tolls_amount",
+        "improvement_surcharge",
+        "congestion_surcharge",
+        "extra",
+        "airport_fee",
+    ],
+    table_names.DIM_TRIP_MISC_DETAILS: ["vendor_id", "store_and_fwd_flag"],
+}
+
+
+# Queries to create the dim tables
+# `source` is the relation to read the trips from, i.e., the yellow_taxi_trips table or a subquery
+def query_create_dim_trip_datetime(source: str = table_names.YELLOW_TAXI_TRIPS) -> str:
+    return f"""--sql
+        CREATE OR REPLACE SEQUENCE dim_trip_datetime_seq START 1;
+
+        CREATE OR REPLACE TABLE {table_names.DIM_TRIP_DATETIME} (
+            datetime_key BIGINT DEFAULT NEXTVAL('dim_trip_datetime_seq') PRIMARY KEY,
+            pickup_dtime {TIMESTAMP_TYPE},
+            pickup_date DATE,
+            pickup_hour TINYINT,
+            pickup_dow TINYINT,
+            dropoff_dtime {TIMESTAMP_TYPE},
+            dropoff_date DATE,
+            dropoff_hour TINYINT,
+            dropoff_dow TINYINT
+        );
+
+        INSERT INTO {table_names.DIM_TRIP_DATETIME} (
+            pickup_dtime,
+            pickup_date,
+            pickup_hour,
+            pickup_dow,
+            dropoff_dtime,
+            dropoff_date,
+            dropoff_hour,
+            dropoff_dow
+        )
+            SELECT DISTINCT
+                pickup_dtime,
+                pickup_dtime::DATE,
+                DATEPART('hour', pickup_dtime),
+                DATEPART('dow', pickup_dtime),
+                dropoff_dtime,
+                dropoff_dtime::DATE,
+                DATEPART('hour', dropoff_dtime),
+                DATEPART('dow', dropoff_dtime)
+            FROM {source};
+       """
+
+
+def query_create_dim_trip_location(source: str = table_names.YELLOW_TAXI_TRIPS) -> str:
+    # The distinct (pickup_lid, dropoff_lid) pairs are computed first, so the DISTINCT only hashes
+    #   two SMALLINT columns per trip. The small set of pairs is then joined to the zone lookup
+    return f"""--sql
+        CREATE OR REPLACE SEQUENCE dim_trip_location_seq START 1;
+
+        CREATE OR REPLACE TABLE {table_names.DIM_TRIP_LOCATION} (
+            trip_location_key BIGINT DEFAULT NEXTVAL('dim_trip_location_seq') PRIMARY KEY,
+            pickup_lid SMALLINT,
+            pickup_borough TEXT,
+            pickup_zone TEXT,
+            pickup_service_zone TEXT,
+            dropoff_lid SMALLINT,
+            dropoff_borough TEXT,
+            dropoff_zone TEXT,
+            dropoff_service_zone TEXT,
+            UNIQUE (pickup_lid, dropoff_lid)
+        );
+
+        INSERT INTO {table_names.DIM_TRIP_LOCATION} (
+            pickup_lid,
+            pickup_borough,
+            pickup_zone,
+            pickup_service_zone,
+            dropoff_lid,
+            dropoff_borough,
+            dropoff_zone,
+            dropoff_service_zone
+        )
+        WITH trip_locations AS (
+            SELECT DISTINCT
+                pickup_lid,
+                dropoff_lid
+            FROM {source}
+        )
+        SELECT
+            trips.pickup_lid,
+            taxi_zone_pickup.borough,
+            taxi_zone_pickup.zone,
+            taxi_zone_pickup.service_zone,
+            trips.dropoff_lid,
+            taxi_zone_dropoff.borough,
+            taxi_zone_dropoff.zone,
+            taxi_zone_dropoff.service_zone,
+        FROM trip_locations as trips
+            INNER JOIN {table_names.TAXI_ZONE_LOOKUP} as taxi_zone_pickup
+                ON trips.pickup_lid = taxi_zone_pickup.location_id
+            INNER JOIN {table_names.TAXI_ZONE_LOOKUP} as taxi_zone_dropoff
+                ON trips.dropoff_lid = taxi_zone_dropoff.location_id
+        ORDER BY trips.pickup_lid, trips.dropoff_lid
+        """
+
+
+def query_create_dim_transaction_fees(
+    source: str = table_names.YELLOW_TAXI_TRIPS,
+) -> str:
+    return f"""--sql
+        CREATE OR REPLACE SEQUENCE dim_transaction_fees_seq START 1;
+
+        CREATE OR REPLACE TABLE {table_names.DIM_TRANSACTION_FEES} (
+            transaction_key BIGINT DEFAULT NEXTVAL('dim_transaction_fees_seq') PRIMARY KEY,
+            total_amount {MONEY_TYPE},
+            payment_type TINYINT,
+            rate_code_id TINYINT,
+            fare_amount {MONEY_TYPE},
+            mta_tax {MONEY_TYPE},
+            tip_amount {MONEY_TYPE},
+            tolls_amount {MONEY_TYPE},
+            improvement_surcharge {MONEY_TYPE},
+            congestion_surcharge {MONEY_TYPE},
+            extra {MONEY_TYPE},
+            airport_fee {MONEY_TYPE}
+        );
+
+        INSERT INTO {table_names.DIM_TRANSACTION_FEES} (
+            total_amount,
+            payment_type,
+            rate_code_id,
+            fare_amount,
+            mta_tax,
+            tip_amount,
+            tolls_amount,
+            improvement_surcharge,
+            congestion_surcharge,
+            extra,
+            airport_fee
+        )
+            SELECT DISTINCT
+                total_amount,
+                payment_type,
+                rate_code_id,
+                fare_amount,
+                mta_tax,
+                tip_amount,
+                tolls_amount,
+                improvement_surcharge,
+                congestion_surcharge,
+                extra,
+                airport_fee
+            FROM {source}
+        """
+
+
+def query_create_dim_trip_misc_details(
+    source: str = table_names.YELLOW_TAXI_TRIPS,
+) -> str:
+    return f"""--sql
+        CREATE OR REPLACE SEQUENCE dim_trip_misc_details_seq START 1;
+
+        CREATE OR REPLACE TABLE {table_names.DIM_TRIP_MISC_DETAILS} (
+            misc_detail_key BIGINT DEFAULT NEXTVAL('dim_trip_misc_details_seq') PRIMARY KEY,
+            vendor_id TINYINT,
+            store_and_fwd_flag TINYINT
+        );
+
+        INSERT INTO {table_names.DIM_TRIP_MISC_DETAILS} (
+            vendor_id,
+            store_and_fwd_flag
+        )
+            SELECT DISTINCT
+                vendor_id,
+                store_and_fwd_flag,
+            FROM {source}
+        """
+
+
+QUERIES_CREATE_DIM = {
+    table_names.DIM_TRIP_DATETIME: query_create_dim_trip_datetime,
+    table_names.DIM_TRIP_LOCATION: query_create_dim_trip_location,
+    table_names.DIM_TRANSACTION_FEES: query_create_dim_transaction_fees,
+    table_names.DIM_TRIP_MISC_DETAILS: query_create_dim_trip_misc_details,
+}
+
+# the temporary table that holds the distinct values of every selected dim
+DIM_GROUPING_SETS_TABLE = "dim_grouping_sets"
+
+
+def query_create_dim_grouping_sets(dim_names: list[str]) -> str:
+    """
+    Computes the distinct source columns of every dim in `dim_names` with a single scan of
+    yellow_taxi_trips, using one GROUPING SET per dim. The `dim_name` column tells which dim a row belongs to
+    """
+    columns = [col for dim_name in dim_names for col in DIM_SOURCE_COLUMNS[dim_name]]
+    grouping_sets = ", ".join(
+        f"({', '.join(DIM_SOURCE_COLUMNS[dim_name])})" for dim_name in dim_names
+    )
+    # the dims do not share source columns, so the first column of a dim is enough to identify its grouping set
+    dim_name_cases = "\n".join(
+        f"WHEN GROUPING({DIM_SOURCE_COLUMNS[dim_name][0]}) = 0 THEN '{dim_name}'"
+        for dim_name in dim_names
+    )
+
+    return f"""--sql
+        CREATE OR REPLACE TEMP TABLE {DIM_GROUPING_SETS_TABLE} AS
+            SELECT
+                {", ".join(columns)},
+                CASE
+                    {dim_name_cases}
+                END AS dim_name
+            FROM {table_names.YELLOW_TAXI_TRIPS}
+            GROUP BY GROUPING SETS ({grouping_sets});
+        """
+
+
+def dim_grouping_set_source(dim_name: str) -> str:
+    return f"(SELECT * FROM {DIM_GROUPING_SETS_TABLE} WHERE dim_name = '{dim_name}')"
@@ -0,0 +1,144 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# trip_id = <yyyymm> * TRIP_ID_MONTH_MULTIPLIER + <row number of the trip within its month>,
+#   e.g., the first trip of January 2022 is 202201_0000000001
+TRIP_ID_MONTH_MULTIPLIER = 10_000_000_000
+# the order of the trips within a month, which the row numbers of the trip_id follow
+TRIP_SORT_COLUMNS = ["pickup_dtime", "pickup_lid", "dropoff_dtime", "dropoff_lid"]
+
+# the row id of the Socrata API, which the changes of the trips are merged by
+SOCRATA_ID_COLUMN = ":id"
+RAW_CSV_COLUMNS = [
+    "vendorid",
+    "tpep_pickup_datetime",
+    "tpep_dropoff_datetime",
+    "passenger_count",
+    "trip_distance",
+    "ratecodeid",
+    "store_and_fwd_flag",
+    "pulocationid",
+    "dolocationid",
+    "payment_type",
+    "fare_amount",
+    "extra",
+    "mta_tax",
+    "tip_amount",
+    "tolls_amount",
+    "improvement_surcharge",
+    "total_amount",
+    "congestion_surcharge",
+    "airport_fee",
+]
+
+
+def clean_monthly_csv(csv_file: str) -> tuple["DataFrame", int]:
+    """
+    Read the raw csv of a month, then clean, filter and rename its columns.
+    Returns the cleaned trips and the number of records of the raw csv
+    """
+    # the heavy libraries are imported here to keep the code location cheap to load
+    from numpy import int16, int8
+    import pandas as pd
+
+    # read the csv files and indicate the timestamp columns
+    # NOTE: Ideally, the dtype would be set when reading the csv, but some columns have invalid data that results into an error
+    #  Hence, some of the columns will undergo initial cleaning and transformation before they are converted to a more appropriate data type
+    timestamp_cols = ["tpep_pickup_datetime", "tpep_dropoff_datetime"]
+    df = pd.read_csv(csv_file, parse_dates=timestamp_cols)
+    # for metadata
+    raw_csv_length = len(df)
+    # The API leaves out the null fields of a row, so a column is missing from the csv when it is null for every
+    #   downloaded row. Add the missing columns, and keep the same column order for every month
+    id_cols = [SOCRATA_ID_COLUMN] if SOCRATA_ID_COLUMN in df.columns else []
+    df = df.reindex(columns=[*id_cols, *RAW_CSV_COLUMNS])
+
+    # INITIAL CLEANING AND TRANSFORMATIONS
+    # clean some of the numeric columns by converting invalid values to NaN
+    cols_to_numeric = [
+        "vendorid",
+        "passenger_count",
+        "ratecodeid",
+        "pulocationid",
+        "dolocationid",
+        "payment_type",
+        "total_amount",
+        "trip_distance",
+    ]
+    for col in cols_to_numeric:
+        # Convert invalid numeric values to NaNs
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    # drop invalid trip records w/ NaN values after the type conversion
+    df = df.dropna(subset=["passenger_count", "total_amount", "trip_distance"])
+
+    # Convert columns to ints
+    cols_to_int = [
+        "vendorid",
+        "passenger_count",
+        "ratecodeid",
+        "pulocationid",
+        "dolocationid",
+        "payment_type",
+    ]
+    for col in cols_to_int:
+        # Replace NaNs to prevent error during dtype conversion
+        df.fillna({col: -1}, inplace=True)
+
+        if col == "pulocationid" or col == "dolocationid":
+            df[col] = df[col].astype(int16)
+            continue
+
+        df[col] = df[col].astype(int8)
+
+    # convert the flag column to int
+    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].mask(
+        df["store_and_fwd_flag"] == "Y", 1
+    )
+    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].mask(
+        df["store_and_fwd_flag"] == "N", 0
+    )
+    df["store_and_fwd_flag"] = pd.to_numeric(df["store_and_fwd_flag"], errors="coerce")
+    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].fillna(-1)
+    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].astype(int8)
+
+    # filter valid trips
+    trips_w_passengers = df["passenger_count"] > 0
+    only_paid_trips = df["total_amount"] > 0
+    trips_w_valid_distance = df["trip_distance"] > 0
+
+    df = df[trips_w_passengers & trips_w_valid_distance & only_paid_trips]
+
+    # rename columns
+    col_names = {
+        "vendorid": "vendor_id",
+        "tpep_pickup_datetime": "pickup_dtime",
+        "tpep_dropoff_datetime": "dropoff_dtime",
+        "ratecodeid": "rate_code_id",
+        "pulocationid": "pickup_lid",
+        "dolocationid": "dropoff_lid",
+        SOCRATA_ID_COLUMN: "socrata_id",
+    }
+    df.rename(columns=col_names, inplace=True)
+
+    return df, raw_csv_length
+
+
+def add_trip_ids(df: "DataFrame", partition_key: str) -> "DataFrame":
+    """
+    Sort the cleaned trips of a month by `TRIP_SORT_COLUMNS` and prepend a deterministic `trip_id`:
+    the month prefix followed by the row number within the sorted month. The IDs only depend on the
+    csv of the month, so the months can be loaded in any order, or concurrently
+    """
+    from numpy import arange, int64
+
+    year, month = partition_key.split("-")[:2]
+    month_prefix = int(f"{year}{month}") * TRIP_ID_MONTH_MULTIPLIER
+
+    # a stable sort keeps the csv order of the trips with the same sort key
+    df = df.sort_values(TRIP_SORT_COLUMNS, kind="stable")
+    df.insert(0, "trip_id", month_prefix + arange(1, len(df) + 1, dtype=int64))
+
+    return df
@@ -0,0 +1,129 @@
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from numpy import ndarray
+    from pandas import DataFrame
+
+# the reasons that a trip is quarantined for, as the bits of its `plausibility_flags`
+NON_POSITIVE_DURATION = 1
+DURATION_OUTLIER = 2
+SPEED_OUTLIER = 4
+FARE_PER_MILE_OUTLIER = 8
+FEATURE_FLAGS = {
+    "duration_s": DURATION_OUTLIER,
+    "speed_mph": SPEED_OUTLIER,
+    "fare_per_mile": FARE_PER_MILE_OUTLIER,
+}
+
+# The features are skewed (a few long trips, airport flat fares...), so their outliers are found on a log scale:
+#   a trip is an outlier if its log feature is more than MAD_THRESHOLD robust standard deviations
+#   (1.4826 * MAD) away from the median of its month
+MAD_THRESHOLD = 6.0
+MAD_TO_STD = 1.4826
+# no taxi drives faster than this on average, whatever the thresholds of the month are
+MAX_SPEED_MPH = 90.0
+
+QUARANTINE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "quarantine")
+
+
+def get_quarantine_path(partition_key: str, quarantine_dir: str = QUARANTINE_DIR) -> str:
+    return os.path.join(quarantine_dir, f"{partition_key[:7]}.parquet")
+
+
+def compute_trip_features(df: "DataFrame") -> dict[str, "ndarray"]:
+    """
+    The duration (seconds), average speed (mph) and fare per mile of every trip, as column arrays
+    """
+    import numpy as np
+    import pandas as pd
+
+    duration_s = (
+        df["dropoff_dtime"].to_numpy() - df["pickup_dtime"].to_numpy()
+    ) / np.timedelta64(1, "s")
+    distance = df["trip_distance"].to_numpy(dtype=np.float64)
+    # the fare is not cleaned by `clean_monthly_csv`, so its invalid values are NaN, which are never flagged
+    fare = pd.to_numeric(df["fare_amount"], errors="coerce").to_numpy(dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed_mph = distance / (duration_s / 3600)
+        fare_per_mile = fare / distance
+
+    return {
+        "duration_s": duration_s,
+        "speed_mph": speed_mph,
+        "fare_per_mile": fare_per_mile,
+    }
+
+
+def get_robust_thresholds(values: "ndarray") -> dict[str, float | None]:
+    """
+    The bounds of the plausible values of a feature: the median of its positive values, on a log scale,
+    plus or minus MAD_THRESHOLD robust standard deviations
+    """
+    import numpy as np
+
+    log_values = np.log(values[np.isfinite(values) & (values > 0)])
+    if not len(log_values):
+        return {"median": None, "lower": None, "upper": None}
+
+    median = np.median(log_values)
+    spread = MAD_THRESHOLD * MAD_TO_STD * np.median(np.abs(log_values - median))
+    return {
+        "median": float(np.exp(median)),
+        "lower": float(np.exp(median - spread)),
+        "upper": float(np.exp(median + spread)),
+    }
+
+
+def score_trip_plausibility(
+    df: "DataFrame",
+    thresholds: dict[str, dict[str, float | None]] | None = None,
+) -> tuple["ndarray", dict[str, dict[str, float | None]]]:
+    """
+    The `plausibility_flags` of the trips of a month, 0 for a plausible trip, and the thresholds of
+    the month that they were flagged with. The thresholds are computed from `df`, unless the `thresholds`
+    of the month are given, e.g., to score a few changed trips against the rest of their month
+    """
+    import numpy as np
+
+    features = compute_trip_features(df)
+    flags = np.zeros(len(df), dtype=np.int8)
+    # a trip that ends before it starts has no meaningful speed, so it is only flagged for its duration
+    flags[features["duration_s"] <= 0] |= NON_POSITIVE_DURATION
+    valid_duration = features["duration_s"] > 0
+
+    given_thresholds = thresholds
+    thresholds = {}
+    for feature, flag in FEATURE_FLAGS.items():
+        values = features[feature]
+        if given_thresholds is not None:
+            bounds = dict(given_thresholds[feature])
+        else:
+            bounds = get_robust_thresholds(values[valid_duration])
+        if feature == "speed_mph" and bounds["upper"] is not None:
+            bounds["upper"] = min(bounds["upper"], MAX_SPEED_MPH)
+        thresholds[feature] = bounds
+        if bounds["median"] is None:
+            continue
+
+        # the NaN features, e.g., a missing fare, are never outliers
+        outliers = valid_duration & ((values < bounds["lower"]) | (values > bounds["upper"]))
+        flags[outliers] |= flag
+
+    return flags, thresholds
+
+
+def quarantine_implausible_trips(
+    df: "DataFrame",
+    thresholds: dict[str, dict[str, float | None]] | None = None,
+) -> tuple["DataFrame", "DataFrame", dict[str, dict[str, float | None]]]:
+    """
+    Split the trips of a month into the plausible trips and the quarantined trips, which keep their
+    `plausibility_flags`. Returns both, and the thresholds of the month (see `score_trip_plausibility`)
+    """
+    flags, thresholds = score_trip_plausibility(df, thresholds)
+    is_plausible = flags == 0
+
+    quarantined = df[~is_plausible].assign(plausibility_flags=flags[~is_plausible])
+    return df[is_plausible], quarantined, thresholds
@@ -0,0 +1,230 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from duckdb import DuckDBPyConnection
+
+from ..constants import table_names
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class Rollup:
+    table_name: str
+    description: str
+    # the group by columns of the rollup, as {column name: expression over the trips}
+    key_columns: dict[str, str]
+
+
+# The additive measures stored in every rollup. Other measures are derived from these at query time
+ROLLUP_MEASURE_COLUMNS = {
+    "trip_count": "COUNT(*)",
+    "passenger_count": "SUM(passenger_count)",
+    "trip_distance": "SUM(trip_distance)",
+    "fare_amount": "SUM(fare_amount)",
+    "tip_amount": "SUM(tip_amount)",
+    "total_amount": "SUM(total_amount)",
+}
+
+# The measures that can be requested from `query_rollup`
+MEASURES = {
+    **{measure: f"SUM({measure})" for measure in ROLLUP_MEASURE_COLUMNS},
+    "avg_fare_amount": "SUM(fare_amount) / SUM(trip_count)",
+    "avg_trip_distance": "SUM(trip_distance) / SUM(trip_count)",
+    "tip_rate": "SUM(tip_amount) / NULLIF(SUM(fare_amount), 0)",
+}
+
+ROLLUP_COLUMN_TYPES = {
+    "pickup_hour": "TIMESTAMP",
+    "pickup_date": "DATE",
+    "pickup_lid": "SMALLINT",
+    "pickup_borough": "TEXT",
+    "payment_type": "TINYINT",
+    "trip_count": "BIGINT",
+    "passenger_count": "BIGINT",
+}
+
+# The dims that can be derived from a key column, as {dim: (key column, expression)}
+DERIVED_DIMS = {
+    "pickup_date": ("pickup_hour", "pickup_hour::DATE"),
+    "pickup_hour_of_day": ("pickup_hour", "DATEPART('hour', pickup_hour)"),
+    "pickup_dow": ("pickup_hour", "DATEPART('dow', pickup_hour)"),
+    "pickup_month": ("partition_month", "partition_month"),
+}
+
+ROLLUPS = [
+    Rollup(
+        table_name=table_names.ROLLUP_HOURLY_PICKUP_ZONE,
+        description="Trips aggregated per hour and pickup zone",
+        key_columns={
+            "pickup_hour": "DATE_TRUNC('hour', pickup_dtime)",
+            "pickup_lid": "pickup_lid",
+            "pickup_borough": "pickup_borough",
+        },
+    ),
+    Rollup(
+        table_name=table_names.ROLLUP_HOURLY_PICKUP_BOROUGH,
+        description="Trips aggregated per hour and pickup borough",
+        key_columns={
+            "pickup_hour": "DATE_TRUNC('hour', pickup_dtime)",
+            "pickup_borough": "pickup_borough",
+        },
+    ),
+    Rollup(
+        table_name=table_names.ROLLUP_DAILY_BOROUGH_PAYMENT,
+        description="Trips aggregated per day, pickup borough, and payment type",
+        key_columns={
+            "pickup_date": "pickup_dtime::DATE",
+            "pickup_borough": "pickup_borough",
+            "payment_type": "payment_type",
+        },
+    ),
+]
+ROLLUPS_BY_NAME = {rollup.table_name: rollup for rollup in ROLLUPS}
+
+# the temporary table that holds the trips of the month the rollups are built from
+ROLLUP_SOURCE_TABLE = "rollup_source"
+
+
+def query_create_rollup_source(parquet_file: str) -> str:
+    """
+    Reads the columns used by the rollups from the monthly parquet file once, together with the pickup borough
+    """
+    return f"""--sql
+        CREATE OR REPLACE TEMP TABLE {ROLLUP_SOURCE_TABLE} AS
+            SELECT
+                trips.pickup_dtime,
+                trips.pickup_lid,
+                trips.payment_type,
+                trips.passenger_count,
+                trips.trip_distance,
+                trips.fare_amount,
+                trips.tip_amount,
+                trips.total_amount,
+                taxi_zone.borough::TEXT AS pickup_borough
+            FROM read_parquet('{parquet_file}') AS trips
+                LEFT JOIN {table_names.TAXI_ZONE_LOOKUP} AS taxi_zone
+                    ON trips.pickup_lid = taxi_zone.location_id;
+        """
+
+
+def query_upsert_rollup_partition(
+    rollup: Rollup, partition_month: str, source: str = ROLLUP_SOURCE_TABLE
+) -> str:
+    """
+    Replaces the rows of `partition_month` in the rollup table with the aggregated rows of `source`, in one
+    transaction
+    """
+    # the measures without an entry in ROLLUP_COLUMN_TYPES are sums of DOUBLE columns
+    columns_ddl = ",\n".join(
+        f"{col} {ROLLUP_COLUMN_TYPES.get(col, 'DOUBLE')}"
+        for col in [*rollup.key_columns, *ROLLUP_MEASURE_COLUMNS]
+    )
+    select_columns = ",\n".join(
+        [f"{expr} AS {col}" for col, expr in rollup.key_columns.items()]
+        + [f"{expr} AS {col}" for col, expr in ROLLUP_MEASURE_COLUMNS.items()]
+    )
+
+    return f"""--sql
+        CREATE TABLE IF NOT EXISTS {rollup.table_name} (
+            partition_month DATE,
+            {columns_ddl}
+        );
+
+        BEGIN TRANSACTION;
+
+        DELETE FROM {rollup.table_name} WHERE partition_month = '{partition_month}';
+
+        INSERT INTO {rollup.table_name}
+            SELECT
+                '{partition_month}'::DATE AS partition_month,
+                {select_columns}
+            FROM {source}
+            GROUP BY ALL;
+
+        COMMIT;
+        """
+
+
+def get_answerable_dims(rollup: Rollup) -> dict[str, str]:
+    """
+    The dims that the rollup can group or filter by, as {dim: expression over the rollup table}
+    """
+    dims = {"partition_month": "partition_month"}
+    dims.update({col: col for col in rollup.key_columns})
+    for dim, (key_column, expr) in DERIVED_DIMS.items():
+        if dim not in dims and key_column in dims:
+            dims[dim] = expr
+
+    return dims
+
+
+def route_rollup(conn: DuckDBPyConnection, dims: list[str]) -> Rollup:
+    """
+    Returns the smallest materialized rollup that can answer a query over `dims`
+    """
+    table_sizes = dict(
+        conn.sql(
+            "SELECT table_name, estimated_size FROM duckdb_tables() WHERE NOT temporary"
+        ).fetchall()
+    )
+    candidates = [
+        rollup
+        for rollup in ROLLUPS
+        if rollup.table_name in table_sizes
+        and set(dims) <= set(get_answerable_dims(rollup))
+    ]
+    if not candidates:
+        raise ValueError(f"No materialized rollup can answer a query over {dims}")
+
+    # on ties, the rollup with less key columns is the coarser one
+    return min(
+        candidates,
+        key=lambda rollup: (table_sizes[rollup.table_name], len(rollup.key_columns)),
+    )
+
+
+def query_rollup(
+    conn: DuckDBPyConnection,
+    group_by: list[str],
+    measures: list[str],
+    filters: dict[str, object] | None = None,
+) -> "pd.DataFrame":
+    """
+    Answers an aggregate query from the smallest rollup that has the requested dims.
+    `filters` are equality filters, or IN filters for list values, e.g.,
+    `query_rollup(conn, ["pickup_borough"], ["trip_count", "tip_rate"], {"payment_type": [1, 2]})`
+    """
+    filters = filters or {}
+    unknown_measures = set(measures) - set(MEASURES)
+    if unknown_measures:
+        raise ValueError(f"Unknown measures: {sorted(unknown_measures)}")
+
+    rollup = route_rollup(conn, [*group_by, *filters])
+    dims = get_answerable_dims(rollup)
+
+    select_columns = [f"{dims[dim]} AS {dim}" for dim in group_by] + [
+        f"{MEASURES[measure]} AS {measure}" for measure in measures
+    ]
+    where_clauses = []
+    params = []
+    for dim, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            where_clauses.append(
+                f"{dims[dim]} IN ({', '.join('?' for _ in value)})"
+            )
+            params.extend(value)
+        else:
+            where_clauses.append(f"{dims[dim]} = ?")
+            params.append(value)
+
+    query = f"""--sql
+        SELECT {", ".join(select_columns)}
+        FROM {rollup.table_name}
+        {f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""}
+        {f"GROUP BY {', '.join(str(i + 1) for i in range(len(group_by)))}" if group_by else ""}
+        {f"ORDER BY {', '.join(str(i + 1) for i in range(len(group_by)))}" if group_by else ""}
+        """
+
+    return conn.execute(query, params).df()
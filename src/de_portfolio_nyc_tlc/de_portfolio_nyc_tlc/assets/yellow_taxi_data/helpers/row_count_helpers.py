@@ -0,0 +1,58 @@
+import os
+
+# the size of the chunks that the csv files are read in when counting their rows
+CSV_COUNT_BUFFER_SIZE = 1 << 20
+
+
+def count_csv_rows(csv_file: str, buffer_size: int = CSV_COUNT_BUFFER_SIZE) -> int | None:
+    """
+    Count the rows of a csv file, without its header, by counting its newlines chunk by chunk instead of
+    parsing it. The trip records have no quoted newlines, so every line is a row.
+    Returns `None` if the file does not exist
+    """
+    if not os.path.exists(csv_file):
+        return None
+
+    newlines = 0
+    last_chunk = b""
+    with open(csv_file, "rb") as f:
+        while chunk := f.read(buffer_size):
+            newlines += chunk.count(b"\n")
+            last_chunk = chunk
+
+    # the last row may not end with a newline
+    lines = newlines + (1 if last_chunk and not last_chunk.endswith(b"\n") else 0)
+    return max(lines - 1, 0)
+
+
+def count_parquet_rows(parquet_file: str) -> int | None:
+    """
+    The number of rows of a parquet file, read from its footer.
+    Returns `None` if the file does not exist
+    """
+    import pyarrow.parquet as pq
+
+    if not os.path.exists(parquet_file):
+        return None
+
+    return pq.ParquetFile(parquet_file).metadata.num_rows
+
+
+def get_row_count_drift(
+    source_rows: int | None, csv_rows: int | None
+) -> dict[str, int | float | str | None]:
+    """
+    Compare the rows of the downloaded csv of a month with the rows of the same month in the source
+    """
+    if csv_rows is None:
+        return {"status": "missing", "drift": None, "drift_pct": None}
+    if source_rows is None:
+        return {"status": "unknown", "drift": None, "drift_pct": None}
+
+    drift = csv_rows - source_rows
+    drift_pct = round(drift / source_rows * 100, 4) if source_rows else None
+    return {
+        "status": "ok" if drift == 0 else "drift",
+        "drift": drift,
+        "drift_pct": drift_pct,
+    }
@@ -0,0 +1,252 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from duckdb import DuckDBPyConnection
+
+from ..constants import table_names
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class Sample:
+    table_name: str
+    description: str
+    # the fraction of the trips of every stratum that is kept
+    fraction: float
+
+
+SAMPLES = [
+    Sample(
+        table_name=table_names.YELLOW_TAXI_TRIPS_SAMPLE_1_PCT,
+        description="1% of the trips, stratified by month, pickup borough, and payment type",
+        fraction=0.01,
+    ),
+    Sample(
+        table_name=table_names.YELLOW_TAXI_TRIPS_SAMPLE_0_1_PCT,
+        description="0.1% of the trips, stratified by month, pickup borough, and payment type",
+        fraction=0.001,
+    ),
+]
+SAMPLES_BY_NAME = {sample.table_name: sample for sample in SAMPLES}
+
+# The trips are sampled within every month x pickup borough x payment type, so every stratum is represented
+#   in proportion to its size. The small strata keep at least MIN_STRATUM_SAMPLE_ROWS trips (or all of them),
+#   so their variance can be estimated
+STRATUM_COLUMNS = ["partition_month", "pickup_borough", "payment_type"]
+MIN_STRATUM_SAMPLE_ROWS = 10
+
+# the temporary table that holds the sampled trips of the month, for the largest sample
+SAMPLE_SOURCE_TABLE = "sample_source"
+
+# The dims that a sample query can group or filter by, as {dim: expression over the sample table}
+SAMPLE_DIMS = {
+    "partition_month": "partition_month",
+    "pickup_month": "partition_month",
+    "pickup_borough": "pickup_borough",
+    "payment_type": "payment_type",
+    "vendor_id": "vendor_id",
+    "rate_code_id": "rate_code_id",
+    "pickup_lid": "pickup_lid",
+    "dropoff_lid": "dropoff_lid",
+    "pickup_date": "pickup_dtime::DATE",
+    "pickup_hour_of_day": "DATEPART('hour', pickup_dtime)",
+    "pickup_dow": "DATEPART('dow', pickup_dtime)",
+}
+
+# The measures that can be estimated by `query_sample`, as {measure: (estimator, column)}. The names follow
+#   the measures of the rollups (see rollup_helpers.MEASURES)
+SAMPLE_MEASURES = {
+    "trip_count": ("count", None),
+    **{
+        column: ("sum", column)
+        for column in [
+            "passenger_count",
+            "trip_distance",
+            "fare_amount",
+            "tip_amount",
+            "total_amount",
+        ]
+    },
+    "avg_fare_amount": ("avg", "fare_amount"),
+    "avg_trip_distance": ("avg", "trip_distance"),
+    "avg_tip_amount": ("avg", "tip_amount"),
+}
+
+
+def get_stratum_sample_rows(stratum_rows: str, fraction: float) -> str:
+    """
+    The expression of the number of trips that are sampled from a stratum of `stratum_rows` trips
+    """
+    return (
+        f"LEAST({stratum_rows}, "
+        f"GREATEST(CEIL({stratum_rows} * {fraction})::BIGINT, {MIN_STRATUM_SAMPLE_ROWS}))"
+    )
+
+
+def query_create_sample_source(parquet_file: str, partition_month: str) -> str:
+    """
+    Reads the trips of the monthly parquet file with their pickup borough, and keeps the trips of the largest sample.
+
+    The trips of a stratum are ranked by the md5 of their `trip_id`, and every sample keeps the first trips of
+    the ranking. The samples are hence reproducible, across runs and DuckDB versions, and the smaller samples
+    are subsets of the larger ones
+    """
+    max_fraction = max(sample.fraction for sample in SAMPLES)
+    return f"""--sql
+        CREATE OR REPLACE TEMP TABLE {SAMPLE_SOURCE_TABLE} AS
+            SELECT
+                '{partition_month}'::DATE AS partition_month,
+                trips.*,
+                taxi_zone.borough::TEXT AS pickup_borough,
+                COUNT(*) OVER stratum AS stratum_rows,
+                ROW_NUMBER() OVER (stratum ORDER BY md5_number(trips.trip_id::TEXT), trips.trip_id)
+                    AS stratum_rank
+            FROM read_parquet('{parquet_file}') AS trips
+                LEFT JOIN {table_names.TAXI_ZONE_LOOKUP} AS taxi_zone
+                    ON trips.pickup_lid = taxi_zone.location_id
+            WINDOW stratum AS (PARTITION BY taxi_zone.borough, trips.payment_type)
+            QUALIFY stratum_rank <= {get_stratum_sample_rows("stratum_rows", max_fraction)};
+        """
+
+
+def query_upsert_sample_partition(
+    sample: Sample, partition_month: str, source: str = SAMPLE_SOURCE_TABLE
+) -> str:
+    """
+    Replaces the trips of `partition_month` in the sample table with the sampled trips of `source`. Every trip
+    keeps the size of its stratum (`stratum_rows`) and of its sample (`sample_rows`), which weight the estimates.
+    The trips of the month are replaced in one transaction
+    """
+    sample_rows = get_stratum_sample_rows("stratum_rows", sample.fraction)
+
+    return f"""--sql
+        CREATE TABLE IF NOT EXISTS {sample.table_name} AS
+            SELECT * EXCLUDE (stratum_rank), 0::BIGINT AS sample_rows
+            FROM {source}
+            LIMIT 0;
+
+        BEGIN TRANSACTION;
+
+        DELETE FROM {sample.table_name} WHERE partition_month = '{partition_month}';
+
+        INSERT INTO {sample.table_name} BY NAME
+            SELECT * EXCLUDE (stratum_rank), {sample_rows} AS sample_rows
+            FROM {source}
+            WHERE stratum_rank <= {sample_rows};
+
+        COMMIT;
+        """
+
+
+def query_sample(
+    conn: DuckDBPyConnection,
+    group_by: list[str],
+    measures: list[str],
+    filters: dict[str, object] | None = None,
+    sample: str = table_names.YELLOW_TAXI_TRIPS_SAMPLE_1_PCT,
+) -> "pd.DataFrame":
+    """
+    Estimates an aggregate query over all the trips from a stratified sample, e.g.,
+    `query_sample(conn, ["pickup_borough"], ["trip_count", "avg_fare_amount"], {"payment_type": [1, 2]})`.
+    `filters` are equality filters, or IN filters for list values, like `rollup_helpers.query_rollup`.
+
+    Every measure comes with its standard error, `<measure>_stderr`, i.e., the 95% confidence interval is about
+    `measure ± 1.96 * measure_stderr`. The counts and sums are the stratified estimates of the totals, and the
+    averages are ratio estimates, whose standard error is linearized
+    """
+    import numpy as np
+    import pandas as pd
+
+    filters = filters or {}
+    unknown_measures = set(measures) - set(SAMPLE_MEASURES)
+    if unknown_measures:
+        raise ValueError(f"Unknown measures: {sorted(unknown_measures)}")
+    unknown_dims = set([*group_by, *filters]) - set(SAMPLE_DIMS)
+    if unknown_dims:
+        raise ValueError(f"Unknown dims: {sorted(unknown_dims)}")
+
+    # The sums of y and y^2 per group and stratum are enough for the estimates and their variances. The trips
+    #   of a stratum outside of the group (or the filters) count as y = 0, hence the sample size of the stratum
+    #   is its stored `sample_rows`, and not the number of rows in the group
+    columns = sorted({column for _, column in map(SAMPLE_MEASURES.get, measures) if column})
+    group_columns = [f"{SAMPLE_DIMS[dim]} AS {dim}" for dim in group_by]
+    stratum_columns = [f"{col} AS __stratum_{col}" for col in STRATUM_COLUMNS]
+    sum_columns = [
+        f"SUM(COALESCE({col}, 0)) AS __sum_{col}, SUM(COALESCE({col}, 0) ^ 2) AS __sum2_{col}"
+        for col in columns
+    ]
+    where_clauses = []
+    params = []
+    for dim, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            where_clauses.append(
+                f"{SAMPLE_DIMS[dim]} IN ({', '.join('?' for _ in value)})"
+            )
+            params.extend(value)
+        else:
+            where_clauses.append(f"{SAMPLE_DIMS[dim]} = ?")
+            params.append(value)
+
+    query = f"""--sql
+        SELECT
+            {", ".join([*group_columns, *stratum_columns, *sum_columns])},
+            ANY_VALUE(stratum_rows)::DOUBLE AS __stratum_rows,
+            ANY_VALUE(sample_rows)::DOUBLE AS __sample_rows,
+            COUNT(*)::DOUBLE AS __count
+        FROM {sample}
+        {f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""}
+        GROUP BY ALL
+        """
+    strata = conn.execute(query, params).df()
+
+    N, n = strata["__stratum_rows"], strata["__sample_rows"]
+    weight = N / n
+    # the variance of a stratum total is N^2 * (1 - n/N) * s^2 / n, with the sample variance s^2 of y
+    variance_factor = N**2 * (1 - n / N) / n
+
+    def stratum_variance(sum_y, sum_y2):
+        return variance_factor * (sum_y2 - sum_y**2 / n).clip(lower=0) / np.maximum(
+            n - 1, 1
+        )
+
+    # the group of every (group, stratum) row, the strata are summed up per group
+    groups = (
+        strata.groupby(group_by, dropna=False, sort=True).ngroup()
+        if group_by
+        else np.zeros(len(strata), dtype=int)
+    )
+
+    def sum_per_group(values):
+        return values.groupby(groups).sum()
+
+    count = sum_per_group(weight * strata["__count"])
+    result = (
+        strata.groupby(group_by, dropna=False, sort=True).size().reset_index()[group_by]
+        if group_by
+        else pd.DataFrame(index=count.index)
+    )
+    for measure in measures:
+        estimator, column = SAMPLE_MEASURES[measure]
+        if estimator == "count":
+            sum_y = sum_y2 = strata["__count"]
+        else:
+            sum_y, sum_y2 = strata[f"__sum_{column}"], strata[f"__sum2_{column}"]
+
+        total = sum_per_group(weight * sum_y)
+        if estimator == "avg":
+            # the residuals e = y - R of the trips in the group, R being the estimated average of the group
+            ratio = (total / count).to_numpy()[groups]
+            sum_e = sum_y - ratio * strata["__count"]
+            sum_e2 = sum_y2 - 2 * ratio * sum_y + ratio**2 * strata["__count"]
+            estimate = total / count
+            variance = sum_per_group(stratum_variance(sum_e, sum_e2)) / count**2
+        else:
+            estimate = total
+            variance = sum_per_group(stratum_variance(sum_y, sum_y2))
+
+        result[measure] = estimate.to_numpy()
+        result[f"{measure}_stderr"] = np.sqrt(variance).to_numpy()
+
+    return result
@@ -0,0 +1,309 @@
+import math
+import os
+from typing import TYPE_CHECKING
+
+from ....partitions import monthly_partition
+
+if TYPE_CHECKING:
+    from numpy import ndarray
+    from pyarrow import Table
+
+# The quantile sketches are log-bucketed histograms (as in DDSketch): a value `x > 0` is counted in the bin
+#   `ceil(log_gamma(x))`, and every value of a bin is within QUANTILE_RELATIVE_ACCURACY of the value that the
+#   bin answers with. Sketches are merged by adding the counts of their bins
+QUANTILE_RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + QUANTILE_RELATIVE_ACCURACY) / (1 - QUANTILE_RELATIVE_ACCURACY)
+# the bin of the values <= 0, e.g., a dropoff time before the pickup time, which are answered as 0
+ZERO_BIN = -(2**31)
+QUANTILE_METRICS = ["fare_amount", "trip_distance", "duration_s"]
+# The quantile sketches are kept for the whole month, and per pickup hour and pickup zone. The durations are also
+#   kept per zone pair and pickup hour, whose group value is `get_zone_pair_hour(pickup_lid, dropoff_lid, hour)`.
+#   There are up to 24 times as many of these groups as zone pairs, so the other metrics are not kept by them
+GROUP_BY_COLUMNS = ["all", "pickup_hour", "pickup_lid", "zone_pair_hour"]
+GROUP_BY_METRICS = {
+    "all": QUANTILE_METRICS,
+    "pickup_hour": QUANTILE_METRICS,
+    "pickup_lid": QUANTILE_METRICS,
+    "zone_pair_hour": ["duration_s"],
+}
+
+# The distinct counts are HyperLogLog sketches with 2^HLL_PRECISION registers (~0.8% standard error).
+#   Sketches are merged by keeping the max of each register
+HLL_PRECISION = 14
+DISTINCT_METRICS = ["zone_pair"]
+
+SKETCH_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "sketches")
+
+
+def get_sketch_path(partition_key: str, sketch_dir: str = SKETCH_DIR) -> str:
+    return os.path.join(sketch_dir, f"{partition_key[:7]}.parquet")
+
+
+def get_zone_pair(pickup_lid, dropoff_lid):
+    return pickup_lid * 1000 + dropoff_lid
+
+
+def get_zone_pair_hour(pickup_lid, dropoff_lid, hour):
+    """
+    The group value of a zone pair and pickup hour, e.g., 13223607 for the trips from 132 to 236 picked up at 7.
+    Works on scalars and arrays alike
+    """
+    return get_zone_pair(pickup_lid, dropoff_lid) * 100 + hour
+
+
+def build_quantile_sketches(
+    values: "ndarray", groups: "ndarray", metric: str, group_by: str
+) -> "Table":
+    """
+    The non-empty bins of the quantile sketch of `values`, for each group of `groups`
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    values, groups = values[valid], np.asarray(groups, dtype=np.int64)[valid]
+
+    bins = np.full(len(values), ZERO_BIN, dtype=np.int64)
+    positive = values > 0
+    bins[positive] = np.ceil(np.log(values[positive]) / math.log(GAMMA))
+
+    # count the (group, bin) pairs at once, as a single int64 key of the group (high bits) and the bin (low bits)
+    keys, counts = np.unique(groups << 32 | (bins - ZERO_BIN), return_counts=True)
+    return to_sketch_table(
+        "quantile", metric, group_by, keys >> 32, (keys & 0xFFFFFFFF) + ZERO_BIN, counts
+    )
+
+
+def build_hll_sketch(hashes: "ndarray", metric: str) -> "Table":
+    """
+    The non-zero registers of the HyperLogLog sketch of the 64-bit `hashes`
+    """
+    import numpy as np
+
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    value_bits = 64 - HLL_PRECISION
+    registers = (hashes >> np.uint64(value_bits)).astype(np.int64)
+    values = hashes & np.uint64((1 << value_bits) - 1)
+
+    # the rank is the position of the leftmost 1 of the value bits, i.e., its leading zeros + 1
+    bit_length = np.zeros(len(values), dtype=np.int64)
+    non_zero = values > 0
+    bit_length[non_zero] = np.floor(np.log2(values[non_zero].astype(np.float64))) + 1
+    # the float conversion can round a value up to the next power of 2
+    overshoot = non_zero & (
+        (np.uint64(1) << (bit_length.clip(1) - 1).astype(np.uint64)) > values
+    )
+    bit_length[overshoot] -= 1
+    ranks = value_bits - bit_length + 1
+
+    max_ranks = np.zeros(1 << HLL_PRECISION, dtype=np.int64)
+    np.maximum.at(max_ranks, registers, ranks)
+    non_empty = np.flatnonzero(max_ranks)
+
+    return to_sketch_table(
+        "distinct",
+        metric,
+        "all",
+        np.full(len(non_empty), -1),
+        non_empty,
+        max_ranks[non_empty],
+    )
+
+
+def to_sketch_table(
+    kind: str,
+    metric: str,
+    group_by: str,
+    group_values: "ndarray",
+    bins: "ndarray",
+    counts: "ndarray",
+) -> "Table":
+    import pyarrow as pa
+
+    schema = get_sketch_schema()
+    num_rows = len(bins)
+    return pa.table(
+        {
+            "kind": pa.repeat(kind, num_rows).cast(schema["kind"]),
+            "metric": pa.repeat(metric, num_rows).cast(schema["metric"]),
+            "group_by": pa.repeat(group_by, num_rows).cast(schema["group_by"]),
+            "group_value": pa.array(group_values, schema["group_value"]),
+            "bin": pa.array(bins, schema["bin"]),
+            "count": pa.array(counts, schema["count"]),
+        }
+    )
+
+
+def build_monthly_sketches(trips: "Table") -> "Table":
+    """
+    The quantile and distinct count sketches of the trips of a month, as one sparse table of
+    `(kind, metric, group_by, group_value, bin, count)` rows
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pandas.util import hash_array
+
+    def to_numpy(column: str, dtype) -> "ndarray":
+        return pc.cast(trips[column], dtype).to_numpy(zero_copy_only=False)
+
+    # the timestamps are cast to seconds, so the standard and the compact schema give the same durations
+    pickup_s = to_numpy("pickup_dtime", pa.timestamp("s")).astype(np.int64)
+    dropoff_s = to_numpy("dropoff_dtime", pa.timestamp("s")).astype(np.int64)
+    metric_values = {
+        # the money columns are decimals in the compact schema
+        "fare_amount": to_numpy("fare_amount", pa.float64()),
+        "trip_distance": to_numpy("trip_distance", pa.float64()),
+        "duration_s": (dropoff_s - pickup_s).astype(np.float64),
+    }
+    pickup_lid = to_numpy("pickup_lid", pa.int64())
+    pickup_hour = (pickup_s // 3600) % 24
+    zone_pairs = get_zone_pair(pickup_lid, to_numpy("dropoff_lid", pa.int64()))
+    group_values = {
+        "all": np.full(trips.num_rows, -1, dtype=np.int64),
+        "pickup_hour": pickup_hour,
+        "pickup_lid": pickup_lid,
+        "zone_pair_hour": zone_pairs * 100 + pickup_hour,
+    }
+
+    sketches = []
+    for group_by, groups in group_values.items():
+        for metric in GROUP_BY_METRICS[group_by]:
+            sketches.append(
+                build_quantile_sketches(metric_values[metric], groups, metric, group_by)
+            )
+
+    sketches.append(build_hll_sketch(hash_array(zone_pairs), "zone_pair"))
+
+    # the dictionaries of the string columns are unified, so they are stored once per row group
+    return pa.concat_tables(sketches).unify_dictionaries().combine_chunks()
+
+
+def get_sketch_schema() -> dict:
+    import pyarrow as pa
+
+    return {
+        "kind": pa.dictionary(pa.int8(), pa.string()),
+        "metric": pa.dictionary(pa.int8(), pa.string()),
+        "group_by": pa.dictionary(pa.int8(), pa.string()),
+        "group_value": pa.int32(),
+        "bin": pa.int32(),
+        "count": pa.int64(),
+    }
+
+
+def get_sketch_files(
+    start_partition_key: str, end_partition_key: str, sketch_dir: str = SKETCH_DIR
+) -> list[str]:
+    """
+    The sketch files of the partitions within `[start_partition_key, end_partition_key]`
+    """
+    partition_keys = monthly_partition.get_partition_keys()
+    selected = [
+        key for key in partition_keys if start_partition_key <= key <= end_partition_key
+    ]
+    return [
+        path
+        for path in (get_sketch_path(key, sketch_dir) for key in selected)
+        if os.path.exists(path)
+    ]
+
+
+def query_quantiles(
+    sketch_files: list[str],
+    metric: str,
+    quantiles: list[float],
+    group_by: str = "all",
+    group_values: list[int] | None = None,
+) -> dict[int, list[float]]:
+    """
+    Merge the quantile sketches of `metric` over the sketch files, and answer `quantiles` for every group
+    of `group_by`, e.g., `{7: [p50, p95]}` for the pickup hour 7. The group of `group_by="all"` is -1.
+
+    The p95 trip duration per zone pair per hour is
+    `query_quantiles(files, "duration_s", [0.95], "zone_pair_hour", [get_zone_pair_hour(132, 236, 7), ...])`,
+    `group_values` answering only for the given groups instead of all of them
+    """
+    import duckdb
+    import numpy as np
+
+    if group_by not in GROUP_BY_COLUMNS or metric not in GROUP_BY_METRICS[group_by]:
+        raise ValueError(
+            f"Unknown quantile sketch {metric!r} by {group_by!r}, use one of {GROUP_BY_METRICS}"
+        )
+    if not sketch_files:
+        raise ValueError("There are no sketch files to query")
+
+    group_filter = (
+        f"AND group_value IN ({', '.join(str(int(value)) for value in group_values)})"
+        if group_values
+        else ""
+    )
+    merged = duckdb.sql(
+        f"""--sql
+        SELECT group_value, bin, sum(count) AS count
+        FROM read_parquet({sketch_files})
+        WHERE kind = 'quantile' AND metric = '{metric}' AND group_by = '{group_by}'
+            {group_filter}
+        GROUP BY ALL
+        ORDER BY group_value, bin
+        """
+    ).fetchnumpy()
+
+    answers = {}
+    groups, starts = np.unique(merged["group_value"], return_index=True)
+    for group, start, end in zip(groups, starts, [*starts[1:], len(merged["bin"])]):
+        bins = merged["bin"][start:end]
+        cumulative_counts = np.cumsum(merged["count"][start:end])
+        # the bin of a quantile is the first bin whose cumulative count reaches the rank of the quantile
+        ranks = np.array([q * (cumulative_counts[-1] - 1) for q in quantiles])
+        quantile_bins = bins[np.searchsorted(cumulative_counts, ranks, side="right")]
+        answers[int(group)] = [get_bin_value(int(bin)) for bin in quantile_bins]
+
+    return answers
+
+
+def get_bin_value(bin: int) -> float:
+    """
+    The value that a bin answers with, which is within the relative accuracy of every value of the bin
+    """
+    if bin == ZERO_BIN:
+        return 0.0
+    return 2 * GAMMA**bin / (GAMMA + 1)
+
+
+def query_distinct_count(sketch_files: list[str], metric: str = "zone_pair") -> int:
+    """
+    Merge the HyperLogLog sketches of `metric` over the sketch files, and estimate the distinct count
+    """
+    import duckdb
+
+    if metric not in DISTINCT_METRICS:
+        raise ValueError(f"Unknown distinct count sketch {metric!r}, use one of {DISTINCT_METRICS}")
+    if not sketch_files:
+        raise ValueError("There are no sketch files to query")
+
+    registers = duckdb.sql(
+        f"""--sql
+        SELECT bin, max(count) AS rank
+        FROM read_parquet({sketch_files})
+        WHERE kind = 'distinct' AND metric = '{metric}'
+        GROUP BY bin
+        """
+    ).fetchall()
+
+    return estimate_hll_cardinality({register: rank for register, rank in registers})
+
+
+def estimate_hll_cardinality(ranks: dict[int, int]) -> int:
+    num_registers = 1 << HLL_PRECISION
+    alpha = 0.7213 / (1 + 1.079 / num_registers)
+    empty_registers = num_registers - len(ranks)
+    harmonic_sum = empty_registers + sum(2.0**-rank for rank in ranks.values())
+    estimate = alpha * num_registers**2 / harmonic_sum
+
+    # linear counting is more accurate for the small cardinalities
+    if estimate <= 2.5 * num_registers and empty_registers > 0:
+        estimate = num_registers * math.log(num_registers / empty_registers)
+
+    return round(estimate)
@@ -0,0 +1,101 @@
+import datetime
+import glob
+import hashlib
+import json
+import os
+
+from duckdb import DuckDBPyConnection
+
+from .table_helpers import TABLE_VERSIONS
+
+# The snapshots are read-only copies of the warehouse, which the query service reads from while the pipeline
+#   writes to the warehouse. CURRENT_SNAPSHOT_FILE points to the latest snapshot, and is replaced atomically
+SNAPSHOT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "models", "snapshots"
+)
+CURRENT_SNAPSHOT_FILE = "CURRENT.json"
+# the previous snapshots are kept for the queries that are still running on them
+SNAPSHOTS_TO_KEEP = 2
+
+
+def get_table_versions(conn: DuckDBPyConnection) -> dict[str, int]:
+    exists = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND database_name = current_database()",
+        [TABLE_VERSIONS],
+    ).fetchone()[0]
+    if not exists:
+        return {}
+
+    return dict(
+        conn.execute(f"SELECT table_name, version FROM {TABLE_VERSIONS}").fetchall()
+    )
+
+
+def get_version_stamp(table_versions: dict[str, int]) -> str:
+    """
+    A short stamp of the versions of every table, which changes whenever a table is written
+    """
+    versions = json.dumps(table_versions, sort_keys=True).encode()
+    return hashlib.sha1(versions).hexdigest()[:12]
+
+
+def read_current_snapshot(snapshot_dir: str = SNAPSHOT_DIR) -> dict | None:
+    """
+    The latest published snapshot: its `database`, `version_stamp`, `table_versions` and `published_at`.
+    Returns `None` if no snapshot was published
+    """
+    current_file = os.path.join(snapshot_dir, CURRENT_SNAPSHOT_FILE)
+    if not os.path.exists(current_file):
+        return None
+
+    with open(current_file) as f:
+        snapshot = json.load(f)
+    snapshot["database"] = os.path.join(snapshot_dir, snapshot["database"])
+    return snapshot
+
+
+def publish_snapshot(
+    conn: DuckDBPyConnection, snapshot_dir: str = SNAPSHOT_DIR
+) -> dict:
+    """
+    Copy the warehouse of `conn` to a new snapshot file, and point CURRENT_SNAPSHOT_FILE to it.
+    `conn` must hold the write lock of the warehouse, so no table changes during the copy
+    """
+    table_versions = get_table_versions(conn)
+    version_stamp = get_version_stamp(table_versions)
+    published_at = datetime.datetime.now(datetime.timezone.utc)
+    database = f"taxi_trip_records_{published_at:%Y%m%dT%H%M%S}_{version_stamp}.duckdb"
+    snapshot_file = os.path.join(snapshot_dir, database)
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    # the snapshot is written to a temporary file, so a failed copy is never published
+    for stale_file in [f"{snapshot_file}.tmp", f"{snapshot_file}.tmp.wal"]:
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+    database_name = conn.execute("SELECT current_database()").fetchone()[0]
+    conn.execute(f"ATTACH '{snapshot_file}.tmp' AS snapshot")
+    try:
+        conn.execute(f"COPY FROM DATABASE {database_name} TO snapshot")
+    finally:
+        conn.execute("DETACH snapshot")
+    os.replace(f"{snapshot_file}.tmp", snapshot_file)
+
+    snapshot = {
+        "database": database,
+        "version_stamp": version_stamp,
+        "table_versions": table_versions,
+        "published_at": published_at.isoformat(),
+    }
+    current_file = os.path.join(snapshot_dir, CURRENT_SNAPSHOT_FILE)
+    with open(f"{current_file}.tmp", "w") as f:
+        json.dump(snapshot, f)
+    os.replace(f"{current_file}.tmp", current_file)
+
+    # the snapshots are named by their publish time, so the oldest ones sort first
+    snapshot_files = sorted(
+        glob.glob(os.path.join(snapshot_dir, "taxi_trip_records_*.duckdb"))
+    )
+    for old_snapshot_file in snapshot_files[:-SNAPSHOTS_TO_KEEP]:
+        os.remove(old_snapshot_file)
+
+    return {**snapshot, "database": snapshot_file}
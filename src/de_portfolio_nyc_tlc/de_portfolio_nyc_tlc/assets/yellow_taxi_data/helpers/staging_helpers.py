@@ -0,0 +1,314 @@
+import os
+from typing import TYPE_CHECKING
+
+from duckdb import DuckDBPyConnection
+
+from ..constants import table_names
+from . import cdc_helpers as cdc_helper
+from .parquet_asset_helpers import TRIP_ID_MONTH_MULTIPLIER
+from .trip_schema_helpers import query_create_trips_table
+
+if TYPE_CHECKING:
+    from uuid import UUID
+
+    import pyarrow as pa
+
+# Every month is staged in its own DuckDB file, so the months are loaded by parallel steps without waiting for
+#   the lock of the warehouse. The staged months are then published to yellow_taxi_trips in a single transaction
+STAGING_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "models", "staging"
+)
+# the table of the trips of the month, within its staging file
+STAGING_TABLE = "staged_trips"
+# the version of the staged trips, within the staging file. It is replaced whenever the staged trips are written
+STAGING_VERSION_TABLE = "staging_version"
+# the staging version of every month that yellow_taxi_trips was published from, in the warehouse. A publish only
+#   replaces the months whose staging version changed since
+PUBLISHED_MONTHS = "published_staged_months"
+
+
+def get_staging_path(partition_key: str, staging_dir: str = STAGING_DIR) -> str:
+    month = partition_key[:7]
+    return os.path.join(staging_dir, f"{month}.duckdb")
+
+
+def get_staging_alias(partition_key: str) -> str:
+    """
+    The name the staging file of the month is attached as, e.g., `staging_2022_01`
+    """
+    return "staging_" + partition_key[:7].replace("-", "_")
+
+
+def query_set_staging_version() -> str:
+    return f"""--sql
+        CREATE OR REPLACE TABLE {STAGING_VERSION_TABLE} AS
+            SELECT gen_random_uuid() AS version;
+        """
+
+
+def query_create_staging_table(order_by: str) -> str:
+    """
+    Loads the registered `monthly_trips`, except for the registered `duplicate_trips`, into the staging table
+    """
+    return f"""--sql
+        {query_create_trips_table(STAGING_TABLE)}
+
+        INSERT INTO {STAGING_TABLE} BY NAME
+            SELECT * FROM monthly_trips
+            ANTI JOIN duplicate_trips USING (trip_id)
+            {order_by};
+
+        {query_set_staging_version()}
+        """
+
+
+def merge_changes_into_staged_month(
+    partition_key: str,
+    changed_ids: list[str],
+    changed_trips: "pa.Table",
+    staging_dir: str = STAGING_DIR,
+) -> bool:
+    """
+    Merge the changes of a month (see `cdc_helpers.merge_monthly_changes`) into its staging file as well, since
+    publishing the staged months replaces yellow_taxi_trips. Returns `False` if the month is not staged
+    """
+    import duckdb
+    import pyarrow as pa
+
+    staging_file = get_staging_path(partition_key, staging_dir)
+    if not os.path.exists(staging_file):
+        return False
+
+    with duckdb.connect(staging_file) as conn:
+        conn.register(
+            cdc_helper.CHANGED_IDS,
+            pa.table({"socrata_id": pa.array(changed_ids, pa.string())}),
+        )
+        conn.register(cdc_helper.CHANGED_TRIPS, changed_trips)
+        # the version is replaced first: if the merge fails, the month is only published again without changes
+        conn.sql(query_set_staging_version())
+        conn.sql(cdc_helper.query_merge_changes(STAGING_TABLE))
+
+    return True
+
+
+def validate_staged_month(
+    conn: DuckDBPyConnection, partition_key: str, expected_rows: int
+) -> dict[str, bool]:
+    """
+    The validations of the staged trips of a month, which are all `True` for a month that can be published
+    """
+    year, month = partition_key.split("-")[:2]
+    month_prefix = int(f"{year}{month}")
+    rows, distinct_trip_ids, other_month_trips, null_pickups = conn.execute(
+        f"""--sql
+        SELECT
+            COUNT(*),
+            COUNT(DISTINCT trip_id),
+            COUNT(*) FILTER (trip_id // {TRIP_ID_MONTH_MULTIPLIER} != {month_prefix}),
+            COUNT(*) FILTER (pickup_dtime IS NULL)
+        FROM {STAGING_TABLE}
+        """
+    ).fetchone()
+
+    return {
+        "has_trips": rows > 0,
+        "has_expected_row_count": rows == expected_rows,
+        "has_unique_trip_ids": distinct_trip_ids == rows,
+        "has_only_trips_of_the_month": other_month_trips == 0,
+        "has_pickup_times": null_pickups == 0,
+    }
+
+
+def get_staging_versions(
+    conn: DuckDBPyConnection, partition_keys: list[str]
+) -> dict[str, "UUID | None"]:
+    """
+    The staging version of every month, from its attached staging file (see `get_staging_alias`). The months
+    staged before the staging files were versioned have no version
+    """
+    versioned = {
+        database_name
+        for database_name, in conn.execute(
+            "SELECT database_name FROM duckdb_tables() WHERE table_name = ?",
+            [STAGING_VERSION_TABLE],
+        ).fetchall()
+    }
+    versions = {}
+    for key in partition_keys:
+        alias = get_staging_alias(key)
+        versions[key] = (
+            conn.execute(f"SELECT version FROM {alias}.{STAGING_VERSION_TABLE}").fetchone()[0]
+            if alias in versioned
+            else None
+        )
+
+    return versions
+
+
+def get_published_versions(conn: DuckDBPyConnection) -> dict[str, "UUID | None"] | None:
+    """
+    The staging version of every month that yellow_taxi_trips was published from, or `None` if yellow_taxi_trips
+    was not published from the staged months, e.g., it was loaded by the other load mode
+    """
+    tables = {
+        table_name
+        for table_name, in conn.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = current_database()"
+        ).fetchall()
+    }
+    if not {table_names.YELLOW_TAXI_TRIPS, PUBLISHED_MONTHS} <= tables:
+        return None
+
+    return dict(
+        conn.execute(f"SELECT partition_key, staging_version FROM {PUBLISHED_MONTHS}").fetchall()
+    )
+
+
+def query_replace_trips(staged_trips: str, order_by: str) -> str:
+    """
+    Replaces yellow_taxi_trips with the `staged_trips` of every month
+    """
+    return f"""--sql
+        {query_create_trips_table(table_names.YELLOW_TAXI_TRIPS)}
+
+        INSERT INTO {table_names.YELLOW_TAXI_TRIPS} BY NAME
+            WITH staged_trips AS ({staged_trips})
+            SELECT * FROM staged_trips
+            QUALIFY socrata_id IS NULL
+                OR ROW_NUMBER() OVER (PARTITION BY socrata_id ORDER BY trip_id) = 1
+            {order_by};
+        """
+
+
+def query_replace_months(
+    staged_trips: str, changed_trips: str, month_prefixes: list[int], order_by: str
+) -> str:
+    """
+    Replaces the trips of the changed months of yellow_taxi_trips with their `changed_trips`, out of the
+    `staged_trips` of every month. The trips of the other months are only replaced when they share a Socrata
+    row id with the previous or the staged trips of a changed month, since which of the trips is kept
+    (see `publish_staged_months`) can then change
+    """
+    is_changed_month = (
+        f"trip_id // {TRIP_ID_MONTH_MULTIPLIER} IN ({', '.join(map(str, month_prefixes))})"
+    )
+    return f"""--sql
+        CREATE OR REPLACE TEMP TABLE changed_socrata_ids AS
+            SELECT socrata_id FROM {table_names.YELLOW_TAXI_TRIPS}
+            WHERE {is_changed_month} AND socrata_id IS NOT NULL
+            UNION
+            SELECT socrata_id FROM ({changed_trips})
+            WHERE socrata_id IS NOT NULL;
+
+        DELETE FROM {table_names.YELLOW_TAXI_TRIPS}
+            WHERE {is_changed_month}
+                OR socrata_id IN (SELECT socrata_id FROM changed_socrata_ids);
+
+        INSERT INTO {table_names.YELLOW_TAXI_TRIPS} BY NAME
+            WITH staged_trips AS ({staged_trips})
+            SELECT * FROM staged_trips
+            WHERE {is_changed_month}
+                OR socrata_id IN (SELECT socrata_id FROM changed_socrata_ids)
+            QUALIFY socrata_id IS NULL
+                OR ROW_NUMBER() OVER (PARTITION BY socrata_id ORDER BY trip_id) = 1
+            {order_by};
+
+        DROP TABLE changed_socrata_ids;
+        """
+
+
+def publish_staged_months(
+    conn: DuckDBPyConnection,
+    partition_keys: list[str],
+    order_by: str,
+    staging_dir: str = STAGING_DIR,
+) -> tuple[dict[str, int], list[str]]:
+    """
+    Publishes the staged trips of `partition_keys` to yellow_taxi_trips in a single transaction, so the table is
+    never partially loaded: a failure rolls back to the previous table.
+
+    Only the months that were staged again, or merged with changes, since the last publish are replaced, since the
+    single writer of the warehouse would otherwise re-insert every month for a change of one month. The table is
+    rebuilt from every month when it was not published from the staged months, or has months that are no longer
+    published. Replacing a month deletes its previous trips, whose space is reclaimed by taxi_trip_records_storage.
+
+    The duplicates within a month are left out by the staging step. Across months, a trip can only be seen twice
+    by its Socrata row id, since its natural key includes its pickup time, and the trip of the earlier month is kept.
+    Returns the number of published trips per month, and the months that were replaced
+    """
+    missing = [
+        key
+        for key in partition_keys
+        if not os.path.exists(get_staging_path(key, staging_dir))
+    ]
+    if missing:
+        raise ValueError(f"The months {missing} are not staged, materialize them first")
+
+    aliases = [get_staging_alias(key) for key in partition_keys]
+    for key, alias in zip(partition_keys, aliases):
+        conn.execute(f"ATTACH '{get_staging_path(key, staging_dir)}' AS {alias} (READ_ONLY)")
+    try:
+        staging_versions = get_staging_versions(conn, partition_keys)
+        published_versions = get_published_versions(conn)
+        if published_versions is None or not set(published_versions) <= set(partition_keys):
+            changed_keys = list(partition_keys)
+        else:
+            # the months without a staging version are always replaced
+            changed_keys = [
+                key
+                for key, version in staging_versions.items()
+                if version is None or published_versions.get(key) != version
+            ]
+
+        staged_trips = " UNION ALL BY NAME ".join(
+            f"SELECT * FROM {alias}.{STAGING_TABLE}" for alias in aliases
+        )
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            if changed_keys == list(partition_keys):
+                conn.execute(query_replace_trips(staged_trips, order_by))
+            elif changed_keys:
+                changed_trips = " UNION ALL BY NAME ".join(
+                    f"SELECT * FROM {get_staging_alias(key)}.{STAGING_TABLE}"
+                    for key in changed_keys
+                )
+                month_prefixes = [int(key[:7].replace("-", "")) for key in changed_keys]
+                conn.execute(
+                    query_replace_months(staged_trips, changed_trips, month_prefixes, order_by)
+                )
+            conn.execute(
+                f"""--sql
+                CREATE OR REPLACE TABLE {PUBLISHED_MONTHS} (
+                    partition_key VARCHAR PRIMARY KEY,
+                    staging_version UUID
+                );
+                """
+            )
+            conn.executemany(
+                f"INSERT INTO {PUBLISHED_MONTHS} VALUES (?, ?)",
+                [[key, version] for key, version in staging_versions.items()],
+            )
+            rows_per_month = dict(
+                conn.execute(
+                    f"""--sql
+                    SELECT
+                        strftime(
+                            strptime((trip_id // {TRIP_ID_MONTH_MULTIPLIER})::TEXT, '%Y%m'), '%Y-%m-%d'
+                        ),
+                        COUNT(*)
+                    FROM {table_names.YELLOW_TAXI_TRIPS}
+                    GROUP BY 1
+                    ORDER BY 1
+                    """
+                ).fetchall()
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        for alias in aliases:
+            conn.execute(f"DETACH {alias}")
+
+    return rows_per_month, changed_keys
@@ -0,0 +1,57 @@
+import os
+
+from duckdb import DuckDBPyConnection
+
+# the database is compacted once this fraction of its file is free blocks, e.g., the blocks of the tables
+#   dropped by `CREATE OR REPLACE TABLE`, which DuckDB reuses but only gives back at the end of the file
+COMPACTION_FRAGMENTATION_THRESHOLD = 0.25
+
+
+def get_storage_stats(conn: DuckDBPyConnection, database: str) -> dict[str, int | float]:
+    """
+    Checkpoint the database, so the WAL is written to the file, and measure its live and free bytes
+    """
+    conn.execute("CHECKPOINT")
+    block_size, used_blocks = conn.execute(
+        """--sql
+        SELECT block_size, used_blocks
+        FROM pragma_database_size()
+        WHERE database_name = current_database()
+        """
+    ).fetchone()
+
+    # the free blocks at the end of the file are truncated, but still counted by `pragma_database_size`,
+    #   so the free bytes are the bytes of the file that are not live
+    file_bytes = os.path.getsize(database)
+    live_bytes = used_blocks * block_size
+    free_bytes = max(file_bytes - live_bytes, 0)
+    return {
+        "file_bytes": file_bytes,
+        "live_bytes": live_bytes,
+        "free_bytes": free_bytes,
+        "fragmentation": round(free_bytes / file_bytes, 4) if file_bytes else 0.0,
+    }
+
+
+def compact_database(conn: DuckDBPyConnection, database: str) -> None:
+    """
+    Copy the database to a fresh file, which only has the live blocks, and swap it with the database.
+    `conn` must be the only connection to the database (i.e., hold its write lock), and be checkpointed
+    (see `get_storage_stats`), so no WAL is left behind for the fresh file
+    """
+    compacted_file = f"{database}.compacted"
+    for stale_file in [compacted_file, f"{compacted_file}.wal"]:
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+
+    database_name = conn.execute("SELECT current_database()").fetchone()[0]
+    conn.execute(f"ATTACH '{compacted_file}' AS compacted")
+    try:
+        conn.execute(f"COPY FROM DATABASE {database_name} TO compacted")
+    finally:
+        # detaching checkpoints the fresh file
+        conn.execute("DETACH compacted")
+
+    # The swap is atomic, and done while `conn` still holds the lock of the old file: the processes waiting
+    #   for the lock open the fresh file, and `conn` only reads the old one, which is deleted once it is closed
+    os.replace(compacted_file, database)
@@ -2,19 +2,7 @@ from dagster import MetadataValue
 from duckdb import DuckDBPyConnection
 
 
-def get_table_metadata(conn: DuckDBPyConnection, table_name: str, limit=20):
-    conn.sql(
-        f"""--sql
-                SELECT * FROM {table_name} LIMIT {limit}
-            """
-    ).show()
-    result = conn.sql(
-        f"""--sql
-            SELECT * FROM {table_name} LIMIT {limit}
-        """
-    ).to_df()
-    print(result.dtypes)
-
+def get_table_metadata(conn: DuckDBPyConnection, table_name: str):
     # Metadata
     count_total_records = (
         conn.sql(
@@ -25,5 +13,40 @@ def get_table_metadata(conn: DuckDBPyConnection, table_name: str, limit=20):
         .to_df()
         .at[0, "total_count"]
     )
+    # the column names and types, in place of printing a preview of the table
+    col_info_json = {
+        col_name: col_type
+        for col_name, col_type, *_ in conn.sql(f"DESCRIBE {table_name}").fetchall()
+    }
+
+    return {
+        "Count of total records": MetadataValue.text(f"{count_total_records:,}"),
+        "Column info": MetadataValue.json(col_info_json),
+    }
+
+
+# the version of every table of the warehouse, bumped by the assets that write the table. The query service
+#   caches its results by the versions of the published snapshot (see helpers.snapshot_helpers)
+TABLE_VERSIONS = "table_versions"
+
+
+def bump_table_version(conn: DuckDBPyConnection, table_name: str) -> int:
+    """
+    Increment the version of `table_name` after it is written, and return the new version
+    """
+    conn.execute(
+        f"""--sql
+        CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS} (
+            table_name VARCHAR PRIMARY KEY,
+            version BIGINT,
+            updated_at TIMESTAMP WITH TIME ZONE
+        );
+
+        INSERT INTO {TABLE_VERSIONS} VALUES ('{table_name}', 1, now())
+            ON CONFLICT (table_name) DO UPDATE SET version = version + 1, updated_at = now();
+        """
+    )
 
-    return {"Count of total records": MetadataValue.text(f"{count_total_records:,}")}
+    return conn.execute(
+        f"SELECT version FROM {TABLE_VERSIONS} WHERE table_name = '{table_name}'"
+    ).fetchone()[0]
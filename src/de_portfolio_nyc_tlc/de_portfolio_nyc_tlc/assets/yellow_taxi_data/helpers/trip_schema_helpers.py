@@ -0,0 +1,88 @@
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# The types of the trips in the parquet files, yellow_taxi_trips and the dims:
+#   "standard": the money columns as DOUBLE and the timestamps at microsecond (nanosecond in parquet) precision
+#   "compact": the money columns as DECIMAL(9, 2), which DuckDB stores as 32-bit integers, and the timestamps
+#       at second precision. The TLC data is recorded in cents and seconds, so nothing is lost
+TRIPS_SCHEMA = os.getenv("TRIPS_SCHEMA", "standard")
+
+MONEY_COLUMNS = [
+    "fare_amount",
+    "extra",
+    "mta_tax",
+    "tip_amount",
+    "tolls_amount",
+    "improvement_surcharge",
+    "total_amount",
+    "congestion_surcharge",
+    "airport_fee",
+]
+TIMESTAMP_COLUMNS = ["pickup_dtime", "dropoff_dtime"]
+
+SCHEMA_TYPES = {
+    "standard": {"money": "DOUBLE", "timestamp": "TIMESTAMP"},
+    "compact": {"money": "DECIMAL(9, 2)", "timestamp": "TIMESTAMP_S"},
+}
+# the DuckDB types of the money and timestamp columns
+MONEY_TYPE = SCHEMA_TYPES[TRIPS_SCHEMA]["money"]
+TIMESTAMP_TYPE = SCHEMA_TYPES[TRIPS_SCHEMA]["timestamp"]
+
+
+def query_create_trips_table(table_name: str) -> str:
+    """
+    Creates (or replaces) an empty table with the columns of yellow_taxi_trips, in the types of TRIPS_SCHEMA
+    """
+    return f"""--sql
+    CREATE OR REPLACE TABLE {table_name} (
+        trip_id BIGINT,
+        socrata_id VARCHAR,
+        vendor_id TINYINT,
+        pickup_dtime {TIMESTAMP_TYPE},
+        dropoff_dtime {TIMESTAMP_TYPE},
+        passenger_count TINYINT,
+        trip_distance DOUBLE,
+        rate_code_id TINYINT,
+        store_and_fwd_flag TINYINT,
+        pickup_lid SMALLINT,
+        dropoff_lid SMALLINT,
+        payment_type TINYINT,
+        fare_amount {MONEY_TYPE},
+        extra {MONEY_TYPE},
+        mta_tax {MONEY_TYPE},
+        tip_amount {MONEY_TYPE},
+        tolls_amount {MONEY_TYPE},
+        improvement_surcharge {MONEY_TYPE},
+        total_amount {MONEY_TYPE},
+        congestion_surcharge {MONEY_TYPE},
+        airport_fee {MONEY_TYPE},
+        __index_level_0__ BIGINT
+    );
+    """
+
+
+def compact_trips_table(table: "pa.Table") -> "pa.Table":
+    """
+    Convert the money columns of the cleaned trips to `decimal(9, 2)` and the timestamps to seconds
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for column in MONEY_COLUMNS + TIMESTAMP_COLUMNS:
+        index = table.schema.get_field_index(column)
+        if index == -1:
+            continue
+
+        if column in MONEY_COLUMNS:
+            # round first, the float representation of the cents can have trailing digits
+            compacted = pc.round(table[column], 2).cast(pa.decimal128(9, 2))
+        else:
+            compacted = pc.floor_temporal(table[column], unit="second").cast(
+                pa.timestamp("s")
+            )
+        table = table.set_column(index, column, compacted)
+
+    return table
@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+
+from duckdb import DuckDBPyConnection
+import numpy as np
+import pandas as pd
+
+from ..constants import table_names
+
+ZONE_LOOKUP_COLUMNS = ["borough", "zone", "service_zone"]
+
+
+@dataclass
+class ZoneLookupArrays:
+    """
+    In-memory, dictionary-encoded copy of taxi_zone_lookup for vectorized enrichment of location IDs.
+    For every lookup column, `codes[col]` is indexed by the location ID and points to `categories[col]`.
+    Location IDs that are not in the lookup have a code of -1, i.e., a missing value
+    """
+
+    codes: dict[str, np.ndarray]
+    categories: dict[str, pd.Index]
+
+    def enrich(self, location_ids, column: str) -> pd.Categorical:
+        location_ids = np.asarray(location_ids)
+        codes = self.codes[column]
+
+        # location IDs outside of the lookup's range are treated as missing values
+        in_range = (location_ids >= 0) & (location_ids < len(codes))
+        location_codes = np.full(len(location_ids), -1, dtype=codes.dtype)
+        location_codes[in_range] = codes[location_ids[in_range]]
+
+        return pd.Categorical.from_codes(
+            location_codes, categories=self.categories[column]
+        )
+
+    def enrich_all(self, location_ids, prefix: str = "") -> pd.DataFrame:
+        """
+        Returns the lookup columns of `location_ids` as a dataframe, e.g., `prefix="pickup_"` results
+        to the columns `pickup_borough`, `pickup_zone`, and `pickup_service_zone`
+        """
+        return pd.DataFrame(
+            {
+                f"{prefix}{column}": self.enrich(location_ids, column)
+                for column in ZONE_LOOKUP_COLUMNS
+            }
+        )
+
+
+def load_zone_lookup_arrays(conn: DuckDBPyConnection) -> ZoneLookupArrays:
+    """
+    Reads taxi_zone_lookup once. The ENUM columns arrive as pandas categoricals, so the dictionary
+    encoding of the table is reused as-is
+    """
+    df = conn.sql(
+        f"""--sql
+        SELECT location_id, {", ".join(ZONE_LOOKUP_COLUMNS)}
+        FROM {table_names.TAXI_ZONE_LOOKUP}
+        """
+    ).df()
+    location_ids = df["location_id"].to_numpy()
+
+    codes = {}
+    categories = {}
+    for column in ZONE_LOOKUP_COLUMNS:
+        values = df[column].astype("category")
+        # -1 for the location IDs that are not in the lookup
+        column_codes = np.full(location_ids.max() + 1, -1, dtype=np.int16)
+        column_codes[location_ids] = values.cat.codes.to_numpy()
+
+        codes[column] = column_codes
+        categories[column] = values.cat.categories
+
+    return ZoneLookupArrays(codes=codes, categories=categories)
@@ -1,8 +1,10 @@
 from dagster import job
-from ..ops.csv_assets_ops import get_list_of_csv, verify_row_count
+from ..ops.csv_assets_ops import reconcile_row_counts
 
 
-@job
-def check_row_count():
-    csv_list = get_list_of_csv()
-    verify_row_count(csv_list)
+@job(
+    description="""Reconcile the row counts of the downloaded csv files of 2022 with the source, month by month.
+    The drift of each month is logged as an observation of its YT_monthly_csv_2022 partition"""
+)
+def reconcile_YT_row_counts_2022_job():
+    reconcile_row_counts()
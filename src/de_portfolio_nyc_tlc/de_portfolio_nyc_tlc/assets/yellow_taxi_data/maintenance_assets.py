@@ -0,0 +1,143 @@
+import os
+
+from dagster import (
+    AssetExecutionContext,
+    Config,
+    MaterializeResult,
+    MetadataValue,
+    asset,
+)
+
+from .table_assets import taxi_zone_lookup_table
+from .constants import asset_names
+
+from .helpers import dim_table_helpers as dim_helper
+from .helpers import rollup_helpers as rollup_helper
+from .helpers import sample_helpers as sample_helper
+from .helpers import snapshot_helpers as snapshot_helper
+from .helpers import storage_helpers as helper
+
+from ...concurrency import DUCKDB_WRITER_OP_TAGS
+from ...resources import RetryingDuckDBResource
+
+
+class StorageCompactionConfig(Config):
+    # compact once this fraction of the database file is free blocks
+    fragmentation_threshold: float = helper.COMPACTION_FRAGMENTATION_THRESHOLD
+    # compact whatever the fragmentation is
+    force: bool = False
+
+
+@asset(
+    # the dim assets have the same keys in both DIM_BUILD_MODEs
+    deps=[
+        asset_names.TABLE_YT_TRIP_RECORDS_2022,
+        taxi_zone_lookup_table,
+        *dim_helper.DIM_DESCRIPTIONS,
+    ],
+    description="""
+        The storage of `taxi_trip_records.duckdb`. Checkpoints the database after the `CREATE OR REPLACE`
+        rebuilds of its tables, and compacts it into a fresh file once its free blocks pass the threshold
+        """,
+    op_tags=DUCKDB_WRITER_OP_TAGS,
+)
+def taxi_trip_records_storage(
+    context: AssetExecutionContext,
+    config: StorageCompactionConfig,
+    duckdb: RetryingDuckDBResource,
+) -> MaterializeResult:
+    MB = 1_000_000
+
+    with duckdb.get_connection() as conn:
+        before = helper.get_storage_stats(conn, duckdb.database)
+        context.log.info(
+            f"{duckdb.database}: {before['file_bytes'] / MB:,.1f} MB on disk,"
+            f" {before['live_bytes'] / MB:,.1f} MB live, {before['fragmentation']:.1%} free"
+        )
+
+        compact = config.force or before["fragmentation"] >= config.fragmentation_threshold
+        if compact:
+            helper.compact_database(conn, duckdb.database)
+
+    after = before
+    if compact:
+        with duckdb.get_connection() as conn:
+            after = helper.get_storage_stats(conn, duckdb.database)
+        context.log.info(
+            f"Compacted {duckdb.database} to {after['file_bytes'] / MB:,.1f} MB"
+        )
+
+    # the trend of the file size across the materializations
+    metadata = {}
+    previous = context.instance.get_latest_materialization_event(context.asset_key)
+    if previous and previous.asset_materialization:
+        previous_file_mb = previous.asset_materialization.metadata.get("File size (MB)")
+        if previous_file_mb is not None:
+            metadata["File size change since last run (MB)"] = MetadataValue.float(
+                round(after["file_bytes"] / MB - previous_file_mb.value, 2)
+            )
+
+    return MaterializeResult(
+        metadata={
+            "File size (MB)": MetadataValue.float(round(after["file_bytes"] / MB, 2)),
+            "Live size (MB)": MetadataValue.float(round(after["live_bytes"] / MB, 2)),
+            "File size before compaction (MB)": MetadataValue.float(
+                round(before["file_bytes"] / MB, 2)
+            ),
+            "Fragmentation": MetadataValue.float(before["fragmentation"]),
+            "Compacted": MetadataValue.bool(compact),
+            "Reclaimed (MB)": MetadataValue.float(
+                round((before["file_bytes"] - after["file_bytes"]) / MB, 2)
+            ),
+            **metadata,
+        }
+    )
+
+
+class SnapshotConfig(Config):
+    # where the query service reads the snapshots from
+    snapshot_dir: str = snapshot_helper.SNAPSHOT_DIR
+
+
+@asset(
+    deps=[
+        taxi_trip_records_storage,
+        *[rollup.table_name for rollup in rollup_helper.ROLLUPS],
+        *[sample.table_name for sample in sample_helper.SAMPLES],
+    ],
+    description="""
+        The read-only snapshot of `taxi_trip_records.duckdb` that the query service reads from. A new snapshot
+        is published once a table was written since the current one, i.e., its `table_versions` changed
+        """,
+    op_tags=DUCKDB_WRITER_OP_TAGS,
+)
+def taxi_trip_records_snapshot(
+    context: AssetExecutionContext,
+    config: SnapshotConfig,
+    duckdb: RetryingDuckDBResource,
+) -> MaterializeResult:
+    current = snapshot_helper.read_current_snapshot(config.snapshot_dir)
+
+    with duckdb.get_connection() as conn:
+        table_versions = snapshot_helper.get_table_versions(conn)
+        version_stamp = snapshot_helper.get_version_stamp(table_versions)
+        published = current is None or current["version_stamp"] != version_stamp
+        if published:
+            current = snapshot_helper.publish_snapshot(conn, config.snapshot_dir)
+            context.log.info(f"Published {current['database']}")
+        else:
+            context.log.info(
+                f"No table was written since {current['database']} was published"
+            )
+
+    return MaterializeResult(
+        metadata={
+            "Snapshot": MetadataValue.path(current["database"]),
+            "Version stamp": MetadataValue.text(version_stamp),
+            "Table versions": MetadataValue.json(table_versions),
+            "Published": MetadataValue.bool(published),
+            "Snapshot size (MB)": MetadataValue.float(
+                round(os.path.getsize(current["database"]) / 1_000_000, 2)
+            ),
+        }
+    )
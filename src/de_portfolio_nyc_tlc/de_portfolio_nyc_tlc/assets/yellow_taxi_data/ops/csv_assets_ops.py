@@ -1,156 +1,276 @@
-import json
+import asyncio
+from datetime import date, timedelta
 import os
-from pathlib import Path, PosixPath
+import shutil
+from pathlib import Path
 from dagster import (
-    In,
+    AssetObservation,
+    Config,
+    DynamicOut,
+    DynamicOutput,
+    MetadataValue,
+    Nothing,
     OpExecutionContext,
     Out,
+    Output,
     op,
-    get_dagster_logger,
 )
-from httpx import AsyncClient, Response
-import pandas as pd
 
+from ..helpers import csv_asset_helpers as helper
+from ..helpers import parquet_asset_helpers as parquet_helper
+from ..helpers import row_count_helpers as row_count_helper
+from ... import constants
 from ....partitions import monthly_partition
 
+CSV_DATA_DIR = Path(os.path.dirname(__file__)).parent / "data" / "csv"
+# a day of 2022 has ~100k trips, so most of the day slices are fetched with a single request
+DAY_SLICE_RESPONSE_LIMIT = 200_000
+# the number of `count(*)` requests that are sent at the same time by the row count reconciliation
+MAX_CONCURRENT_COUNTS = 4
 
-@op
-def async_stream_download(client: AsyncClient):
 
-    pass
+def get_day_slices_dir(partition_key: str) -> Path:
+    month = partition_key[:7]
+    return CSV_DATA_DIR / "day_slices" / month
 
 
-@op(out={"start_date": Out(), "end_date": Out()})
-def get_monthly_range(context: OpExecutionContext) -> tuple[str, str]:
-    start_date: str = context.partition_key
-    end_date: str = (
-        monthly_partition.get_next_partition_key(start_date)
-        if start_date.split("-")[1] != "12"
-        else "2023-01-01"
-    )
+@op(out={"day_slices": DynamicOut(tuple), "watermark": Out()})
+def split_month_into_day_slices(context: OpExecutionContext):
+    """
+    Fan out the month of the partition into one `(start, end)` pickup range per day, so that every
+    day is fetched and decoded by its own step (and process)
+    """
+    import httpx
 
-    return (start_date, end_date)
+    start_date, end_date = helper.get_monthly_range(context.partition_key)
+    month_query = helper.get_pickup_range_query(start_date, end_date)
 
+    # read before the day slices are fetched, the rows updated while fetching are downloaded again with the next changes
+    async def fetch_watermark() -> str | None:
+        async with httpx.AsyncClient() as client:
+            return await helper.fetch_max_updated_at(
+                client,
+                constants.YELLOW_TAXI_TRIPS_2022_URL,
+                month_query,
+                os.getenv("NYC_OPEN_DATA_APP_TOKEN"),
+                httpx.Timeout(90),
+            )
 
-@op
-def create_file_save_path(context: OpExecutionContext) -> Path:
+    # the watermark is None when it is unavailable, then the changes of the month start from the next full download
+    yield Output(asyncio.run(fetch_watermark()), output_name="watermark")
 
-    start_date: str = context.partition_key
+    # remove the slices of a previous (failed) run of the month
+    shutil.rmtree(get_day_slices_dir(context.partition_key), ignore_errors=True)
 
-    csv_data_dir = Path(
-        "de_portfolio_nyc_tlc/assets/yellow_taxi_data/data/csv/graph_asset"
+    day = date.fromisoformat(start_date)
+    last_day = date.fromisoformat(end_date)
+    while day < last_day:
+        next_day = day + timedelta(days=1)
+        yield DynamicOutput(
+            (day.isoformat(), next_day.isoformat()),
+            output_name="day_slices",
+            mapping_key=day.strftime("%Y_%m_%d"),
+        )
+        day = next_day
+
+
+@op
+def fetch_day_slice(
+    context: OpExecutionContext, day_slice: tuple
+) -> dict:
+    """
+    Fetch the trips picked up within `day_slice`, decode the JSON response, and save the trips to the
+    csv file of the day. The columns are in the same order for every day, see `assemble_monthly_csv`
+    """
+    import httpx
+    import pandas as pd
+
+    start, end = day_slice
+    where_query = helper.get_pickup_range_query(start, end)
+    url = helper.build_rows_url(
+        where_query, DAY_SLICE_RESPONSE_LIMIT, os.getenv("NYC_OPEN_DATA_APP_TOKEN")
     )
-    if not csv_data_dir.exists():
-        csv_data_dir.mkdir(parents=True, exist_ok=True)
 
-    month_num = start_date.split("-")[1]
-    CSV_FILE = Path(f"{csv_data_dir}/2022-{month_num}.csv")
+    pages = []
+    num_bytes = 0
+    offset = 0
+    with httpx.Client(timeout=httpx.Timeout(90)) as client:
+        while True:
+            response = client.get(url.format(offset=offset))
+            response.raise_for_status()
+            num_bytes += len(response.content)
+            # the CPU-bound part of the download, which runs in the process of this step
+            rows = response.json()
+            pages.append(pd.DataFrame.from_records(rows))
 
-    print(f"file save path: {CSV_FILE}")
+            # the last page of the day
+            if len(rows) < DAY_SLICE_RESPONSE_LIMIT:
+                break
+            offset += DAY_SLICE_RESPONSE_LIMIT
 
-    return CSV_FILE
+    # The API leaves out the null fields of a row, so a column can be missing from a day. Keep the same
+    #   columns for every day, so that the csv files of the days can be concatenated as is
+    columns = [parquet_helper.SOCRATA_ID_COLUMN, *parquet_helper.RAW_CSV_COLUMNS]
+    df = pd.concat(pages, ignore_index=True).reindex(columns=columns)
+    # a row can be served by two pages when the dataset changes while the pages of the day are fetched. The days
+    #   do not overlap, so the rows only need to be deduplicated within their day
+    is_new = ~df.duplicated(subset=[parquet_helper.SOCRATA_ID_COLUMN])
+    duplicates = int((~is_new).sum())
+    df = df[is_new]
 
+    day_slices_dir = get_day_slices_dir(context.partition_key)
+    day_slices_dir.mkdir(parents=True, exist_ok=True)
+    csv_file = day_slices_dir / f"{start}.csv"
+    df.to_csv(csv_file, index=False)
+    context.log.debug(f"{start}: saved {len(df):,} rows ({num_bytes / 1_000_000:.1f} MB)")
 
-@op(
-    ins={
-        "response": In(Response),
-        "line_limit": In(int),
-        "file_name": In(str),
-        "append_flag": In(bool),
+    return {
+        "csv_file": str(csv_file),
+        "rows": len(df),
+        "duplicates": duplicates,
+        "MB": num_bytes / 1_000_000,
     }
-)
-async def handle_stream_data_response(
-    response: Response, line_limit: int, file_name: str, append_flag: bool
-):
-    # Check for exceptions
-    response.raise_for_status()
-
-    # save every N lines, where N = line_limit
-    line_accumulator = []
-
-    async for line in response.aiter_lines():
-        # check for empty response
-        # end the request loop when there are no more rows to fetch
-        # this works when `request_limit` % `line_limit` != 0 or
-        #  when the count of record of the previous request
-        #  is divisible by line_limit
-        if line == "[]":
-            break
-
-        # stream data received, clean the data
-        # the data received here is a string representation
-        # of the json data
-        line = line.strip(",[]")
-        # convert the line to a dictionary and add it to line_accumulator
-        line_accumulator.append(json.loads(line))
-
-        # check if we have received enough lines
-        # NOTE: if `len(line_accumulator)` < `line_limit` by the end of the for loop, that means we have exhausted the response
-        #  See the corresponding conditional statement below for this case.
-        if len(line_accumulator) == line_limit:
-            # save the acculated lines
-            save_streamed_lines(line_accumulator, file_name, append_flag)
-            # clear the contents of line_accumulator for the next set of responses
-            line_accumulator.clear()
-    # end of for loop
-
-    # add the remaining lines if there are any
-    # this also means that there are no more stream data for the current request
-    #  since the streamed data did not reach the line_limit
-    # NOTE: Ending the request loop will only work correctly when request_limit % line_limit == 0
-    #  This means if the request_limit is not divisible by line_limit, the request loop
-    #  will terminate after the first request even if there is still data for our API request
-    if len(line_accumulator) > 0:
-        save_streamed_lines(line_accumulator, file_name, append_flag)
-        line_accumulator.clear()
-
-        # end the request loop
-        return False
-
-    # continue the request loop while we are still reaching the line limit
-    return True
 
 
-@op
-def save_streamed_lines(lines: list[int], file_path: str, append_flag: bool) -> None:
-    # convert line_accumulator to a dataframe
-    df = pd.DataFrame.from_records(lines)
-    # save the dataframe as csv
-    # `append_flag` uses the offset variable from our request to determine the
-    #  values for writing mode and header
-    df.to_csv(
-        file_path,
-        mode="w" if append_flag else "a",
-        header=append_flag,
-        index=False,
+@op(out=Out(Nothing))
+def assemble_monthly_csv(
+    context: OpExecutionContext,
+    day_slices: list[dict],
+    watermark: str | None,
+) -> None:
+    """
+    Concatenate the csv files of the days into the csv file of the month, then store the watermark
+    of the month for YT_monthly_changes_2022
+    """
+    partition_key = context.partition_key
+    CSV_FILE = helper.create_file_save_path(partition_key, CSV_DATA_DIR)
+    day_slices = sorted(day_slices, key=lambda day_slice: day_slice["csv_file"])
+
+    # the days have the same header, so only the header of the first day is kept
+    with open(f"{CSV_FILE}.tmp", "w") as month_csv:
+        for i, day_slice in enumerate(day_slices):
+            with open(day_slice["csv_file"]) as day_csv:
+                header = day_csv.readline()
+                if i == 0:
+                    month_csv.write(header)
+                shutil.copyfileobj(day_csv, month_csv)
+    os.replace(f"{CSV_FILE}.tmp", CSV_FILE)
+    shutil.rmtree(get_day_slices_dir(partition_key), ignore_errors=True)
+
+    if watermark is not None:
+        helper.write_watermark(CSV_DATA_DIR, partition_key, watermark)
+
+    total_records_saved = sum(day_slice["rows"] for day_slice in day_slices)
+    context.log.info(
+        f"{Path(CSV_FILE).name}: saved {total_records_saved:,} rows from {len(day_slices)} day slices"
+    )
+    context.add_output_metadata(
+        {
+            "Data source documentation": MetadataValue.url(
+                "https://dev.socrata.com/foundry/data.cityofnewyork.us/qp3b-zxtp"
+            ),
+            "Number of fetched records": MetadataValue.int(total_records_saved),
+            "Number of fetched records per day": MetadataValue.json(
+                {
+                    Path(day_slice["csv_file"]).stem: day_slice["rows"]
+                    for day_slice in day_slices
+                }
+            ),
+            "Number of duplicate records": MetadataValue.int(
+                sum(day_slice["duplicates"] for day_slice in day_slices)
+            ),
+            "Downloaded data (MB)": MetadataValue.float(
+                round(sum(day_slice["MB"] for day_slice in day_slices), 2)
+            ),
+        }
     )
 
 
-@op
-def get_list_of_csv() -> list[str]:
-    log = get_dagster_logger()
-    CSV_FOLDER = os.path.join(os.path.dirname(__file__), "data/csv")
-    log.info(CSV_FOLDER)
-    csv_files = [
-        file.path
-        for file in os.scandir(CSV_FOLDER)
-        if file.is_file() and file.name.endswith(".csv")
-    ]
+class RowCountReconciliationConfig(Config):
+    # the Socrata resource that the rows of each month are counted from, e.g., a local stub in the tests
+    resource_url: str = constants.YELLOW_TAXI_TRIPS_2022_URL
+    # the folder of the `csv` and `parquet` folders
+    data_dir: str = str(CSV_DATA_DIR.parent)
+    # the months to reconcile, every month of `monthly_partition` by default
+    partition_keys: list[str] = []
 
-    log.info(csv_files)
-    for csv in csv_files:
-        log.info(f"File name: {csv}")
 
-    return csv_files
+@op(out=Out(Nothing))
+async def reconcile_row_counts(
+    context: OpExecutionContext, config: RowCountReconciliationConfig
+) -> None:
+    """
+    Compare the rows of the downloaded csv of every month with the `count(*)` of the same `$where` window
+    in the source. The local files are counted without parsing them, and the months are reconciled
+    concurrently. The drift of each month is logged as an observation of its YT_monthly_csv_2022 partition
+    """
+    import httpx
 
+    partition_keys = config.partition_keys or monthly_partition.get_partition_keys()
+    data_dir = Path(config.data_dir)
+    app_token = os.getenv("NYC_OPEN_DATA_APP_TOKEN")
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_COUNTS)
 
-@op
-def verify_row_count(csv_files: list[str], v_count: int):
-    log = get_dagster_logger()
-    total_count = 0
-    VERIFIED_COUNT = v_count
-    for csv_file in csv_files:
-        df = pd.read_csv(csv_file)
-        total_count += df.shape[0]
-    log.info(f"Total rows of downloaded csv: {total_count}")
-    assert total_count == VERIFIED_COUNT
+    async with httpx.AsyncClient() as client:
+
+        async def reconcile(partition_key: str) -> dict[str, int | float | str | None]:
+            month = partition_key[:7]
+            where_query = helper.get_pickup_range_query(
+                *helper.get_monthly_range(partition_key)
+            )
+            async with semaphore:
+                source_rows = await helper.fetch_row_count(
+                    client, config.resource_url, where_query, app_token, httpx.Timeout(90)
+                )
+            # the files are counted in threads, while the other months wait for their source count
+            csv_rows, parquet_rows = await asyncio.gather(
+                asyncio.to_thread(
+                    row_count_helper.count_csv_rows, str(data_dir / "csv" / f"{month}.csv")
+                ),
+                asyncio.to_thread(
+                    row_count_helper.count_parquet_rows,
+                    str(data_dir / "parquet" / f"{month}.parquet"),
+                ),
+            )
+
+            return {
+                "source_rows": source_rows,
+                "csv_rows": csv_rows,
+                # the parquet file only has the trips that are kept by the cleaning
+                "parquet_rows": parquet_rows,
+                **row_count_helper.get_row_count_drift(source_rows, csv_rows),
+            }
+
+        results = await asyncio.gather(*(reconcile(key) for key in partition_keys))
+
+    drift_by_month = dict(zip(partition_keys, results))
+    for partition_key, result in drift_by_month.items():
+        context.log_event(
+            AssetObservation(
+                asset_key="YT_monthly_csv_2022",
+                partition=partition_key,
+                metadata={
+                    "Reconciliation status": MetadataValue.text(result["status"]),
+                    "Number of source records": MetadataValue.int(result["source_rows"] or 0),
+                    "Number of fetched records": MetadataValue.int(result["csv_rows"] or 0),
+                    "Number of cleaned records (parquet)": MetadataValue.int(
+                        result["parquet_rows"] or 0
+                    ),
+                    "Row count drift": MetadataValue.int(result["drift"] or 0),
+                },
+            )
+        )
+        if result["status"] != "ok":
+            context.log.warning(f"{partition_key[:7]}: {result}")
+
+    statuses = [result["status"] for result in results]
+    context.log.info(
+        f"Reconciled {len(results)} months: "
+        + ", ".join(f"{statuses.count(status)} {status}" for status in sorted(set(statuses)))
+    )
+    context.add_output_metadata(
+        {
+            "Number of months with drift": MetadataValue.int(statuses.count("drift")),
+            "Row count drift per partition": MetadataValue.json(drift_by_month),
+        }
+    )
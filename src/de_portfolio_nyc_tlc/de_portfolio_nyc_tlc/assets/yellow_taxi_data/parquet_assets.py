@@ -1,20 +1,26 @@
 from dagster import (
     asset,
+    BackfillPolicy,
     AssetExecutionContext,
-    MaterializeResult,
     MetadataValue,
     AssetCheckResult,
+    Output,
 )
-from numpy import int16, int8
 
 from ...partitions import monthly_partition
+from ...concurrency import partitioning_op_tags
+from ...utils.memory_utils import record_peak_memory
 
 from .checks import parquet_assets_checks as checks
-
-import pandas as pd
+from .helpers import parquet_asset_helpers as helper
+from .helpers import plausibility_helpers as plausibility_helper
+from .helpers import trip_schema_helpers as schema_helper
 
 import os
 
+# the raw csv files are read from, and the parquet files are saved to, the subfolders of DATA_FOLDER
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), "data")
+
 
 @asset(
     deps=["YT_monthly_csv_2022"],
@@ -24,143 +30,101 @@ import os
     Initial cleaning and filtering were done with the data such as:\n
     * Dropping records with missing `passenger_count` and `total_amount`
     * Dropping records with with invalid trip distance, i.e., `trip_distance > 0`, are retained
+    * Quarantining implausible trips, i.e., a non-positive duration, or a duration, speed or fare per mile
+    that is an outlier of its month (median/MAD), to `data/quarantine/<month>.parquet`
     """,
     dagster_type={},
     check_specs=[check_spec.AssetCheckSpec for check_spec in checks.check_spec_list],
+    io_manager_key="arrow_io_manager",
+    # a backfill is split into runs of up to 3 months, which bounds the memory used by a run
+    backfill_policy=BackfillPolicy.multi_run(max_partitions_per_run=3),
+    op_tags=partitioning_op_tags("low"),
 )
 def YT_monthly_parquet_2022(
     context: AssetExecutionContext,
-) -> MaterializeResult:
-    month_num = context.partition_key.split("-")[1]
+):
+    # the heavy libraries are imported here to keep the code location cheap to load
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
     # prepare the saving destination
-    DATA_FOLDER = os.path.join(os.path.dirname(__file__), "data")
     CSV_FOLDER = os.path.join(DATA_FOLDER, "csv")
     PARQUET_FOLDER = os.path.join(DATA_FOLDER, "parquet")
 
-    CSV_FILE = os.path.join(CSV_FOLDER, f"2022-{month_num}.csv")
-    PARQUET_FILE = os.path.join(PARQUET_FOLDER, f"2022-{month_num}.parquet")
-
-    # cols = [
-    #     "vendorid",
-    #     "tpep_pickup_datetime",
-    #     "tpep_dropoff_datetime",
-    #     "passenger_count",
-    #     "trip_distance",
-    #     "ratecodeid",
-    #     "store_and_fwd_flag",
-    #     "pulocationid",
-    #     "dolocationid",
-    #     "payment_type",
-    #     "fare_amount",
-    #     "extra",
-    #     "mta_tax",
-    #     "tip_amount",
-    #     "tolls_amount",
-    #     "improvement_surcharge",
-    #     "total_amount",
-    #     "congestion_surcharge",
-    #     "airport_fee",
-    # ]
-
-    # read the csv files and indicate the timestamp columns
-    # NOTE: Ideally, the dtype would be set when reading the csv, but some columns have invalid data that results into an error
-    #  Hence, some of the columns will undergo initial cleaning and transformation before they are converted to a more appropriate data type
-    timestamp_cols = ["tpep_pickup_datetime", "tpep_dropoff_datetime"]
-    df = pd.read_csv(CSV_FILE, parse_dates=timestamp_cols)
-    # for metadata
-    raw_csv_length = len(df)
-
-    # INITIAL CLEANING AND TRANSFORMATIONS
-    # clean some of the numeric columns by converting invalid values to NaN
-    cols_to_numeric = [
-        "vendorid",
-        "passenger_count",
-        "ratecodeid",
-        "pulocationid",
-        "dolocationid",
-        "payment_type",
-        "total_amount",
-        "trip_distance",
-    ]
-    for col in cols_to_numeric:
-        # Convert invalid numeric values to NaNs
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # drop invalid trip records w/ NaN values after the type conversion
-    df = df.dropna(subset=["passenger_count", "total_amount", "trip_distance"])
-
-    # Convert columns to ints
-    cols_to_int = [
-        "vendorid",
-        "passenger_count",
-        "ratecodeid",
-        "pulocationid",
-        "dolocationid",
-        "payment_type",
-    ]
-    for col in cols_to_int:
-        # Replace NaNs to prevent error during dtype conversion
-        df.fillna({col: -1}, inplace=True)
-
-        if col == "pulocationid" or col == "dolocationid":
-            df[col] = df[col].astype(int16)
-            continue
-
-        df[col] = df[col].astype(int8)
-
-    # convert the flag column to int
-    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].mask(
-        df["store_and_fwd_flag"] == "Y", 1
-    )
-    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].mask(
-        df["store_and_fwd_flag"] == "N", 0
-    )
-    df["store_and_fwd_flag"] = pd.to_numeric(df["store_and_fwd_flag"], errors="coerce")
-    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].fillna(-1)
-    df["store_and_fwd_flag"] = df["store_and_fwd_flag"].astype(int8)
-
-    # filter valid trips
-    trips_w_passengers = df["passenger_count"] > 0
-    only_paid_trips = df["total_amount"] > 0
-    trips_w_valid_distance = df["trip_distance"] > 0
-
-    df = df[trips_w_passengers & trips_w_valid_distance & only_paid_trips]
-
-    # rename columns
-    col_names = {
-        "vendorid": "vendor_id",
-        "tpep_pickup_datetime": "pickup_dtime",
-        "tpep_dropoff_datetime": "dropoff_dtime",
-        "ratecodeid": "rate_code_id",
-        "pulocationid": "pickup_lid",
-        "dolocationid": "dropoff_lid",
-    }
-    df.rename(columns=col_names, inplace=True)
-
-    # prepare materialization metadata
-    num_records = len(df)
+    # A run can materialize several partitions (see the backfill_policy). The months are cleaned one at a time,
+    #   and converted to arrow with the schema of the first month, so the partitions with the same columns share
+    #   the same parsed schema
+    schema = None
+    tables = {}
     col_info_json = {}
-    for index, value in df.dtypes.items():
-        col_info_json[str(index)] = str(value)
-
-    print(df)
-    print(df.dtypes)
-
-    # save dataframe as parquet
-    df.to_parquet(PARQUET_FILE)
-
-    return MaterializeResult(
+    # a check passes only if it passes for every partition of the run
+    checks_passed = {
+        check_spec.AssetCheckSpec.name: True for check_spec in checks.check_spec_list
+    }
+    partition_metadata = {}
+    for partition_key in context.partition_keys:
+        month_num = partition_key.split("-")[1]
+        CSV_FILE = os.path.join(CSV_FOLDER, f"2022-{month_num}.csv")
+        PARQUET_FILE = os.path.join(PARQUET_FOLDER, f"2022-{month_num}.parquet")
+
+        df, raw_csv_length = helper.clean_monthly_csv(CSV_FILE)
+        df = helper.add_trip_ids(df, partition_key)
+        # the quarantined trips keep their trip_id, so they can be traced back to the month and restored
+        df, quarantined, thresholds = plausibility_helper.quarantine_implausible_trips(df)
+        QUARANTINE_FILE = plausibility_helper.get_quarantine_path(partition_key)
+        os.makedirs(os.path.dirname(QUARANTINE_FILE), exist_ok=True)
+        quarantined.to_parquet(QUARANTINE_FILE, index=False)
+        num_records = len(df)
+        context.log.info(
+            f"2022-{month_num}: kept {num_records:,} of {raw_csv_length:,} raw csv records,"
+            f" quarantined {len(quarantined):,} implausible trips"
+        )
+
+        # convert the dataframe to arrow once. The same table is saved as parquet, and handed to the
+        #   downstream assets by the arrow_io_manager as a memory-mapped arrow file
+        #   (the index is always kept, so the schema has the `__index_level_0__` column even when no rows were dropped)
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        if schema_helper.TRIPS_SCHEMA == "compact":
+            table = schema_helper.compact_trips_table(table)
+        if schema is None:
+            schema = table.schema
+        elif table.schema.names == schema.names:
+            table = table.cast(schema)
+        # else the month has other columns, e.g., no `socrata_id` since it was downloaded before the Socrata
+        #   row id was requested. It keeps its own schema, and the arrow_io_manager unifies the months by name
+        os.makedirs(PARQUET_FOLDER, exist_ok=True)
+        pq.write_table(table, PARQUET_FILE)
+
+        tables[partition_key] = table
+        for check_spec in checks.check_spec_list:
+            checks_passed[check_spec.AssetCheckSpec.name] &= check_spec.condition(df)
+        partition_metadata[partition_key] = {
+            "parquet": num_records,
+            "raw csv": raw_csv_length,
+            "quarantined": len(quarantined),
+            "plausibility thresholds": thresholds,
+        }
+        # the columns of every month, since a month can have columns that the others do not have
+        for index, value in df.dtypes.items():
+            col_info_json[str(index)] = str(value)
+
+    yield Output(
+        # the arrow_io_manager saves a dictionary as one file per partition
+        tables if len(tables) > 1 else table,
         metadata={
-            "Number of records - parquet": MetadataValue.int(num_records),
-            "Number of records - raw csv": MetadataValue.int(raw_csv_length),
+            "Number of records - parquet": MetadataValue.int(
+                sum(counts["parquet"] for counts in partition_metadata.values())
+            ),
+            "Number of records - raw csv": MetadataValue.int(
+                sum(counts["raw csv"] for counts in partition_metadata.values())
+            ),
+            "Number of records - quarantined": MetadataValue.int(
+                sum(counts["quarantined"] for counts in partition_metadata.values())
+            ),
+            "Number of records per partition": MetadataValue.json(partition_metadata),
             "Column info": MetadataValue.json(col_info_json),
+            **record_peak_memory(context, "low"),
         },
-        check_results=[
-            AssetCheckResult(
-                check_name=check_spec.AssetCheckSpec.name,
-                passed=check_spec.condition(df),
-            )
-            for check_spec in checks.check_spec_list
-        ],
     )
+    for check_name, passed in checks_passed.items():
+        yield AssetCheckResult(check_name=check_name, passed=passed)
@@ -0,0 +1,71 @@
+import os
+
+from dagster import (
+    AssetExecutionContext,
+    AssetOut,
+    BackfillPolicy,
+    MaterializeResult,
+    Nothing,
+    multi_asset,
+)
+
+from ...partitions import monthly_partition
+from ...concurrency import DUCKDB_WRITER_OP_TAGS
+from ...resources import RetryingDuckDBResource
+
+from .parquet_assets import YT_monthly_parquet_2022
+from .table_assets import taxi_zone_lookup_table
+
+from .helpers import table_helpers as helper
+from .helpers import rollup_helpers as rollup_helper
+
+# the cleaned monthly parquet files of YT_monthly_parquet_2022
+PARQUET_FOLDER = os.path.join(os.path.dirname(__file__), "data", "parquet")
+
+
+@multi_asset(
+    outs={
+        # the rollups live in DuckDB, there is no output for an IO manager to store
+        rollup.table_name: AssetOut(
+            description=rollup.description, is_required=False, dagster_type=Nothing
+        )
+        for rollup in rollup_helper.ROLLUPS
+    },
+    deps=[YT_monthly_parquet_2022, taxi_zone_lookup_table],
+    partitions_def=monthly_partition,
+    can_subset=True,
+    op_tags=DUCKDB_WRITER_OP_TAGS,
+    backfill_policy=BackfillPolicy.single_run(),
+)
+def rollup_tables(context: AssetExecutionContext, duckdb: RetryingDuckDBResource):
+    """
+    Pre-aggregated rollups of the trips for the common analytics queries. Each partition replaces the
+    rows of its month from the cleaned parquet file, which is read once for all the selected rollups.
+    Use `helpers.rollup_helpers.query_rollup` to answer a query from the smallest rollup that can answer it
+    """
+    selected_rollups = [
+        rollup
+        for rollup in rollup_helper.ROLLUPS
+        if context.asset_key_for_output(rollup.table_name)
+        in context.selected_asset_keys
+    ]
+
+    # A run can materialize several months (see the backfill_policy), the months share the connection
+    with duckdb.get_connection(profile="bulk_load") as conn:
+        for partition_key in context.partition_keys:
+            month_num = partition_key.split("-")[1]
+            PARQUET_FILE = os.path.join(PARQUET_FOLDER, f"2022-{month_num}.parquet")
+
+            conn.sql(rollup_helper.query_create_rollup_source(PARQUET_FILE))
+            for rollup in selected_rollups:
+                conn.sql(
+                    rollup_helper.query_upsert_rollup_partition(rollup, partition_key)
+                )
+            conn.sql(f"DROP TABLE {rollup_helper.ROLLUP_SOURCE_TABLE}")
+
+        # metadata
+        for rollup in selected_rollups:
+            helper.bump_table_version(conn=conn, table_name=rollup.table_name)
+            metadata = helper.get_table_metadata(conn=conn, table_name=rollup.table_name)
+
+            yield MaterializeResult(asset_key=rollup.table_name, metadata=metadata)
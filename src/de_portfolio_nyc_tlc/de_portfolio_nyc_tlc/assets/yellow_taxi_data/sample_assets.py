@@ -0,0 +1,74 @@
+import os
+
+from dagster import (
+    AssetExecutionContext,
+    AssetOut,
+    BackfillPolicy,
+    MaterializeResult,
+    MetadataValue,
+    Nothing,
+    multi_asset,
+)
+
+from ...partitions import monthly_partition
+from ...concurrency import DUCKDB_WRITER_OP_TAGS
+from ...resources import RetryingDuckDBResource
+
+from .parquet_assets import YT_monthly_parquet_2022
+from .table_assets import taxi_zone_lookup_table
+
+from .helpers import table_helpers as helper
+from .helpers import sample_helpers as sample_helper
+
+
+@multi_asset(
+    outs={
+        # the samples live in DuckDB, there is no output for an IO manager to store
+        sample.table_name: AssetOut(
+            description=sample.description, is_required=False, dagster_type=Nothing
+        )
+        for sample in sample_helper.SAMPLES
+    },
+    deps=[YT_monthly_parquet_2022, taxi_zone_lookup_table],
+    partitions_def=monthly_partition,
+    can_subset=True,
+    op_tags=DUCKDB_WRITER_OP_TAGS,
+    backfill_policy=BackfillPolicy.single_run(),
+)
+def sample_tables(context: AssetExecutionContext, duckdb: RetryingDuckDBResource):
+    """
+    Reproducible stratified samples of the trips for the exploratory queries. Each partition replaces the
+    sampled trips of its month from the cleaned parquet file, which is read once for all the selected samples.
+    Use `helpers.sample_helpers.query_sample` to estimate the aggregates of all the trips, with their errors
+    """
+    selected_samples = [
+        sample
+        for sample in sample_helper.SAMPLES
+        if context.asset_key_for_output(sample.table_name)
+        in context.selected_asset_keys
+    ]
+
+    # A run can materialize several months (see the backfill_policy), the months share the connection
+    with duckdb.get_connection(profile="bulk_load") as conn:
+        for partition_key in context.partition_keys:
+            month_num = partition_key.split("-")[1]
+            PARQUET_FILE = os.path.join(
+                os.path.dirname(__file__), "data", "parquet", f"2022-{month_num}.parquet"
+            )
+
+            conn.sql(
+                sample_helper.query_create_sample_source(PARQUET_FILE, partition_key)
+            )
+            for sample in selected_samples:
+                conn.sql(
+                    sample_helper.query_upsert_sample_partition(sample, partition_key)
+                )
+            conn.sql(f"DROP TABLE {sample_helper.SAMPLE_SOURCE_TABLE}")
+
+        # metadata
+        for sample in selected_samples:
+            helper.bump_table_version(conn=conn, table_name=sample.table_name)
+            metadata = helper.get_table_metadata(conn=conn, table_name=sample.table_name)
+            metadata["Sample fraction"] = MetadataValue.float(sample.fraction)
+
+            yield MaterializeResult(asset_key=sample.table_name, metadata=metadata)
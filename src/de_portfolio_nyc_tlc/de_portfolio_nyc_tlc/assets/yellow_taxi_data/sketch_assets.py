@@ -0,0 +1,56 @@
+from dagster import (
+    AssetExecutionContext,
+    AssetIn,
+    MaterializeResult,
+    MetadataValue,
+    asset,
+)
+import os
+
+from ...partitions import monthly_partition
+
+from .parquet_assets import YT_monthly_parquet_2022
+
+from .helpers import sketch_helpers as helper
+
+
+@asset(
+    ins={"monthly_trips": AssetIn(key=YT_monthly_parquet_2022.key)},
+    partitions_def=monthly_partition,
+    description="""
+    Mergeable sketches of the trips of the month: quantile sketches (1% relative accuracy) of the fare, distance
+    and duration for the whole month, per pickup hour and per pickup zone, of the duration per zone pair and
+    pickup hour, and a HyperLogLog sketch of the distinct pickup/dropoff zone pairs. See `helpers.sketch_helpers.query_quantiles` and `query_distinct_count`
+    to answer the questions of any range of months without scanning the trips
+    """,
+)
+def YT_monthly_sketches_2022(
+    context: AssetExecutionContext, monthly_trips
+) -> MaterializeResult:
+    # the heavy libraries are imported here to keep the code location cheap to load
+    import pyarrow.parquet as pq
+
+    # `monthly_trips` is the memory-mapped arrow file of the month (see the arrow_io_manager)
+    sketches = helper.build_monthly_sketches(monthly_trips)
+
+    SKETCH_FILE = helper.get_sketch_path(context.partition_key)
+    os.makedirs(os.path.dirname(SKETCH_FILE), exist_ok=True)
+    pq.write_table(sketches, f"{SKETCH_FILE}.tmp", compression="zstd")
+    os.replace(f"{SKETCH_FILE}.tmp", SKETCH_FILE)
+
+    # the sketches answer for the month itself as well
+    p50, p95 = helper.query_quantiles([SKETCH_FILE], "duration_s", [0.5, 0.95])[-1]
+
+    return MaterializeResult(
+        metadata={
+            "Number of sketched trips": MetadataValue.int(monthly_trips.num_rows),
+            "Number of sketch rows": MetadataValue.int(sketches.num_rows),
+            "Sketch size (KB)": MetadataValue.float(
+                round(os.path.getsize(SKETCH_FILE) / 1000, 2)
+            ),
+            "Trip duration p50/p95 (s)": MetadataValue.json({"p50": p50, "p95": p95}),
+            "Distinct zone pairs (approx.)": MetadataValue.int(
+                helper.query_distinct_count([SKETCH_FILE])
+            ),
+        }
+    )
@@ -1,9 +1,16 @@
-from dagster import AssetCheckResult, MaterializeResult, MetadataValue, asset
-from dagster_duckdb import DuckDBResource
+from dagster import (
+    AssetCheckResult,
+    AssetExecutionContext,
+    AssetIn,
+    DataVersion,
+    MaterializeResult,
+    MetadataValue,
+    asset,
+)
 import os
 
 
-from .constants import table_names
+from .constants import table_names, type_names
 
 from .checks import table_asset_checks as checks
 
@@ -13,94 +20,94 @@ from .parquet_assets import YT_monthly_parquet_2022
 from .csv_assets import taxi_zone_lookup_csv
 
 from .helpers import table_helpers as helper
+from .helpers import dedup_helpers as dedup_helper
+from .helpers import staging_helpers as staging_helper
+from .helpers.trip_schema_helpers import TRIPS_SCHEMA, query_create_trips_table
+
+from ...concurrency import DUCKDB_WRITER_OP_TAGS
+from ...resources import RetryingDuckDBResource
+from ...io_managers import get_skipped_partitions
+from ...utils import http_cache_utils as http_cache
+
+# load the trips in their arrival order ("arrival"), or clustered by pickup time, then pickup location
+#   ("clustered"), so the min/max zone maps of DuckDB let the time-window and zone filters skip row groups.
+#   Clustering is opt-in, since sorting the trips makes the load slower and use more memory
+TRIPS_LOAD_ORDER = os.getenv("TRIPS_LOAD_ORDER", "arrival")
 
 
 @asset(
-    deps=[YT_monthly_parquet_2022],
+    ins={"monthly_trips": AssetIn(key=YT_monthly_parquet_2022.key)},
     description="""
         The table resulting from the combined parquet assets
         """,
     check_specs=[check_spec.AssetCheckSpec for check_spec in checks.check_spec_list],
+    op_tags=DUCKDB_WRITER_OP_TAGS,
 )
-def table_YT_trip_records_2022(duckdb: DuckDBResource) -> MaterializeResult:
-    CURRENT_DIR = os.path.dirname(__file__)
-    PARQUET_FILES = [
-        entry.path
-        for entry in os.scandir(os.path.join(CURRENT_DIR, "data", "parquet"))
-        if entry.is_file() and entry.name.endswith(".parquet")
-    ]
-    # sort files from JAN-DEC
-    PARQUET_FILES = sorted(PARQUET_FILES)
+def table_YT_trip_records_2022(
+    context: AssetExecutionContext, duckdb: RetryingDuckDBResource, monthly_trips
+) -> MaterializeResult:
+    # `monthly_trips` (a pyarrow.Table, left unannotated so pyarrow is not imported on load) are the memory-mapped arrow files of the monthly partitions (JAN-DEC),
+    #   which duckdb scans in place after registering them as a view
+    context.log.info(f"Loading {monthly_trips.num_rows:,} rows from the monthly trips")
+    # the trips that were already seen in a previous month, or earlier in the same month
+    duplicate_trips = dedup_helper.find_duplicate_trips(monthly_trips)
+    duplicates_per_partition = dedup_helper.count_duplicates_per_partition(
+        duplicate_trips
+    )
+    if duplicate_trips.num_rows:
+        context.log.warning(
+            f"Skipping {duplicate_trips.num_rows:,} duplicate trips: {duplicates_per_partition}"
+        )
 
     # persist the duckdb data
-    with duckdb.get_connection() as conn:
+    with duckdb.get_connection(profile="bulk_load") as conn:
+        conn.register("monthly_trips", monthly_trips)
+        conn.register("duplicate_trips", duplicate_trips)
+
         # query to create the main table
         # Ideally, we would just directly import the parquet files to duckdb and let it infer the
         #   dtypes of the columns, and after that, alter the table to add a primary key constraint
         #   However, duckdb is yet to support ADD/DROP CONSTRAINT statement: https://duckdb.org/docs/sql/statements/alter_table#add--drop-constraint
-        # Convenient dtype such as auto-incrementing serial values is not yet supported, but we can
-        #   use the CREATE SEQUENCE seq statement to have similar results
+        # The trip_id is computed by the parquet stage from the month and the row number of the trip
+        #   within its month (see helpers.parquet_asset_helpers.add_trip_ids). Unlike a sequence, the IDs do
+        #   not depend on the load order, so the months can be loaded independently
+        # The trip_id follows the order of the pickup time and location within a month, and the months do not
+        #   overlap, so sorting by the trip_id clusters the table. It also keeps the table clustered when a month
+        #   is appended on its own: its rows land in their own, sorted, row groups
+        order_by = "ORDER BY trip_id" if TRIPS_LOAD_ORDER == "clustered" else ""
         query_create_table = f"""--sql
-        CREATE OR REPLACE SEQUENCE pk_seq START 1;
-
-        CREATE OR REPLACE TABLE {table_names.YELLOW_TAXI_TRIPS} (
-            trip_id BIGINT DEFAULT NEXTVAL('pk_seq'),
-            vendor_id TINYINT,
-            pickup_dtime TIMESTAMP,
-            dropoff_dtime TIMESTAMP,
-            passenger_count TINYINT,
-            trip_distance DOUBLE,
-            rate_code_id TINYINT,
-            store_and_fwd_flag TINYINT,
-            pickup_lid SMALLINT,
-            dropoff_lid SMALLINT,
-            payment_type TINYINT,
-            fare_amount DOUBLE,
-            extra DOUBLE,
-            mta_tax DOUBLE,
-            tip_amount DOUBLE,
-            tolls_amount DOUBLE,
-            improvement_surcharge DOUBLE,
-            total_amount DOUBLE,
-            congestion_surcharge DOUBLE,
-            airport_fee DOUBLE,
-            __index_level_0__ BIGINT
-        );
-
-        INSERT INTO {table_names.YELLOW_TAXI_TRIPS} (
-            vendor_id,
-            pickup_dtime,
-            dropoff_dtime,
-            passenger_count,
-            trip_distance,
-            rate_code_id,
-            store_and_fwd_flag,
-            pickup_lid,
-            dropoff_lid,
-            payment_type,
-            fare_amount,
-            extra,
-            mta_tax,
-            tip_amount,
-            tolls_amount,
-            improvement_surcharge,
-            total_amount,
-            congestion_surcharge,
-            airport_fee,
-            __index_level_0__
-        )
-            SELECT * FROM read_parquet({PARQUET_FILES});
+        {query_create_trips_table(table_names.YELLOW_TAXI_TRIPS)}
+
+        -- the columns are matched by name, the trips downloaded before the Socrata row id was requested have no socrata_id
+        INSERT INTO {table_names.YELLOW_TAXI_TRIPS} BY NAME
+            SELECT * FROM monthly_trips
+            ANTI JOIN duplicate_trips USING (trip_id)
+            {order_by};
+
+        -- the table is no longer published from the staged months, the next publish rebuilds it
+        DROP TABLE IF EXISTS {staging_helper.PUBLISHED_MONTHS};
         """
 
         # execute
         conn.sql(query_create_table)
-        # verify
-        conn.sql(f"SELECT * FROM {table_names.YELLOW_TAXI_TRIPS} LIMIT 10;").show()
+        conn.unregister("monthly_trips")
+        conn.unregister("duplicate_trips")
 
+        helper.bump_table_version(conn=conn, table_name=table_names.YELLOW_TAXI_TRIPS)
         # metadata
         metadata = helper.get_table_metadata(
             conn=conn, table_name=table_names.YELLOW_TAXI_TRIPS
         )
+        metadata["Load order"] = MetadataValue.text(TRIPS_LOAD_ORDER)
+        metadata["Schema"] = MetadataValue.text(TRIPS_SCHEMA)
+        metadata["Number of duplicate trips"] = MetadataValue.int(duplicate_trips.num_rows)
+        metadata["Number of duplicate trips per partition"] = MetadataValue.json(
+            duplicates_per_partition
+        )
+        # the months that the arrow_io_manager skipped, with skip_missing_partitions
+        skipped_partitions = get_skipped_partitions(monthly_trips)
+        if skipped_partitions:
+            metadata["Skipped partitions"] = MetadataValue.json(skipped_partitions)
 
         return MaterializeResult(
             metadata=metadata,
@@ -119,31 +126,106 @@ def table_YT_trip_records_2022(duckdb: DuckDBResource) -> MaterializeResult:
     description="""
         The lookup table for the pickup and dropoff zones of the taxi trips
         """,
+    op_tags=DUCKDB_WRITER_OP_TAGS,
 )
-def taxi_zone_lookup_table(duckdb: DuckDBResource) -> MaterializeResult:
+def taxi_zone_lookup_table(
+    context: AssetExecutionContext, duckdb: RetryingDuckDBResource
+) -> MaterializeResult:
 
     taxi_zone_file_path = os.path.join(
         os.path.dirname(__file__), "data/csv", "taxi_zone_lookup.csv"
     )
+    # the checksum of the csv file is recorded by taxi_zone_lookup_csv
+    cache_info = http_cache.read_cache_info(taxi_zone_file_path)
+    source_checksum = cache_info["sha256"] if cache_info is not None else None
+
+    # the table is only rebuilt when the csv file changed since it was last built. Returning the same data
+    #   version keeps the dim tables up to date, so they are not rebuilt either
+    previous = context.instance.get_latest_materialization_event(context.asset_key)
+    previous_checksum = None
+    if previous and previous.asset_materialization:
+        previous_checksum = previous.asset_materialization.metadata.get("Source checksum")
     with duckdb.get_connection() as conn:
-
+        table_exists = conn.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND database_name = current_database()",
+            [table_names.TAXI_ZONE_LOOKUP],
+        ).fetchone()[0]
+        if (
+            source_checksum is not None
+            and table_exists
+            and previous_checksum is not None
+            and previous_checksum.value == source_checksum
+        ):
+            context.log.info(
+                f"{table_names.TAXI_ZONE_LOOKUP} is up to date with the csv file, skipping the rebuild"
+            )
+            metadata = helper.get_table_metadata(
+                conn=conn, table_name=table_names.TAXI_ZONE_LOOKUP
+            )
+            return MaterializeResult(
+                data_version=DataVersion(source_checksum),
+                metadata={
+                    **metadata,
+                    "Source checksum": MetadataValue.text(source_checksum),
+                    "Rebuilt": MetadataValue.bool(False),
+                },
+            )
+
+        # The text columns are stored as ENUMs, i.e., dictionary-encoded, since they only have
+        #   a few hundred distinct values. The table is dropped first since the types cannot be
+        #   replaced while a column still uses them. The table is rebuilt in one transaction, so a
+        #   failed rebuild keeps the previous table and types
         query_create_taxi_zone_lookup_table = f"""--sql
-            CREATE OR REPLACE TABLE {table_names.TAXI_ZONE_LOOKUP} (
+            BEGIN TRANSACTION;
+
+            DROP TABLE IF EXISTS {table_names.TAXI_ZONE_LOOKUP};
+
+            DROP TYPE IF EXISTS {type_names.BOROUGH_ENUM};
+            DROP TYPE IF EXISTS {type_names.ZONE_ENUM};
+            DROP TYPE IF EXISTS {type_names.SERVICE_ZONE_ENUM};
+
+            CREATE TEMP TABLE taxi_zone_lookup_csv AS
+                SELECT * FROM read_csv('{taxi_zone_file_path}');
+
+            CREATE TYPE {type_names.BOROUGH_ENUM} AS ENUM (
+                SELECT DISTINCT Borough FROM taxi_zone_lookup_csv WHERE Borough IS NOT NULL ORDER BY 1
+            );
+            CREATE TYPE {type_names.ZONE_ENUM} AS ENUM (
+                SELECT DISTINCT Zone FROM taxi_zone_lookup_csv WHERE Zone IS NOT NULL ORDER BY 1
+            );
+            CREATE TYPE {type_names.SERVICE_ZONE_ENUM} AS ENUM (
+                SELECT DISTINCT service_zone FROM taxi_zone_lookup_csv WHERE service_zone IS NOT NULL ORDER BY 1
+            );
+
+            CREATE TABLE {table_names.TAXI_ZONE_LOOKUP} (
                 location_id SMALLINT PRIMARY KEY,
-                borough TEXT,
-                zone TEXT,
-                service_zone TEXT
+                borough {type_names.BOROUGH_ENUM},
+                zone {type_names.ZONE_ENUM},
+                service_zone {type_names.SERVICE_ZONE_ENUM}
             );
 
             INSERT INTO {table_names.TAXI_ZONE_LOOKUP}
-                SELECT * FROM read_csv('{taxi_zone_file_path}');
+                SELECT * FROM taxi_zone_lookup_csv;
+
+            DROP TABLE taxi_zone_lookup_csv;
+
+            COMMIT;
         """
         # execute
         conn.sql(query_create_taxi_zone_lookup_table)
 
+        helper.bump_table_version(conn=conn, table_name=table_names.TAXI_ZONE_LOOKUP)
         # metadata
         metadata = helper.get_table_metadata(
             conn=conn, table_name=table_names.TAXI_ZONE_LOOKUP
         )
+        if source_checksum is not None:
+            metadata["Source checksum"] = MetadataValue.text(source_checksum)
+        metadata["Rebuilt"] = MetadataValue.bool(True)
 
-        return MaterializeResult(metadata=metadata)
+        return MaterializeResult(
+            data_version=(
+                DataVersion(source_checksum) if source_checksum is not None else None
+            ),
+            metadata=metadata,
+        )
@@ -0,0 +1,133 @@
+from dagster import (
+    AssetCheckResult,
+    AssetExecutionContext,
+    AssetIn,
+    Failure,
+    MaterializeResult,
+    MetadataValue,
+    asset,
+)
+import os
+
+from .constants import table_names
+
+from .checks import table_asset_checks as checks
+
+from .parquet_assets import YT_monthly_parquet_2022
+
+# the zone lookup is loaded the same way in both load modes
+from .table_assets import TRIPS_LOAD_ORDER, taxi_zone_lookup_table  # noqa: F401
+
+from .helpers import table_helpers as helper
+from .helpers import dedup_helpers as dedup_helper
+from .helpers import staging_helpers as staging_helper
+from .helpers.trip_schema_helpers import TRIPS_SCHEMA
+
+from ...partitions import monthly_partition
+from ...concurrency import DUCKDB_WRITER_OP_TAGS, partitioning_op_tags
+from ...resources import RetryingDuckDBResource
+
+ORDER_BY = "ORDER BY trip_id" if TRIPS_LOAD_ORDER == "clustered" else ""
+
+
+@asset(
+    ins={"monthly_trips": AssetIn(key=YT_monthly_parquet_2022.key)},
+    partitions_def=monthly_partition,
+    description="""
+        The trips of the month, loaded and validated in a staging DuckDB file of their own. The months do not share
+        the lock of the warehouse, so they are loaded in parallel, by one step per partition
+        """,
+    op_tags=partitioning_op_tags("medium"),
+)
+def YT_monthly_staging_2022(
+    context: AssetExecutionContext, monthly_trips
+) -> MaterializeResult:
+    import duckdb
+
+    partition_key = context.partition_key
+    # the duplicates across months are left out when the months are published
+    duplicate_trips = dedup_helper.find_duplicate_trips(monthly_trips)
+    expected_rows = monthly_trips.num_rows - duplicate_trips.num_rows
+
+    # The month is staged to a temporary file, which only replaces the staged month once it is validated.
+    #   A failed month keeps its previous staging file, and does not affect the other months
+    STAGING_FILE = staging_helper.get_staging_path(partition_key)
+    os.makedirs(os.path.dirname(STAGING_FILE), exist_ok=True)
+    for stale_file in [f"{STAGING_FILE}.tmp", f"{STAGING_FILE}.tmp.wal"]:
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+
+    with duckdb.connect(f"{STAGING_FILE}.tmp", config={"preserve_insertion_order": False}) as conn:
+        conn.register("monthly_trips", monthly_trips)
+        conn.register("duplicate_trips", duplicate_trips)
+        conn.sql(staging_helper.query_create_staging_table(ORDER_BY))
+        conn.unregister("monthly_trips")
+        conn.unregister("duplicate_trips")
+
+        validations = staging_helper.validate_staged_month(
+            conn, partition_key, expected_rows
+        )
+    if not all(validations.values()):
+        os.remove(f"{STAGING_FILE}.tmp")
+        raise Failure(
+            f"The staged trips of {partition_key} failed the validations",
+            metadata={"Validations": MetadataValue.json(validations)},
+        )
+    os.replace(f"{STAGING_FILE}.tmp", STAGING_FILE)
+
+    return MaterializeResult(
+        metadata={
+            "Staging file": MetadataValue.path(STAGING_FILE),
+            "Number of staged trips": MetadataValue.int(expected_rows),
+            "Number of duplicate trips": MetadataValue.int(duplicate_trips.num_rows),
+            "Validations": MetadataValue.json(validations),
+        }
+    )
+
+
+@asset(
+    deps=[YT_monthly_staging_2022],
+    description="""
+        The table resulting from the staged months. The months that changed since the last publish replace
+        their trips in a single transaction
+        """,
+    check_specs=[check_spec.AssetCheckSpec for check_spec in checks.check_spec_list],
+    op_tags=DUCKDB_WRITER_OP_TAGS,
+)
+def table_YT_trip_records_2022(
+    context: AssetExecutionContext, duckdb: RetryingDuckDBResource
+) -> MaterializeResult:
+    partition_keys = monthly_partition.get_partition_keys()
+
+    with duckdb.get_connection(profile="bulk_load") as conn:
+        try:
+            rows_per_month, replaced_keys = staging_helper.publish_staged_months(
+                conn, partition_keys, ORDER_BY
+            )
+        except ValueError as e:
+            raise Failure(str(e))
+        context.log.info(
+            f"Published {sum(rows_per_month.values()):,} trips of {len(rows_per_month)} months,"
+            f" replaced the trips of {len(replaced_keys)} changed months"
+        )
+
+        helper.bump_table_version(conn=conn, table_name=table_names.YELLOW_TAXI_TRIPS)
+        # metadata
+        metadata = helper.get_table_metadata(
+            conn=conn, table_name=table_names.YELLOW_TAXI_TRIPS
+        )
+        metadata["Load order"] = MetadataValue.text(TRIPS_LOAD_ORDER)
+        metadata["Schema"] = MetadataValue.text(TRIPS_SCHEMA)
+        metadata["Number of trips per partition"] = MetadataValue.json(rows_per_month)
+        metadata["Replaced partitions"] = MetadataValue.json(replaced_keys)
+
+        return MaterializeResult(
+            metadata=metadata,
+            check_results=[
+                AssetCheckResult(
+                    check_name=check_spec.AssetCheckSpec.name,
+                    passed=check_spec.condition(conn),
+                )
+                for check_spec in checks.check_spec_list
+            ],
+        )
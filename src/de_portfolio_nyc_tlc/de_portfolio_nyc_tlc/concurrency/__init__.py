@@ -0,0 +1,49 @@
+# Steps tagged with the same `dagster/concurrency_key` are limited within a run by the executor's
+#   tag_concurrency_limits. The same tag is also read by Dagster's instance-level op concurrency,
+#   which limits the steps across runs once a limit is set for the key, e.g.,
+#   `dagster instance concurrency set duckdb_writer 1`
+CONCURRENCY_KEY_TAG = "dagster/concurrency_key"
+
+# DuckDB only allows one writer process per database file
+DUCKDB_WRITER = "duckdb_writer"
+DUCKDB_WRITER_OP_TAGS = {CONCURRENCY_KEY_TAG: DUCKDB_WRITER}
+
+# The jobs and the memory-hungry assets are tagged with how many of their partitions can run at once.
+#   The runs are queued by the QueuedRunCoordinator of dagster.yaml, and its tag_concurrency_limits
+#   must match PARTITIONING_LIMITS (see test_definitions.py)
+PARTITIONING_LIMIT_TAG = "partitioning_limit"
+PARTITIONING_LIMITS = {"low": 2, "medium": 5, "high": 8}
+
+run_tag_concurrency_limits = [
+    {"key": PARTITIONING_LIMIT_TAG, "value": level, "limit": limit}
+    for level, limit in PARTITIONING_LIMITS.items()
+]
+
+
+def partitioning_pool(level: str) -> str:
+    """
+    The concurrency key (i.e., the op concurrency pool) of the steps tagged with `partitioning_limit=level`
+    """
+    return f"{PARTITIONING_LIMIT_TAG}_{level}"
+
+
+def partitioning_op_tags(level: str) -> dict[str, str]:
+    """
+    Op tags that put the steps of an asset in the concurrency pool of `level`. Unlike the job tags,
+    the op tags also apply when the partitions are materialized from the asset graph or a backfill
+    """
+    if level not in PARTITIONING_LIMITS:
+        raise ValueError(
+            f"Unknown {PARTITIONING_LIMIT_TAG} {level!r}, use one of {list(PARTITIONING_LIMITS)}"
+        )
+
+    return {PARTITIONING_LIMIT_TAG: level, CONCURRENCY_KEY_TAG: partitioning_pool(level)}
+
+
+executor_tag_concurrency_limits = [
+    {"key": CONCURRENCY_KEY_TAG, "value": DUCKDB_WRITER, "limit": 1},
+    *[
+        {"key": CONCURRENCY_KEY_TAG, "value": partitioning_pool(level), "limit": limit}
+        for level, limit in PARTITIONING_LIMITS.items()
+    ],
+]
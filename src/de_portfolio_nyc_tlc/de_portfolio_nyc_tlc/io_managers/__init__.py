@@ -0,0 +1,135 @@
+import json
+import os
+from typing import TYPE_CHECKING
+
+from dagster import ConfigurableIOManager, InputContext, MetadataValue, OutputContext
+from pydantic import Field
+
+# pyarrow is imported when the IO manager is used, so loading the definitions stays cheap
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# the schema metadata of a loaded table that lists the partitions skipped by `skip_missing_partitions`
+SKIPPED_PARTITIONS_KEY = b"skipped_partitions"
+
+
+def get_skipped_partitions(table: "pa.Table") -> list[str]:
+    """
+    The partitions that are missing from a table loaded by the ArrowIOManager, if it skips the missing partitions
+    """
+    metadata = table.schema.metadata or {}
+    return json.loads(metadata.get(SKIPPED_PARTITIONS_KEY, b"[]"))
+
+
+class ArrowIOManager(ConfigurableIOManager):
+    """
+    Stores asset outputs as uncompressed Arrow IPC (Feather V2) files, one file per partition.
+    Inputs are loaded as memory-mapped Arrow tables, so downstream assets read the data without
+    copying or parsing it, and DuckDB can scan them directly via `conn.register()`.
+
+    When a downstream asset depends on several partitions, the partitions are returned as a single
+    table whose chunks are the memory-mapped partitions. A missing partition raises, unless
+    `skip_missing_partitions` is set
+    """
+
+    base_dir: str = Field(description="The directory where the Arrow files are saved")
+    skip_missing_partitions: bool = Field(
+        default=False,
+        description="""Load the materialized partitions only, instead of raising when a partition is missing.
+        The loaded table lists the skipped partitions (see `get_skipped_partitions`), which are reported in the
+        output metadata of the downstream asset""",
+    )
+
+    def get_path(self, asset_key_path: list[str], partition_key: str | None) -> str:
+        if partition_key is None:
+            return os.path.join(self.base_dir, *asset_key_path) + ".arrow"
+
+        return os.path.join(self.base_dir, *asset_key_path, f"{partition_key}.arrow")
+
+    def write_table(self, table: "pa.Table", path: str) -> None:
+        import pyarrow as pa
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see a partial file
+        temp_path = f"{path}.tmp"
+        with pa.OSFile(temp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+
+    def read_table(self, path: str) -> "pa.Table":
+        import pyarrow as pa
+
+        # the buffers of the table point to the memory-mapped file instead of being read into memory
+        with pa.memory_map(path, "r") as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def handle_output(self, context: OutputContext, obj) -> None:
+        import pandas as pd
+        import pyarrow as pa
+
+        if obj is None:
+            return
+
+        # runs with several partitions output a {partition_key: table} dictionary
+        if isinstance(obj, dict):
+            tables = obj
+        else:
+            partition_key = (
+                context.asset_partition_key if context.has_asset_partitions else None
+            )
+            tables = {partition_key: obj}
+
+        num_rows = 0
+        skipped_partitions = set()
+        for partition_key, table in tables.items():
+            if isinstance(table, pd.DataFrame):
+                table = pa.Table.from_pandas(table)
+
+            path = self.get_path(context.asset_key.path, partition_key)
+            self.write_table(table, path)
+            num_rows += table.num_rows
+            skipped_partitions.update(get_skipped_partitions(table))
+            context.log.debug(f"Saved {table.num_rows:,} rows to {path}")
+
+        metadata = {"Number of rows - arrow": num_rows}
+        # the output was built from an input that was missing some of its partitions
+        if skipped_partitions:
+            metadata["Skipped partitions"] = MetadataValue.json(sorted(skipped_partitions))
+        context.add_output_metadata(metadata)
+
+    def load_input(self, context: InputContext) -> "pa.Table":
+        import pyarrow as pa
+
+        if not context.has_asset_partitions:
+            return self.read_table(self.get_path(context.asset_key.path, None))
+
+        paths = {
+            partition_key: self.get_path(context.asset_key.path, partition_key)
+            for partition_key in context.asset_partition_keys
+        }
+        missing = [key for key, path in paths.items() if not os.path.exists(path)]
+        asset_name = context.asset_key.to_user_string()
+        if missing and not self.skip_missing_partitions:
+            raise FileNotFoundError(
+                f"The partitions {missing} of {asset_name} are not materialized in {self.base_dir},"
+                + " materialize them first, or set skip_missing_partitions to load the others"
+            )
+        if len(missing) == len(paths):
+            raise FileNotFoundError(
+                f"No materialized partitions of {asset_name} in {self.base_dir}"
+            )
+
+        tables = [
+            self.read_table(path) for key, path in paths.items() if key not in missing
+        ]
+        # concatenating only references the chunks of each table, the data is not copied
+        table = pa.concat_tables(tables, promote_options="default")
+        # the input metadata of a multi-partition input cannot be set, so the table carries its skipped partitions
+        if missing:
+            context.log.warning(f"Skipping the missing partitions {missing} of {asset_name}")
+            table = table.replace_schema_metadata(
+                {**(table.schema.metadata or {}), SKIPPED_PARTITIONS_KEY: json.dumps(missing)}
+            )
+
+        return table
@@ -1,18 +1,23 @@
 # fmt: off
 from dagster import AssetSelection, define_asset_job
 from ..partitions import monthly_partition
+from ..concurrency import PARTITIONING_LIMIT_TAG
 
 YT_monthly_parquet_2022 = AssetSelection.assets("YT_monthly_parquet_2022")
 
 YT_monthly_csv_2022 = AssetSelection.assets("YT_monthly_csv_2022")
 
+YT_monthly_changes_2022 = AssetSelection.assets("YT_monthly_changes_2022")
+
+taxi_trip_records_storage = AssetSelection.assets("taxi_trip_records_storage")
+
 
 fetch_YT_csv_2022_job = define_asset_job(
     name="fetch_YT_csv_2022_job",
     partitions_def=monthly_partition,
     selection=YT_monthly_csv_2022,
     tags={
-        "partitioning_limit": "medium",
+        PARTITIONING_LIMIT_TAG: "medium",
         }
 )
 
@@ -22,6 +27,22 @@ convert_to_parquet_YT_2022_job = define_asset_job(
     partitions_def=monthly_partition,
     selection=YT_monthly_parquet_2022,
     tags={
-        "partitioning_limit": "low"
+        PARTITIONING_LIMIT_TAG: "low"
     },
 )
+
+
+refresh_YT_changes_2022_job = define_asset_job(
+    name="refresh_YT_changes_2022_job",
+    partitions_def=monthly_partition,
+    selection=YT_monthly_changes_2022,
+    tags={
+        PARTITIONING_LIMIT_TAG: "medium"
+    },
+)
+
+
+compact_taxi_trip_records_job = define_asset_job(
+    name="compact_taxi_trip_records_job",
+    selection=taxi_trip_records_storage,
+)
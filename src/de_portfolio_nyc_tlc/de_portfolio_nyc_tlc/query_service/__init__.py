@@ -0,0 +1,347 @@
+import argparse
+import io
+import json
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+
+from ..assets.yellow_taxi_data.helpers import snapshot_helpers as snapshot_helper
+
+if TYPE_CHECKING:
+    from pyarrow import Table
+
+DEFAULT_PORT = 8765
+# the number of queries that run at once, each on its own cursor of the snapshot
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CACHE_ENTRIES = 256
+DEFAULT_CACHE_BYTES = 256 * 1_000_000
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# the string literals and quoted identifiers of a query, which are kept as they are by `normalize_sql`
+SQL_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    The cache key of a query: its comments removed, its whitespace collapsed and its keywords and identifiers
+    lowercased (DuckDB identifiers are case-insensitive), outside of its string literals and quoted identifiers
+    """
+    parts = SQL_QUOTED.split(sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = " ".join(SQL_COMMENT.sub(" ", parts[i]).lower().split())
+
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+class QueryResultCache:
+    """
+    LRU cache of the query results, bounded by its number of entries and the bytes of the arrow tables
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_CACHE_ENTRIES,
+        max_bytes: int = DEFAULT_CACHE_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple[str, str], "Table"] = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple[str, str]) -> Optional["Table"]:
+        with self.lock:
+            table = self.entries.get(key)
+            if table is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return table
+
+    def put(self, key: tuple[str, str], table: "Table") -> None:
+        # a result larger than the whole cache is not cached
+        if table.nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key).nbytes
+            self.entries[key] = table
+            self.nbytes += table.nbytes
+            while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class SnapshotConnectionPool:
+    """
+    Read-only cursors of a snapshot. The external access (e.g., reading or writing files) is disabled, and
+    cannot be enabled again by a query. Once the pool is retired, for a newer snapshot, its connection is
+    closed as soon as its last running query returns its cursor
+    """
+
+    def __init__(self, database: str, size: int = DEFAULT_POOL_SIZE):
+        self.database = database
+        self.conn = duckdb.connect(
+            database, read_only=True, config={"enable_external_access": False}
+        )
+        self.idle: queue.Queue[duckdb.DuckDBPyConnection] = queue.Queue()
+        for _ in range(size):
+            self.idle.put(self.conn.cursor())
+        self.busy = 0
+        self.retired = False
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def cursor(self):
+        with self.lock:
+            if self.retired:
+                raise RetiredSnapshotError(self.database)
+            self.busy += 1
+
+        try:
+            cursor = self.idle.get()
+            try:
+                yield cursor
+            finally:
+                self.idle.put(cursor)
+        finally:
+            with self.lock:
+                self.busy -= 1
+                # closing the connection closes its cursors
+                if self.retired and self.busy == 0:
+                    self.conn.close()
+
+    def retire(self) -> None:
+        with self.lock:
+            self.retired = True
+            if self.busy == 0:
+                self.conn.close()
+
+
+class RetiredSnapshotError(Exception):
+    pass
+
+
+class NoSnapshotError(Exception):
+    pass
+
+
+class QueryService:
+    """
+    Answers the queries from the latest published snapshot of the warehouse (see `taxi_trip_records_snapshot`),
+    so they never wait for the lock of the pipeline. The results are cached by the normalized query and the
+    version stamp of the snapshot, which changes whenever an asset writes a table
+    """
+
+    def __init__(
+        self,
+        snapshot_dir: str = snapshot_helper.SNAPSHOT_DIR,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        cache: Optional[QueryResultCache] = None,
+    ):
+        self.snapshot_dir = snapshot_dir
+        self.pool_size = pool_size
+        self.cache = cache or QueryResultCache()
+        self.snapshot: Optional[dict] = None
+        self.pool: Optional[SnapshotConnectionPool] = None
+        self.current_file_mtime: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def get_snapshot(self) -> tuple[dict, SnapshotConnectionPool]:
+        """
+        The current snapshot and its pool, which is switched once a newer snapshot is published
+        """
+        current_file = os.path.join(
+            self.snapshot_dir, snapshot_helper.CURRENT_SNAPSHOT_FILE
+        )
+        with self.lock:
+            # a stat per query is enough to notice a new snapshot, CURRENT_SNAPSHOT_FILE is only read when it changes
+            mtime = (
+                os.stat(current_file).st_mtime_ns
+                if os.path.exists(current_file)
+                else None
+            )
+            if mtime != self.current_file_mtime:
+                snapshot = snapshot_helper.read_current_snapshot(self.snapshot_dir)
+                if snapshot is None:
+                    raise NoSnapshotError(
+                        f"No snapshot was published to {self.snapshot_dir}"
+                    )
+                if self.pool is None or snapshot["database"] != self.pool.database:
+                    if self.pool is not None:
+                        self.pool.retire()
+                    self.pool = SnapshotConnectionPool(
+                        snapshot["database"], self.pool_size
+                    )
+                self.snapshot = snapshot
+                self.current_file_mtime = mtime
+
+            if self.snapshot is None:
+                raise NoSnapshotError(
+                    f"No snapshot was published to {self.snapshot_dir}"
+                )
+            return self.snapshot, self.pool
+
+    def query(self, sql: str) -> tuple["Table", dict, bool]:
+        """
+        The result of `sql`, the snapshot that answered it, and whether it was answered from the cache
+        """
+        normalized_sql = normalize_sql(sql)
+        while True:
+            snapshot, pool = self.get_snapshot()
+            key = (snapshot["version_stamp"], normalized_sql)
+            table = self.cache.get(key)
+            if table is not None:
+                return table, snapshot, True
+
+            try:
+                with pool.cursor() as cursor:
+                    table = cursor.execute(sql).fetch_arrow_table()
+                break
+            except RetiredSnapshotError:
+                # a newer snapshot was published in the meantime
+                continue
+
+        self.cache.put(key, table)
+        return table, snapshot, False
+
+    def close(self) -> None:
+        with self.lock:
+            if self.pool is not None:
+                self.pool.retire()
+
+
+def to_json(table: "Table") -> bytes:
+    return json.dumps(
+        {"columns": table.column_names, "rows": table.to_pylist()}, default=str
+    ).encode()
+
+
+def to_arrow_stream(table: "Table") -> bytes:
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    `POST /query` with the SQL as the body answers as JSON, or as an Arrow IPC stream with `?format=arrow`
+    or `Accept: application/vnd.apache.arrow.stream`. `GET /health` answers the snapshot and the cache stats
+    """
+
+    server: "QueryServer"
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            return self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+        try:
+            snapshot, _ = self.server.service.get_snapshot()
+        except NoSnapshotError as e:
+            return self.send_json(503, {"error": str(e)})
+        self.send_json(
+            200, {"snapshot": snapshot, "cache": self.server.service.cache.stats()}
+        )
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/query":
+            return self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+        sql = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        try:
+            table, snapshot, cached = self.server.service.query(sql)
+        except NoSnapshotError as e:
+            return self.send_json(503, {"error": str(e)})
+        except duckdb.Error as e:
+            return self.send_json(400, {"error": str(e)})
+
+        as_arrow = parse_qs(url.query).get("format", [""])[
+            0
+        ] == "arrow" or ARROW_STREAM_MEDIA_TYPE in self.headers.get("Accept", "")
+        body = to_arrow_stream(table) if as_arrow else to_json(table)
+        self.send_response(200)
+        self.send_header(
+            "Content-Type", ARROW_STREAM_MEDIA_TYPE if as_arrow else "application/json"
+        )
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", "HIT" if cached else "MISS")
+        self.send_header("X-Snapshot-Version", snapshot["version_stamp"])
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, content: dict) -> None:
+        body = json.dumps(content, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], service: QueryService):
+        super().__init__(address, QueryRequestHandler)
+        self.service = service
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local read-only query service over the published snapshots of the warehouse"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--snapshot-dir", default=snapshot_helper.SNAPSHOT_DIR)
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE)
+    parser.add_argument("--cache-entries", type=int, default=DEFAULT_CACHE_ENTRIES)
+    parser.add_argument(
+        "--cache-mb", type=int, default=DEFAULT_CACHE_BYTES // 1_000_000
+    )
+    args = parser.parse_args()
+
+    service = QueryService(
+        args.snapshot_dir,
+        args.pool_size,
+        QueryResultCache(args.cache_entries, args.cache_mb * 1_000_000),
+    )
+    server = QueryServer((args.host, args.port), service)
+    print(
+        f"Serving the snapshots of {args.snapshot_dir} on http://{args.host}:{args.port}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -1,10 +1,155 @@
-from dagster import ConfigurableResource
-from sodapy import Socrata
+import random
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Optional
+
+import duckdb
+from dagster import Config, ConfigurableResource, get_dagster_logger
+from dagster_duckdb import DuckDBResource
+from pydantic import Field
+
+from ..utils.memory_utils import get_total_memory_bytes
+
+if TYPE_CHECKING:
+    from sodapy import Socrata
 
 
 class SocrataClientResource(ConfigurableResource):
     url: str
     app_token: str
 
-    def getClient(self) -> Socrata:
+    def getClient(self) -> "Socrata":
+        from sodapy import Socrata
+
         return Socrata(self.url, self.app_token)
+
+
+def is_lock_error(error: Exception) -> bool:
+    return isinstance(error, duckdb.IOException) and "lock" in str(error).lower()
+
+
+class DuckDBProfile(Config):
+    """
+    Execution settings of the connections opened with this profile, `None` keeps the DuckDB default
+    """
+
+    threads: Optional[int] = None
+    memory_limit: Optional[str] = Field(
+        default=None, description="e.g., `8GB`, takes precedence over `memory_fraction`"
+    )
+    memory_fraction: Optional[float] = Field(
+        default=None,
+        description="Memory limit as a fraction of the physical memory of the host",
+    )
+    temp_directory: Optional[str] = Field(
+        default=None,
+        description="Where the operators that exceed the memory limit spill, defaults to the resource's temp_directory",
+    )
+    preserve_insertion_order: Optional[bool] = None
+    read_only: bool = False
+
+
+DUCKDB_PROFILES = {
+    "default": DuckDBProfile(),
+    # the bulk loads do not need to keep the insertion order of the rows (ORDER BY is still respected),
+    #   which lets DuckDB parallelize the inserts with less memory
+    "bulk_load": DuckDBProfile(preserve_insertion_order=False),
+    # the large DISTINCT and GROUP BY builds of the dim tables spill to the temp_directory once they reach
+    #   their memory limit, instead of competing with the other processes for the memory of the host
+    "dim_build": DuckDBProfile(memory_fraction=0.5, preserve_insertion_order=False),
+    # for the query consumers, several read-only processes can open the database at the same time
+    "read_only": DuckDBProfile(read_only=True),
+}
+
+
+def get_profile_settings(
+    profile: DuckDBProfile, temp_directory: Optional[str] = None
+) -> dict[str, str | int | bool]:
+    """
+    The DuckDB settings of `profile`, to be applied with `SET`
+    """
+    memory_limit = profile.memory_limit
+    total_memory = get_total_memory_bytes()
+    if memory_limit is None and profile.memory_fraction and total_memory:
+        memory_limit = f"{int(total_memory * profile.memory_fraction) // 1_000_000}MB"
+
+    settings = {
+        "threads": profile.threads,
+        "memory_limit": memory_limit,
+        "temp_directory": profile.temp_directory or temp_directory,
+        "preserve_insertion_order": profile.preserve_insertion_order,
+    }
+    return {name: value for name, value in settings.items() if value is not None}
+
+
+def format_setting_value(value: str | int | bool) -> str:
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+
+    return str(value)
+
+
+class RetryingDuckDBResource(DuckDBResource):
+    """
+    DuckDBResource that waits for the file lock of the database instead of failing.
+    DuckDB only allows one writer process per database file, so assets running in other
+    processes (e.g. other steps of the multiprocess_executor or other runs) retry to connect
+    until `lock_timeout` is reached
+    """
+
+    lock_timeout: float = Field(
+        default=30 * 60,
+        description="Total seconds to wait for the lock of the database file",
+    )
+    lock_retry_interval: float = Field(
+        default=1.0,
+        description="Base seconds to wait between connection attempts, a random jitter is added",
+    )
+    temp_directory: Optional[str] = Field(
+        default=None,
+        description="Where the profiles spill to disk, defaults to `<database>.tmp`",
+    )
+    profiles: Dict[str, DuckDBProfile] = Field(
+        default={},
+        description="Profiles that are added to, or replace, the DUCKDB_PROFILES of the same name",
+    )
+
+    @contextmanager
+    def get_connection(self, profile: str = "default"):
+        """
+        Connect to the database with the settings of `profile` (see DUCKDB_PROFILES)
+        """
+        profiles = {**DUCKDB_PROFILES, **self.profiles}
+        if profile not in profiles:
+            raise ValueError(
+                f"Unknown DuckDB profile {profile!r}, use one of {list(profiles)}"
+            )
+        settings = profiles[profile]
+
+        log = get_dagster_logger()
+        deadline = time.monotonic() + self.lock_timeout
+
+        while True:
+            try:
+                conn = duckdb.connect(
+                    database=self.database,
+                    read_only=settings.read_only,
+                    config=self.connection_config,
+                )
+                break
+            except duckdb.IOException as e:
+                if not is_lock_error(e) or time.monotonic() >= deadline:
+                    raise
+                log.debug(f"{self.database} is locked, retrying to connect")
+                # the jitter prevents the waiting processes from retrying at the same time
+                time.sleep(self.lock_retry_interval * (1 + random.random()))
+
+        # release the lock even when the asset fails
+        try:
+            for name, value in get_profile_settings(settings, self.temp_directory).items():
+                conn.execute(f"SET {name} = {format_setting_value(value)}")
+            yield conn
+        finally:
+            conn.close()
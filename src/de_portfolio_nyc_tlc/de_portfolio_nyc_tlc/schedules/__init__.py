@@ -0,0 +1,37 @@
+from dagster import (
+    DefaultScheduleStatus,
+    RunRequest,
+    ScheduleEvaluationContext,
+    schedule,
+)
+
+from ..jobs import compact_taxi_trip_records_job, refresh_YT_changes_2022_job
+from ..partitions import monthly_partition
+
+
+@schedule(
+    job=refresh_YT_changes_2022_job,
+    cron_schedule="0 6 * * *",
+    default_status=DefaultScheduleStatus.STOPPED,
+)
+def daily_YT_changes_2022_schedule(context: ScheduleEvaluationContext):
+    """
+    Merges the corrections republished by NYC Open Data into every month of 2022, once a day
+    """
+    scheduled_date = context.scheduled_execution_time.strftime("%Y-%m-%d")
+    for partition_key in monthly_partition.get_partition_keys():
+        yield RunRequest(
+            run_key=f"{partition_key}_{scheduled_date}", partition_key=partition_key
+        )
+
+
+@schedule(
+    job=compact_taxi_trip_records_job,
+    cron_schedule="0 3 * * 0",
+    default_status=DefaultScheduleStatus.STOPPED,
+)
+def weekly_taxi_trip_records_compaction_schedule(context: ScheduleEvaluationContext):
+    """
+    Measures the storage of the DuckDB database once a week, and compacts it once its free blocks pass the threshold
+    """
+    return RunRequest(run_key=context.scheduled_execution_time.strftime("%Y-%m-%d"))
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+
+# the odd multipliers of the multiplicative hashes that pick the bits of a key within its Bloom filter word
+BLOOM_MULTIPLIERS = [
+    np.uint64(multiplier)
+    for multiplier in np.random.default_rng(0).integers(1, 2**63, 16, dtype=np.uint64) * 2 + 1
+]
+
+
+class StreamingDeduplicator:
+    """
+    Memory-bounded duplicate detection of 64-bit key hashes, batch by batch, e.g., the pages of a download or
+    the months of a table load. The seen hashes are kept in a partitioned set of sorted `uint64` arrays (~8 bytes
+    per key, instead of ~100 for a Python set of strings). A Bloom filter in front of it answers the lookups of
+    most new keys, so only the keys that it flags are confirmed against their partition of the exact set
+    """
+
+    def __init__(
+        self,
+        expected_keys: int,
+        false_positive_rate: float = 0.001,
+        num_partitions: int = 4096,
+    ):
+        expected_keys = max(expected_keys, 1)
+        # the optimal size and number of hash functions of a Bloom filter for the expected keys
+        num_bits = math.ceil(
+            -expected_keys * math.log(false_positive_rate) / math.log(2) ** 2
+        )
+        num_bits = max(num_bits, 64)
+        self.num_hashes = min(
+            max(round(num_bits / expected_keys * math.log(2)), 1), len(BLOOM_MULTIPLIERS)
+        )
+        self.bloom = np.zeros(math.ceil(num_bits / 64), dtype=np.uint64)
+
+        # the partition of a hash is its top bits, and the Bloom filter uses its lower bits
+        self.partition_shift = np.uint64(64 - int(math.log2(num_partitions)))
+        self.sorted_partitions = [np.empty(0, dtype=np.uint64)] * num_partitions
+        # the hashes that are added to a partition, and are merged into it once the partition is looked up
+        self.pending_partitions: list[list[np.ndarray]] = [[] for _ in range(num_partitions)]
+
+        self.num_keys = 0
+        self.duplicates = 0
+        self.bloom_positives = 0
+
+    def add(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Add the key hashes of a batch. Returns a mask of the rows that are seen for the first time, i.e.,
+        the rows to keep; the duplicates within the batch and of the previous batches are `False`
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        # only the first occurrence of a key within the batch is kept
+        is_new = np.zeros(len(hashes), dtype=bool)
+        is_new[np.unique(hashes, return_index=True)[1]] = True
+
+        # the Bloom filter keys are computed once, for the lookup and for adding the new keys
+        words, masks = self._bloom_keys(hashes)
+        maybe_seen = self._bloom_contains(words, masks) & is_new
+        self.bloom_positives += int(maybe_seen.sum())
+        if maybe_seen.any():
+            is_new[np.flatnonzero(maybe_seen)[self._contains(hashes[maybe_seen])]] = False
+
+        new_hashes = hashes[is_new]
+        self._bloom_add(words[is_new], masks[is_new])
+        self._partitions_add(new_hashes)
+
+        self.num_keys += len(new_hashes)
+        self.duplicates += len(hashes) - len(new_hashes)
+        return is_new
+
+    def _bloom_keys(self, hashes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The Bloom filter is blocked, i.e., the `num_hashes` bits of a key are all in the same 64-bit word, so a
+        key is looked up and added with a single memory access. The word comes from the lower bits of the hash,
+        and the bits within the word from multiplicative hashes of the whole hash
+        """
+        words = (hashes & np.uint64(0xFFFFFFFF)) % np.uint64(len(self.bloom))
+        masks = np.zeros(len(hashes), dtype=np.uint64)
+        for multiplier in BLOOM_MULTIPLIERS[: self.num_hashes]:
+            masks |= np.uint64(1) << ((hashes * multiplier) >> np.uint64(58))
+
+        return words, masks
+
+    def _bloom_contains(self, words: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        return (self.bloom[words] & masks) == masks
+
+    def _bloom_add(self, words: np.ndarray, masks: np.ndarray) -> None:
+        np.bitwise_or.at(self.bloom, words, masks)
+
+    def _contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        The exact confirmation of the hashes flagged by the Bloom filter
+        """
+        partitions = hashes >> self.partition_shift
+        contains = np.zeros(len(hashes), dtype=bool)
+        for partition in np.unique(partitions):
+            in_partition = partitions == partition
+            seen = self._merge_partition(int(partition))
+            positions = np.searchsorted(seen, hashes[in_partition])
+            positions[positions == len(seen)] = 0
+            contains[in_partition] = (
+                seen[positions] == hashes[in_partition] if len(seen) else False
+            )
+
+        return contains
+
+    def _merge_partition(self, partition: int) -> np.ndarray:
+        pending = self.pending_partitions[partition]
+        if pending:
+            # the partition and the pending hashes are sorted runs, which the stable sort merges in linear time
+            merged = np.concatenate([self.sorted_partitions[partition], *pending])
+            self.sorted_partitions[partition] = np.sort(merged, kind="stable")
+            pending.clear()
+
+        return self.sorted_partitions[partition]
+
+    def _partitions_add(self, hashes: np.ndarray) -> None:
+        hashes = np.sort(hashes)
+        # the partition is the top bits of a hash, so the sorted hashes are grouped by partition
+        partitions = hashes >> self.partition_shift
+        bounds = np.flatnonzero(np.diff(partitions)) + 1
+        for partition_hashes in np.split(hashes, bounds):
+            if len(partition_hashes):
+                self.pending_partitions[int(partition_hashes[0] >> self.partition_shift)].append(
+                    partition_hashes
+                )
+
+    def memory_bytes(self) -> int:
+        return self.bloom.nbytes + self.num_keys * np.dtype(np.uint64).itemsize
@@ -0,0 +1,112 @@
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+from typing import TYPE_CHECKING
+
+# httpx is imported by the assets at runtime, only the type hints are needed here
+if TYPE_CHECKING:
+    from logging import Logger
+
+    from httpx import AsyncClient
+
+# the validators and the checksum of a cached file are kept next to it, in `<file>.cache.json`
+CACHE_INFO_SUFFIX = ".cache.json"
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_cache_info_path(file_path: str) -> str:
+    return f"{file_path}{CACHE_INFO_SUFFIX}"
+
+
+def read_cache_info(file_path: str) -> dict | None:
+    """
+    The `etag`, `last_modified`, `sha256`, `bytes` and `fetched_at` of the cached copy of `file_path`.
+    Returns `None` if the file or its cache info is missing, in which case the file is downloaded again
+    """
+    cache_info_path = get_cache_info_path(file_path)
+    if not os.path.exists(file_path) or not os.path.exists(cache_info_path):
+        return None
+
+    with open(cache_info_path) as f:
+        cache_info = json.load(f)
+    # a file that was changed or truncated outside of the cache is not revalidated
+    if os.path.getsize(file_path) != cache_info["bytes"]:
+        return None
+    return cache_info
+
+
+def write_atomically(path: str, content: bytes) -> None:
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+
+async def fetch_cached(
+    client: "AsyncClient",
+    url: str,
+    file_path: str,
+    log: "Logger | None" = None,
+) -> dict[str, str | int | bool | None]:
+    """
+    Download `url` to `file_path`, unless the cached copy is still current. The cached copy is revalidated
+    with `If-None-Match` / `If-Modified-Since`, and the server answers `304 Not Modified` without a body when
+    it did not change. Otherwise, the body is streamed to a temporary file, hashed while it is written, and
+    renamed over `file_path` once it is complete, so a failed download never replaces the cached copy.
+
+    Returns the cache info of the file, and whether its content `changed` since the last fetch.
+    HTTP errors are raised, so the callers never build from a missing file
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    cached = read_cache_info(file_path)
+
+    headers = {}
+    if cached is not None:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304 and cached is not None:
+            if log is not None:
+                log.info(f"{url}: not modified since {cached['fetched_at']}")
+            return {**cached, "changed": False}
+        response.raise_for_status()
+
+        sha256 = hashlib.sha256()
+        num_bytes = 0
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(file_path), delete=False
+        ) as f:
+            try:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    num_bytes += len(chunk)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, file_path)
+
+    cache_info = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": sha256.hexdigest(),
+        "bytes": num_bytes,
+        "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    write_atomically(
+        get_cache_info_path(file_path), json.dumps(cache_info).encode()
+    )
+
+    # a server without validators answers 200 every time, the checksum tells whether the content changed
+    changed = cached is None or cached["sha256"] != cache_info["sha256"]
+    if log is not None:
+        log.info(
+            f"{url}: downloaded {num_bytes:,} bytes, {'changed' if changed else 'unchanged'}"
+        )
+    return {**cache_info, "changed": changed}
@@ -1,10 +1,96 @@
-def log_w_header(message: str, header_char="#"):
-    len_border = len(message) + 4
-    border = header_char * len_border
-
-    # add top border
-    # add "# {message} #" and center message with :^ and x-padding of 1 space
-    # add bottom border
-    print(
-        f"{border}\n{header_char}{message:^{len(message) + 2}}{header_char}\n{border}"
-    )
+import time
+from logging import Logger
+from typing import Callable
+
+
+class ProgressReporter:
+    """
+    Rate-limited progress logging for long running loops such as the stream download of a partition.
+    Progress is sent to `log` (e.g. `context.log`) at most once every `interval` seconds and reports
+    the throughput (rows/s, MB/s) and the ETA when `expected_rows` is known
+    """
+
+    def __init__(
+        self,
+        log: Logger,
+        name: str,
+        expected_rows: int | None = None,
+        interval: float = 15.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.log = log
+        self.name = name
+        self.expected_rows = expected_rows
+        self.interval = interval
+        self.clock = clock
+
+        self.rows = 0
+        self.num_bytes = 0
+        self.start_time = clock()
+        self.last_report_time = self.start_time
+
+    def update(self, rows: int = 0, num_bytes: int = 0) -> bool:
+        """
+        Add the processed rows and bytes. Returns `True` when a progress message was logged
+        """
+        self.rows += rows
+        self.num_bytes += num_bytes
+
+        now = self.clock()
+        if now - self.last_report_time < self.interval:
+            return False
+
+        self.last_report_time = now
+        self.log.info(self.format_progress(now))
+        return True
+
+    def finish(self) -> dict[str, float]:
+        """
+        Log the final throughput and return it as a dictionary to be used as materialization metadata
+        """
+        stats = self.stats()
+        self.log.info(
+            f"{self.name}: done. {self.rows:,} rows ({stats['MB']:.1f} MB) in {stats['elapsed_s']:.1f}s"
+            + f" @ {stats['rows_per_s']:,.0f} rows/s, {stats['MB_per_s']:.2f} MB/s"
+        )
+        return stats
+
+    def stats(self, now: float | None = None) -> dict[str, float]:
+        now = self.clock() if now is None else now
+        # avoid division by zero for very fast (or mocked) loops
+        elapsed = max(now - self.start_time, 1e-9)
+        megabytes = self.num_bytes / 1_000_000
+
+        return {
+            "elapsed_s": elapsed,
+            "MB": megabytes,
+            "rows_per_s": self.rows / elapsed,
+            "MB_per_s": megabytes / elapsed,
+        }
+
+    def eta(self, now: float | None = None) -> float | None:
+        """
+        Estimated seconds left, or `None` if the expected number of rows is unknown
+        """
+        if not self.expected_rows or self.rows == 0:
+            return None
+
+        rows_per_s = self.stats(now)["rows_per_s"]
+        rows_left = max(self.expected_rows - self.rows, 0)
+        return rows_left / rows_per_s
+
+    def format_progress(self, now: float | None = None) -> str:
+        stats = self.stats(now)
+        eta = self.eta(now)
+
+        progress = f"{self.rows:,}"
+        if self.expected_rows:
+            progress += f"/{self.expected_rows:,} rows ({self.rows / self.expected_rows:.0%})"
+        else:
+            progress += " rows"
+
+        return (
+            f"{self.name}: {progress}"
+            + f" | {stats['rows_per_s']:,.0f} rows/s, {stats['MB_per_s']:.2f} MB/s"
+            + f" | ETA: {'unknown' if eta is None else f'{eta:,.0f}s'}"
+        )
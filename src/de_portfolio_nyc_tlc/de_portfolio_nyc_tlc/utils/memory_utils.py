@@ -0,0 +1,105 @@
+import os
+import sys
+
+from dagster import AssetExecutionContext, MetadataValue
+
+from ..concurrency import PARTITIONING_LIMITS, partitioning_pool
+
+
+def get_peak_rss_bytes() -> int | None:
+    """
+    Peak resident memory of the current process (i.e., of the step with the multiprocess executor)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def get_current_rss_bytes() -> int | None:
+    try:
+        import resource
+
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (ImportError, OSError):
+        return None
+
+    return resident_pages * resource.getpagesize()
+
+
+def get_available_memory_bytes() -> int | None:
+    """
+    Memory that can be used without swapping (`MemAvailable` of /proc/meminfo), `None` if unknown
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def get_total_memory_bytes() -> int | None:
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def recommend_concurrency(
+    peak_rss_bytes: int,
+    available_bytes: int,
+    limit: int,
+    headroom: float = 0.8,
+) -> int:
+    """
+    How many steps that each peak at `peak_rss_bytes` fit in `headroom` of the `available_bytes`,
+    between 1 and the configured `limit`
+    """
+    if peak_rss_bytes <= 0:
+        return limit
+
+    fits = int(available_bytes * headroom // peak_rss_bytes)
+    return max(1, min(limit, fits))
+
+
+def record_peak_memory(
+    context: AssetExecutionContext, level: str
+) -> dict[str, MetadataValue]:
+    """
+    Measure the peak memory of the step and the memory available on the host, and recommend how many
+    steps of the `level` pool can run at once. The recommendation is only recorded and logged: the limits
+    are set by the operator (dagster.yaml, or `dagster instance concurrency set <pool> <slots>`), never
+    from within a step. Returns the materialization metadata
+    """
+    peak_rss = get_peak_rss_bytes()
+    available = get_available_memory_bytes()
+    if peak_rss is None or available is None:
+        return {}
+
+    # the memory held by this step is available to the next steps once it exits
+    budget = available + (get_current_rss_bytes() or 0)
+    limit = PARTITIONING_LIMITS[level]
+    recommended = recommend_concurrency(peak_rss, budget, limit)
+
+    pool = partitioning_pool(level)
+    if recommended < limit:
+        context.log.warning(
+            f"Only {recommended} of the {limit} concurrent steps of {pool} fit in memory,"
+            + f" consider lowering the {level!r} limit of dagster.yaml to {recommended},"
+            + f" or `dagster instance concurrency set {pool} {recommended}`"
+        )
+
+    return {
+        "Peak RSS (MB)": MetadataValue.float(round(peak_rss / 1_000_000, 2)),
+        "Available memory (MB)": MetadataValue.float(round(budget / 1_000_000, 2)),
+        "Recommended concurrency": MetadataValue.int(recommended),
+    }
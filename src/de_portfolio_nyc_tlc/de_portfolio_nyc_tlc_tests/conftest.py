@@ -0,0 +1,59 @@
+import duckdb
+from pytest import fixture
+
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.constants import table_names
+
+
+def create_test_warehouse(database: str) -> str:
+    """
+    Creates a small `yellow_taxi_trips` and `taxi_zone_lookup` table to build the dims from
+    """
+    with duckdb.connect(database) as conn:
+        conn.sql(
+            f"""--sql
+            CREATE OR REPLACE TABLE {table_names.TAXI_ZONE_LOOKUP} (
+                location_id SMALLINT PRIMARY KEY,
+                borough TEXT,
+                zone TEXT,
+                service_zone TEXT
+            );
+
+            INSERT INTO {table_names.TAXI_ZONE_LOOKUP} VALUES
+                (1, 'EWR', 'Newark Airport', 'EWR'),
+                (2, 'Queens', 'Jamaica Bay', 'Boro Zone'),
+                (3, 'Bronx', 'Allerton/Pelham Gardens', 'Boro Zone'),
+                (4, 'Manhattan', 'Alphabet City', 'Yellow Zone');
+
+            CREATE OR REPLACE TABLE {table_names.YELLOW_TAXI_TRIPS} AS
+                SELECT
+                    i AS trip_id,
+                    (i % 2 + 1)::TINYINT AS vendor_id,
+                    TIMESTAMP '2022-01-01 00:00:00' + INTERVAL (i * 17) MINUTE AS pickup_dtime,
+                    TIMESTAMP '2022-01-01 00:12:00' + INTERVAL (i * 17) MINUTE AS dropoff_dtime,
+                    (i % 3 + 1)::TINYINT AS passenger_count,
+                    (i % 7 + 1) * 0.5 AS trip_distance,
+                    1::TINYINT AS rate_code_id,
+                    (i % 5 = 0)::TINYINT AS store_and_fwd_flag,
+                    (i % 4 + 1)::SMALLINT AS pickup_lid,
+                    ((i + 1) % 4 + 1)::SMALLINT AS dropoff_lid,
+                    (i % 2 + 1)::TINYINT AS payment_type,
+                    (i % 7 + 1) * 2.5 AS fare_amount,
+                    0.5 AS extra,
+                    0.5 AS mta_tax,
+                    (i % 3) * 1.0 AS tip_amount,
+                    0.0 AS tolls_amount,
+                    0.3 AS improvement_surcharge,
+                    (i % 7 + 1) * 2.5 + 1.3 + (i % 3) * 1.0 AS total_amount,
+                    2.5 AS congestion_surcharge,
+                    0.0 AS airport_fee,
+                    i AS __index_level_0__
+                FROM range(1, 501) AS t(i);
+            """
+        )
+
+    return database
+
+
+@fixture
+def test_warehouse(tmp_path) -> str:
+    return create_test_warehouse(str(tmp_path / "taxi_trip_records.duckdb"))
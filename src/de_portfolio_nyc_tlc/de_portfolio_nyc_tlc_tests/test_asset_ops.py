@@ -1,13 +1,48 @@
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
 from pathlib import Path
+from threading import Thread
+from urllib.parse import parse_qs, urlparse
 
 from dagster import build_op_context
 from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
     csv_asset_helpers as helper,
 )
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    parquet_asset_helpers as parquet_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    trip_schema_helpers as schema_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    cdc_helpers as cdc_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    row_count_helpers as row_count_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    dedup_helpers as dedup_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    sketch_helpers as sketch_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    plausibility_helpers as plausibility_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.ops import (
+    csv_assets_ops as csv_ops,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.jobs.jobs import (
+    reconcile_YT_row_counts_2022_job,
+)
 
-from pytest import fixture, mark
+from pytest import fixture, mark, raises
 
+import numpy as np
 from pandas import DataFrame
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
 @fixture
@@ -56,3 +91,431 @@ def test_get_monthly_range(start_date, expected_range):
 
     # assert
     assert output_range == expected_range
+
+
+def test_add_trip_ids_is_deterministic():
+    # arrange
+    records = [
+        {
+            "pickup_dtime": f"2022-03-0{day}",
+            "pickup_lid": lid,
+            "dropoff_dtime": f"2022-03-0{day}",
+            "dropoff_lid": 1,
+        }
+        for day in [3, 1, 2]
+        for lid in [2, 1]
+    ]
+    df = DataFrame.from_records(records)
+    shuffled_df = df.sample(frac=1, random_state=0)
+
+    # act
+    with_ids = parquet_helper.add_trip_ids(df, "2022-03-01")
+    shuffled_with_ids = parquet_helper.add_trip_ids(shuffled_df, "2022-03-01")
+
+    # assert
+    assert with_ids["trip_id"].tolist() == [
+        202203 * parquet_helper.TRIP_ID_MONTH_MULTIPLIER + row_number
+        for row_number in range(1, 7)
+    ]
+    assert with_ids.reset_index(drop=True).equals(
+        shuffled_with_ids.reset_index(drop=True)
+    )
+    # the first trip is the earliest pickup
+    assert with_ids.iloc[0][["pickup_dtime", "pickup_lid"]].tolist() == ["2022-03-01", 1]
+
+
+def test_compact_trips_table(tmp_path):
+    # arrange
+    df = DataFrame(
+        {
+            "pickup_dtime": ["2022-01-01 00:35:40", "2022-01-01 00:33:43"],
+            "fare_amount": [14.5, 0.1 + 0.2],
+            "passenger_count": [1, 2],
+        }
+    ).astype({"pickup_dtime": "datetime64[ns]"})
+    parquet_file = tmp_path / "compact.parquet"
+
+    # act
+    table = schema_helper.compact_trips_table(pa.Table.from_pandas(df))
+    pq.write_table(table, parquet_file)
+    round_trip = pq.read_table(parquet_file)
+
+    # assert
+    assert table.schema.field("fare_amount").type == pa.decimal128(9, 2)
+    assert table.schema.field("pickup_dtime").type == pa.timestamp("s")
+    assert table.schema.field("passenger_count").type == pa.int64()
+    assert round_trip["fare_amount"].to_pylist() == [Decimal("14.50"), Decimal("0.30")]
+    assert round_trip["pickup_dtime"].to_pylist() == df["pickup_dtime"].tolist()
+
+
+def test_merge_monthly_changes():
+    # arrange
+    existing = DataFrame(
+        {
+            "socrata_id": ["row-a", "row-b", "row-c"],
+            "pickup_dtime": ["2022-03-01 08:00", "2022-03-01 09:00", "2022-03-01 10:00"],
+            "pickup_lid": [1, 2, 3],
+            "dropoff_dtime": ["2022-03-01 08:10", "2022-03-01 09:10", "2022-03-01 10:10"],
+            "dropoff_lid": [4, 4, 4],
+            "trip_distance": [2.0, 2.0, 2.0],
+            "fare_amount": [8.0, 8.0, 8.0],
+            "total_amount": [10.0, 20.0, 30.0],
+        }
+    ).astype({"pickup_dtime": "datetime64[ns]", "dropoff_dtime": "datetime64[ns]"})
+    existing = pa.Table.from_pandas(
+        parquet_helper.add_trip_ids(existing, "2022-03-01"), preserve_index=True
+    )
+    # row-b is corrected, row-c is invalid after its correction (i.e., removed by the cleaning), and row-d is new
+    changes = DataFrame(
+        {
+            "socrata_id": ["row-d", "row-b"],
+            "pickup_dtime": ["2022-03-02 08:00", "2022-03-01 09:00"],
+            "pickup_lid": [5, 2],
+            "dropoff_dtime": ["2022-03-02 08:10", "2022-03-01 09:10"],
+            "dropoff_lid": [4, 4],
+            "trip_distance": [2.0, 2.0],
+            "fare_amount": [8.0, 8.0],
+            "total_amount": [40.0, 25.0],
+        }
+    ).astype({"pickup_dtime": "datetime64[ns]", "dropoff_dtime": "datetime64[ns]"})
+    changed_ids = ["row-b", "row-c", "row-d"]
+
+    # act
+    merged, changed_trips, quarantined = cdc_helper.merge_monthly_changes(
+        existing, changes, changed_ids, "2022-03-01"
+    )
+
+    # assert
+    month_prefix = 202203 * parquet_helper.TRIP_ID_MONTH_MULTIPLIER
+    assert merged.schema == existing.schema
+    assert merged.select(["trip_id", "socrata_id", "total_amount"]).to_pylist() == [
+        {"trip_id": month_prefix + 1, "socrata_id": "row-a", "total_amount": 10.0},
+        {"trip_id": month_prefix + 2, "socrata_id": "row-b", "total_amount": 25.0},
+        {"trip_id": month_prefix + 4, "socrata_id": "row-d", "total_amount": 40.0},
+    ]
+    assert changed_trips.num_rows == 2
+    assert len(quarantined) == 0
+
+
+def test_merge_monthly_changes_with_quarantined_trips():
+    # arrange
+    num_trips = 50
+    pickup_dtime = np.datetime64("2022-03-01T08:00") + np.arange(num_trips) * np.timedelta64(10, "m")
+    existing = DataFrame(
+        {
+            "socrata_id": [f"row-{i}" for i in range(num_trips)],
+            "pickup_dtime": pickup_dtime,
+            "pickup_lid": 1,
+            "dropoff_dtime": pickup_dtime + (10 + np.arange(num_trips) % 6) * np.timedelta64(1, "m"),
+            "dropoff_lid": 2,
+            "trip_distance": 2.0 + np.arange(num_trips) % 5 * 0.1,
+            "fare_amount": 10.0 + np.arange(num_trips) % 7 * 0.5,
+            "total_amount": 15.0,
+        }
+    )
+    # the last trip of the month (i.e., with the highest trip_id) ends before it starts
+    existing.loc[num_trips - 1, "dropoff_dtime"] = existing.loc[num_trips - 1, "pickup_dtime"] - np.timedelta64(1, "m")
+    existing, quarantined, _ = plausibility_helper.quarantine_implausible_trips(
+        parquet_helper.add_trip_ids(existing, "2022-03-01")
+    )
+    existing = pa.Table.from_pandas(existing, preserve_index=True)
+    # a plausible new trip, and an implausible one (a $1000/mile fare)
+    changes = DataFrame(
+        {
+            "socrata_id": ["row-new-1", "row-new-2"],
+            "pickup_dtime": [np.datetime64("2022-03-31T08:00")] * 2,
+            "pickup_lid": [1, 1],
+            "dropoff_dtime": [np.datetime64("2022-03-31T08:12")] * 2,
+            "dropoff_lid": [2, 2],
+            "trip_distance": [2.0, 2.0],
+            "fare_amount": [11.0, 2000.0],
+            "total_amount": [15.0, 2005.0],
+        }
+    )
+
+    # act
+    merged, changed_trips, merged_quarantined = cdc_helper.merge_monthly_changes(
+        existing, changes, ["row-new-1", "row-new-2"], "2022-03-01", quarantined
+    )
+
+    # assert
+    month_prefix = 202203 * parquet_helper.TRIP_ID_MONTH_MULTIPLIER
+    assert quarantined["trip_id"].tolist() == [month_prefix + num_trips]
+    # the new trips are numbered after the quarantined trip
+    assert changed_trips.select(["trip_id", "socrata_id"]).to_pylist() == [
+        {"trip_id": month_prefix + num_trips + 1, "socrata_id": "row-new-1"}
+    ]
+    assert merged_quarantined[["trip_id", "socrata_id"]].to_dict("records") == [
+        {"trip_id": month_prefix + num_trips, "socrata_id": f"row-{num_trips - 1}"},
+        {"trip_id": month_prefix + num_trips + 2, "socrata_id": "row-new-2"},
+    ]
+    assert merged_quarantined["plausibility_flags"].tolist() == [
+        plausibility_helper.NON_POSITIVE_DURATION,
+        plausibility_helper.FARE_PER_MILE_OUTLIER,
+    ]
+    assert set(merged["trip_id"].to_pylist()).isdisjoint(merged_quarantined["trip_id"])
+    assert merged.num_rows == num_trips
+
+
+@mark.parametrize(
+    "partition_key, expected_days",
+    [("2022-02-01", 28), ("2022-12-01", 31)],
+)
+def test_split_month_into_day_slices(monkeypatch, partition_key, expected_days):
+    # arrange
+    async def fetch_max_updated_at(*args, **kwargs):
+        return "2023-06-21T14:30:11.000Z"
+
+    monkeypatch.setattr(helper, "fetch_max_updated_at", fetch_max_updated_at)
+    context = build_op_context(partition_key=partition_key)
+
+    # act
+    outputs = list(csv_ops.split_month_into_day_slices(context))
+
+    # assert
+    watermark, *day_slices = outputs
+    assert watermark.value == "2023-06-21T14:30:11.000Z"
+    assert len(day_slices) == expected_days
+    assert day_slices[0].value == (partition_key, partition_key[:8] + "02")
+    assert day_slices[-1].value[1] == helper.get_monthly_range(partition_key)[1]
+
+
+@fixture
+def socrata_stub():
+    """
+    A local Socrata API that answers the `count(*)` of a month with `SOURCE_ROW_COUNTS`
+    """
+
+    class CountHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            where_query = parse_qs(urlparse(self.path).query)["$where"][0]
+            month = where_query.split("'")[1][:7]
+            body = json.dumps([{"count": str(SOURCE_ROW_COUNTS[month])}]).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CountHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/resource/qp3b-zxtp"
+    server.shutdown()
+
+
+SOURCE_ROW_COUNTS = {"2022-01": 3, "2022-02": 5, "2022-03": 2}
+
+
+def test_reconcile_row_counts(socrata_stub, tmp_path):
+    # arrange
+    (tmp_path / "csv").mkdir()
+    (tmp_path / "parquet").mkdir()
+    records = [{"vendorid": 1, "total_amount": 10.0}] * 3
+    # January matches the source, February is missing rows, and March was never downloaded
+    DataFrame.from_records(records).to_csv(tmp_path / "csv" / "2022-01.csv", index=False)
+    DataFrame.from_records(records).to_csv(tmp_path / "csv" / "2022-02.csv", index=False)
+    pq.write_table(pa.Table.from_pylist(records[:2]), tmp_path / "parquet" / "2022-01.parquet")
+    run_config = {
+        "ops": {
+            "reconcile_row_counts": {
+                "config": {
+                    "resource_url": socrata_stub,
+                    "data_dir": str(tmp_path),
+                    "partition_keys": ["2022-01-01", "2022-02-01", "2022-03-01"],
+                }
+            }
+        }
+    }
+
+    # act
+    result = reconcile_YT_row_counts_2022_job.execute_in_process(run_config=run_config)
+
+    # assert
+    observations = {
+        event.partition: event.event_specific_data.asset_observation.metadata
+        for event in result.get_asset_observation_events()
+    }
+    assert {key: value["Reconciliation status"].value for key, value in observations.items()} == {
+        "2022-01-01": "ok",
+        "2022-02-01": "drift",
+        "2022-03-01": "missing",
+    }
+    assert observations["2022-02-01"]["Row count drift"].value == -2
+    assert observations["2022-01-01"]["Number of cleaned records (parquet)"].value == 2
+
+
+@mark.parametrize("trailing_newline", [True, False])
+def test_count_csv_rows(tmp_path, trailing_newline):
+    # arrange
+    csv_file = tmp_path / "2022-01.csv"
+    csv_file.write_text("a,b\n1,2\n3,4" + ("\n" if trailing_newline else ""))
+
+    # act
+    rows = row_count_helper.count_csv_rows(str(csv_file), buffer_size=4)
+
+    # assert
+    assert rows == 2
+    assert row_count_helper.count_csv_rows(str(tmp_path / "missing.csv")) is None
+
+
+def test_find_duplicate_trips():
+    # arrange
+    month_prefix = parquet_helper.TRIP_ID_MONTH_MULTIPLIER
+    trips = DataFrame(
+        {
+            "trip_id": [202201 * month_prefix + 1, 202201 * month_prefix + 2]
+            + [202202 * month_prefix + i for i in [1, 2, 3]],
+            # row-a is served again in February, and the trips without a row id are keyed by their natural key
+            "socrata_id": ["row-a", None, "row-a", None, None],
+            "pickup_dtime": ["2022-01-31 23:50", "2022-01-05 10:00"] + ["2022-01-05 10:00"] * 3,
+            "pickup_lid": [1, 2, 2, 2, 3],
+            "total_amount": [10.0, 12.5, 10.0, 12.5, 12.5],
+        }
+    )
+    monthly_trips = pa.Table.from_pandas(trips)
+
+    # act
+    duplicate_trips = dedup_helper.find_duplicate_trips(monthly_trips)
+
+    # assert
+    assert duplicate_trips["trip_id"].to_pylist() == [
+        202202 * month_prefix + 1,
+        202202 * month_prefix + 2,
+    ]
+    assert dedup_helper.count_duplicates_per_partition(duplicate_trips) == {"2022-02-01": 2}
+
+
+def test_monthly_sketches_merge_over_partitions(tmp_path):
+    # arrange
+    rng = np.random.default_rng(0)
+    durations = []
+    for month in [1, 2]:
+        num_trips = 20_000
+        pickup_dtime = np.datetime64(f"2022-0{month}-01") + rng.integers(
+            0, 28 * 86400, num_trips
+        ).astype("timedelta64[s]")
+        duration = rng.integers(60, 3600, num_trips)
+        trips = pa.table(
+            {
+                "pickup_dtime": pickup_dtime,
+                "dropoff_dtime": pickup_dtime + duration.astype("timedelta64[s]"),
+                "fare_amount": rng.uniform(3, 80, num_trips),
+                "trip_distance": rng.uniform(0.5, 20, num_trips),
+                # every month has 100 * 100 zone pairs, half of them are shared by both months
+                "pickup_lid": (month * 50 + np.arange(num_trips) % 100).astype(np.int16),
+                "dropoff_lid": (np.arange(num_trips) // 100 % 100 + 1).astype(np.int16),
+            }
+        )
+        sketches = sketch_helper.build_monthly_sketches(trips)
+        pq.write_table(
+            sketches, sketch_helper.get_sketch_path(f"2022-0{month}-01", str(tmp_path))
+        )
+        durations.append(duration)
+    sketch_files = sketch_helper.get_sketch_files("2022-01-01", "2022-12-01", str(tmp_path))
+
+    # act
+    p50, p95 = sketch_helper.query_quantiles(sketch_files, "duration_s", [0.5, 0.95])[-1]
+    distinct_zone_pairs = sketch_helper.query_distinct_count(sketch_files)
+
+    # assert
+    expected_p50, expected_p95 = np.quantile(np.concatenate(durations), [0.5, 0.95])
+    assert abs(p50 - expected_p50) / expected_p50 < 0.02
+    assert abs(p95 - expected_p95) / expected_p95 < 0.02
+    assert abs(distinct_zone_pairs - 150 * 100) / (150 * 100) < 0.03
+
+
+def test_monthly_sketches_by_zone_pair_hour(tmp_path):
+    # arrange
+    rng = np.random.default_rng(0)
+    durations = {}
+    for month in [1, 2]:
+        num_trips = 2_000
+        # the trips from 132 to 236 (JFK to the Upper East Side) at 7:00-7:59 and 18:00-18:59
+        hour = np.where(np.arange(num_trips) % 2 == 0, 7, 18)
+        pickup_dtime = (
+            np.datetime64(f"2022-0{month}-01")
+            + rng.integers(0, 28, num_trips).astype("timedelta64[D]")
+            + hour.astype("timedelta64[h]")
+            + rng.integers(0, 3600, num_trips).astype("timedelta64[s]")
+        )
+        # the evening trips are longer, and the trips of February are longer than those of January
+        duration = rng.integers(1200, 2400, num_trips) * np.where(hour == 7, 1, 2) * month
+        trips = pa.table(
+            {
+                "pickup_dtime": pickup_dtime,
+                "dropoff_dtime": pickup_dtime + duration.astype("timedelta64[s]"),
+                "fare_amount": rng.uniform(50, 70, num_trips),
+                "trip_distance": rng.uniform(15, 20, num_trips),
+                "pickup_lid": np.full(num_trips, 132, dtype=np.int16),
+                "dropoff_lid": np.full(num_trips, 236, dtype=np.int16),
+            }
+        )
+        pq.write_table(
+            sketch_helper.build_monthly_sketches(trips),
+            sketch_helper.get_sketch_path(f"2022-0{month}-01", str(tmp_path)),
+        )
+        for h in [7, 18]:
+            durations.setdefault(h, []).append(duration[hour == h])
+    sketch_files = sketch_helper.get_sketch_files("2022-01-01", "2022-12-01", str(tmp_path))
+
+    # act
+    p95 = sketch_helper.query_quantiles(sketch_files, "duration_s", [0.95], "zone_pair_hour")
+    p95_at_7 = sketch_helper.query_quantiles(
+        sketch_files,
+        "duration_s",
+        [0.95],
+        "zone_pair_hour",
+        [sketch_helper.get_zone_pair_hour(132, 236, 7)],
+    )
+
+    # assert
+    assert sorted(p95) == [13223607, 13223618]
+    for h in [7, 18]:
+        expected_p95 = np.quantile(np.concatenate(durations[h]), 0.95)
+        [answer] = p95[sketch_helper.get_zone_pair_hour(132, 236, h)]
+        assert abs(answer - expected_p95) / expected_p95 < 0.02
+    assert p95_at_7 == {13223607: p95[13223607]}
+    # the other metrics are not kept by zone pair and hour
+    with raises(ValueError):
+        sketch_helper.query_quantiles(sketch_files, "fare_amount", [0.95], "zone_pair_hour")
+
+
+def test_quarantine_implausible_trips():
+    # arrange
+    rng = np.random.default_rng(0)
+    num_trips = 10_000
+    pickup_dtime = np.datetime64("2022-03-01") + rng.integers(0, 28 * 86400, num_trips).astype(
+        "timedelta64[s]"
+    )
+    duration_s = rng.integers(300, 1800, num_trips)
+    trip_distance = duration_s / 3600 * rng.uniform(8, 15, num_trips)
+    trips = DataFrame(
+        {
+            "trip_id": np.arange(num_trips),
+            "pickup_dtime": pickup_dtime,
+            "dropoff_dtime": pickup_dtime + duration_s.astype("timedelta64[s]"),
+            "trip_distance": trip_distance,
+            "fare_amount": trip_distance * rng.uniform(3, 6, num_trips),
+        }
+    )
+    # a trip that ends before it starts, a 500 mph trip and a $1000/mile trip
+    trips.loc[0, "dropoff_dtime"] = trips.loc[0, "pickup_dtime"] - np.timedelta64(60, "s")
+    trips.loc[1, "trip_distance"] = 500 * duration_s[1] / 3600
+    trips.loc[2, "fare_amount"] = 1000 * trips.loc[2, "trip_distance"]
+
+    # act
+    plausible, quarantined, thresholds = plausibility_helper.quarantine_implausible_trips(trips)
+
+    # assert
+    assert quarantined["trip_id"].tolist() == [0, 1, 2]
+    assert quarantined["plausibility_flags"].tolist() == [
+        plausibility_helper.NON_POSITIVE_DURATION,
+        plausibility_helper.SPEED_OUTLIER | plausibility_helper.FARE_PER_MILE_OUTLIER,
+        plausibility_helper.FARE_PER_MILE_OUTLIER,
+    ]
+    assert len(plausible) == num_trips - 3
+    assert thresholds["speed_mph"]["upper"] <= plausibility_helper.MAX_SPEED_MPH
@@ -1 +1,241 @@
+import asyncio
+from contextlib import contextmanager
+import os
 
+import duckdb
+from dagster import materialize
+import numpy as np
+from pandas import DataFrame
+import pyarrow.parquet as pq
+
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data import (
+    csv_assets,
+    parquet_assets,
+    rollup_assets,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.constants import table_names
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    csv_asset_helpers as csv_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    parquet_asset_helpers as parquet_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    plausibility_helpers as plausibility_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    rollup_helpers as rollup_helper,
+)
+from ..de_portfolio_nyc_tlc.io_managers import ArrowIOManager
+from ..de_portfolio_nyc_tlc.resources import RetryingDuckDBResource
+
+PARTITION_KEYS = ["2022-01-01", "2022-02-01", "2022-03-01"]
+
+
+def partition_range_tags(start: str, end: str) -> dict[str, str]:
+    # the tags of a backfill run that materializes a range of partitions
+    return {
+        "dagster/asset_partition_range_start": start,
+        "dagster/asset_partition_range_end": end,
+    }
+
+
+def test_csv_run_downloads_several_months(monkeypatch, tmp_path):
+    # arrange
+    in_flight = []
+    max_in_flight = 0
+
+    async def download_monthly_csv(client, partition_key, csv_data_dir, log):
+        nonlocal max_in_flight
+        in_flight.append(partition_key)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        await asyncio.sleep(0.05)
+        in_flight.remove(partition_key)
+        return {
+            "rows": int(partition_key[5:7]) * 10,
+            "duplicates": 0,
+            "watermark": f"{partition_key[:7]}-28T00:00:00.000",
+            "MB": 0.5,
+        }
+
+    monkeypatch.setattr(csv_assets, "CSV_DATA_DIR", tmp_path / "csv")
+    monkeypatch.setattr(csv_assets.helper, "download_monthly_csv", download_monthly_csv)
+
+    # act
+    result = materialize(
+        [csv_assets.YT_monthly_csv_2022],
+        tags=partition_range_tags(PARTITION_KEYS[0], PARTITION_KEYS[-1]),
+    )
+
+    # assert
+    assert result.success
+    materializations = result.asset_materializations_for_node("YT_monthly_csv_2022")
+    assert sorted(event.partition for event in materializations) == PARTITION_KEYS
+    metadata = materializations[0].metadata
+    assert metadata["Number of fetched records"].value == 60
+    assert metadata["Number of fetched records per partition"].value == {
+        "2022-01-01": 10,
+        "2022-02-01": 20,
+        "2022-03-01": 30,
+    }
+    # the months were downloaded concurrently, in the same run
+    assert max_in_flight == len(PARTITION_KEYS)
+    for partition_key in PARTITION_KEYS:
+        assert (
+            csv_helper.read_watermark(tmp_path / "csv", partition_key)
+            == f"{partition_key[:7]}-28T00:00:00.000"
+        )
+
+
+def write_raw_csv(csv_file: str, partition_key: str, with_socrata_id: bool) -> None:
+    rng = np.random.default_rng(int(partition_key[5:7]))
+    num_trips = 200
+    pickup_dtime = np.datetime64(partition_key) + rng.integers(
+        0, 27 * 86400, num_trips
+    ).astype("timedelta64[s]")
+    duration_s = rng.integers(300, 1800, num_trips)
+    trip_distance = duration_s / 3600 * rng.uniform(8, 15, num_trips)
+    fare_amount = trip_distance * rng.uniform(3, 6, num_trips)
+    trips = DataFrame(
+        {
+            "vendorid": rng.integers(1, 3, num_trips),
+            "tpep_pickup_datetime": pickup_dtime,
+            "tpep_dropoff_datetime": pickup_dtime + duration_s.astype("timedelta64[s]"),
+            "passenger_count": rng.integers(1, 4, num_trips),
+            "trip_distance": trip_distance,
+            "ratecodeid": 1,
+            "store_and_fwd_flag": "N",
+            "pulocationid": rng.integers(1, 5, num_trips),
+            "dolocationid": rng.integers(1, 5, num_trips),
+            "payment_type": rng.integers(1, 3, num_trips),
+            "fare_amount": fare_amount,
+            "extra": 0.5,
+            "mta_tax": 0.5,
+            "tip_amount": 1.0,
+            "tolls_amount": 0.0,
+            "improvement_surcharge": 0.3,
+            "total_amount": fare_amount + 2.3,
+            "congestion_surcharge": 2.5,
+            "airport_fee": 0.0,
+        }
+    )
+    if with_socrata_id:
+        trips.insert(
+            0,
+            parquet_helper.SOCRATA_ID_COLUMN,
+            [f"row-{partition_key[:7]}-{i}" for i in range(num_trips)],
+        )
+    os.makedirs(os.path.dirname(csv_file), exist_ok=True)
+    trips.to_csv(csv_file, index=False)
+
+
+def test_parquet_run_cleans_several_months(monkeypatch, tmp_path):
+    # arrange
+    get_quarantine_path = plausibility_helper.get_quarantine_path
+    monkeypatch.setattr(parquet_assets, "DATA_FOLDER", str(tmp_path / "data"))
+    monkeypatch.setattr(
+        plausibility_helper,
+        "get_quarantine_path",
+        lambda partition_key: get_quarantine_path(
+            partition_key, str(tmp_path / "quarantine")
+        ),
+    )
+    # February was downloaded before the Socrata row id was requested, so it has no socrata_id
+    for partition_key in PARTITION_KEYS:
+        write_raw_csv(
+            str(tmp_path / "data" / "csv" / f"{partition_key[:7]}.csv"),
+            partition_key,
+            with_socrata_id=partition_key != "2022-02-01",
+        )
+    io_manager = ArrowIOManager(base_dir=str(tmp_path / "arrow"))
+
+    # act
+    result = materialize(
+        [parquet_assets.YT_monthly_parquet_2022],
+        resources={"arrow_io_manager": io_manager},
+        tags=partition_range_tags(PARTITION_KEYS[0], PARTITION_KEYS[-1]),
+    )
+
+    # assert
+    assert result.success
+    assert all(check.passed for check in result.get_asset_check_evaluations())
+    metadata = result.asset_materializations_for_node("YT_monthly_parquet_2022")[0].metadata
+    assert set(metadata["Number of records per partition"].value) == set(PARTITION_KEYS)
+    # the column info covers the columns of every month, not only the last one
+    assert "socrata_id" in metadata["Column info"].value
+    parquet_folder = tmp_path / "data" / "parquet"
+    for partition_key in PARTITION_KEYS:
+        parquet_schema = pq.read_schema(parquet_folder / f"{partition_key[:7]}.parquet")
+        arrow_table = io_manager.read_table(
+            io_manager.get_path(["YT_monthly_parquet_2022"], partition_key)
+        )
+        assert arrow_table.schema.equals(parquet_schema)
+        assert ("socrata_id" in parquet_schema.names) == (partition_key != "2022-02-01")
+    # the months with the same columns share the schema of the first month
+    assert pq.read_schema(parquet_folder / "2022-03.parquet").equals(
+        pq.read_schema(parquet_folder / "2022-01.parquet")
+    )
+
+
+def write_monthly_parquet(database: str, parquet_file: str, month_offset: int) -> None:
+    # the trips of the test warehouse, moved to another month
+    os.makedirs(os.path.dirname(parquet_file), exist_ok=True)
+    with duckdb.connect(database, read_only=True) as conn:
+        conn.sql(
+            f"""--sql
+            COPY (
+                SELECT * REPLACE (
+                    pickup_dtime + INTERVAL ({month_offset}) MONTH AS pickup_dtime,
+                    dropoff_dtime + INTERVAL ({month_offset}) MONTH AS dropoff_dtime
+                )
+                FROM {table_names.YELLOW_TAXI_TRIPS}
+            ) TO '{parquet_file}' (FORMAT PARQUET)
+            """
+        )
+
+
+def test_rollup_run_shares_the_connection(monkeypatch, test_warehouse, tmp_path):
+    # arrange
+    parquet_folder = tmp_path / "parquet"
+    for month_offset, partition_key in enumerate(PARTITION_KEYS[:2]):
+        write_monthly_parquet(
+            test_warehouse, str(parquet_folder / f"{partition_key[:7]}.parquet"), month_offset
+        )
+    monkeypatch.setattr(rollup_assets, "PARQUET_FOLDER", str(parquet_folder))
+    connections = []
+    get_connection = RetryingDuckDBResource.get_connection
+
+    @contextmanager
+    def counting_get_connection(self, profile: str = "default"):
+        connections.append(profile)
+        with get_connection(self, profile) as conn:
+            yield conn
+
+    monkeypatch.setattr(RetryingDuckDBResource, "get_connection", counting_get_connection)
+
+    # act
+    result = materialize(
+        [rollup_assets.rollup_tables],
+        resources={"duckdb": RetryingDuckDBResource(database=test_warehouse)},
+        tags=partition_range_tags(PARTITION_KEYS[0], PARTITION_KEYS[1]),
+    )
+
+    # assert
+    assert result.success
+    assert connections == ["bulk_load"]
+    with duckdb.connect(test_warehouse, read_only=True) as conn:
+        expected_trips = conn.sql(
+            f"SELECT COUNT(*) FROM {table_names.YELLOW_TAXI_TRIPS}"
+        ).fetchone()[0]
+        for rollup in rollup_helper.ROLLUPS:
+            trips_per_month = conn.sql(
+                f"""--sql
+                SELECT partition_month::VARCHAR, SUM(trip_count)
+                FROM {rollup.table_name}
+                GROUP BY ALL
+                ORDER BY ALL
+                """
+            ).fetchall()
+            assert trips_per_month == [
+                (partition_key, expected_trips) for partition_key in PARTITION_KEYS[:2]
+            ]
@@ -0,0 +1,47 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import yaml
+
+from ..de_portfolio_nyc_tlc.concurrency import run_tag_concurrency_limits
+
+# the libraries that should only be imported inside the asset bodies,
+#   see benchmarks/startup_benchmark.py
+HEAVY_MODULES = ["pandas", "numpy", "httpx", "pyarrow"]
+
+
+def test_definitions_do_not_import_heavy_modules():
+    # arrange
+    statement = (
+        "import sys, json; "
+        + "from de_portfolio_nyc_tlc import defs; "
+        + f"print(json.dumps([m for m in {HEAVY_MODULES} if m in sys.modules]))"
+    )
+
+    # act
+    output = subprocess.run(
+        [sys.executable, "-c", statement],
+        check=True,
+        capture_output=True,
+        text=True,
+        # the project directory, where the code location is imported from
+        cwd=Path(__file__).parents[1],
+    ).stdout
+
+    # assert
+    assert json.loads(output.strip().splitlines()[-1]) == []
+
+
+def test_run_queue_limits_match_partitioning_limits():
+    # arrange
+    dagster_yaml = Path(__file__).parents[1] / "dagster.yaml"
+
+    # act
+    with open(dagster_yaml) as f:
+        run_coordinator = yaml.safe_load(f)["run_coordinator"]
+    tag_concurrency_limits = run_coordinator["config"]["tag_concurrency_limits"]
+
+    # assert
+    assert tag_concurrency_limits == run_tag_concurrency_limits
@@ -0,0 +1,80 @@
+import pyarrow as pa
+from dagster import AssetIn, asset, materialize
+from pytest import raises
+
+from ..de_portfolio_nyc_tlc.io_managers import ArrowIOManager, get_skipped_partitions
+from ..de_portfolio_nyc_tlc.partitions import monthly_partition
+
+NUM_ROWS = 100_000
+
+
+@asset(partitions_def=monthly_partition, io_manager_key="arrow_io_manager")
+def monthly_numbers(context) -> pa.Table:
+    month = int(context.partition_key.split("-")[1])
+    return pa.table(
+        {"month": [month] * NUM_ROWS, "value": [float(i) for i in range(NUM_ROWS)]}
+    )
+
+
+@asset(
+    ins={"monthly_numbers": AssetIn(key=monthly_numbers.key)},
+    io_manager_key="arrow_io_manager",
+)
+def yearly_numbers(monthly_numbers: pa.Table) -> pa.Table:
+    return monthly_numbers
+
+
+def test_arrow_io_manager_round_trip(tmp_path):
+    # arrange
+    io_manager = ArrowIOManager(base_dir=str(tmp_path), skip_missing_partitions=True)
+    resources = {"arrow_io_manager": io_manager}
+
+    # act
+    for partition_key in ["2022-01-01", "2022-02-01"]:
+        materialize(
+            [monthly_numbers], partition_key=partition_key, resources=resources
+        )
+    result = materialize(
+        [monthly_numbers.to_source_asset(), yearly_numbers], resources=resources
+    )
+
+    # assert
+    assert result.success
+    yearly = io_manager.read_table(str(tmp_path / "yearly_numbers.arrow"))
+    assert yearly.num_rows == 2 * NUM_ROWS
+    assert sorted(set(yearly["month"].to_pylist())) == [1, 2]
+    skipped_partitions = monthly_partition.get_partition_keys()[2:]
+    assert get_skipped_partitions(yearly) == skipped_partitions
+    [materialization] = result.asset_materializations_for_node("yearly_numbers")
+    assert materialization.metadata["Skipped partitions"].value == skipped_partitions
+
+
+def test_arrow_io_manager_raises_on_missing_partitions(tmp_path):
+    # arrange
+    io_manager = ArrowIOManager(base_dir=str(tmp_path))
+    resources = {"arrow_io_manager": io_manager}
+    materialize([monthly_numbers], partition_key="2022-01-01", resources=resources)
+
+    # act / assert
+    with raises(FileNotFoundError, match="2022-02-01"):
+        materialize(
+            [monthly_numbers.to_source_asset(), yearly_numbers], resources=resources
+        )
+
+
+def test_arrow_io_manager_reads_without_copying(tmp_path):
+    # arrange
+    io_manager = ArrowIOManager(base_dir=str(tmp_path))
+    path = str(tmp_path / "numbers.arrow")
+    io_manager.write_table(
+        pa.table({"value": [float(i) for i in range(NUM_ROWS)]}), path
+    )
+
+    # act
+    allocated_before = pa.total_allocated_bytes()
+    table = io_manager.read_table(path)
+    allocated_after = pa.total_allocated_bytes()
+
+    # assert: the buffers point to the memory-mapped file instead of arrow's memory pool
+    assert allocated_after - allocated_before < table.nbytes / 100
+    assert table["value"][NUM_ROWS - 1].as_py() == NUM_ROWS - 1
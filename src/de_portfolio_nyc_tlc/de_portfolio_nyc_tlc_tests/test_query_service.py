@@ -0,0 +1,109 @@
+import json
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import duckdb
+import pyarrow as pa
+from pytest import fixture, raises
+
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.constants import table_names
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    snapshot_helpers as snapshot_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    table_helpers as table_helper,
+)
+from ..de_portfolio_nyc_tlc.query_service import (
+    QueryServer,
+    QueryService,
+    normalize_sql,
+)
+
+
+@fixture
+def query_server(test_warehouse, tmp_path):
+    snapshot_dir = str(tmp_path / "snapshots")
+    with duckdb.connect(test_warehouse) as conn:
+        table_helper.bump_table_version(conn, table_names.YELLOW_TAXI_TRIPS)
+        snapshot_helper.publish_snapshot(conn, snapshot_dir)
+
+    server = QueryServer(("127.0.0.1", 0), QueryService(snapshot_dir, pool_size=2))
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+
+def post_query(url: str, sql: str, arrow: bool = False):
+    request = Request(
+        f"{url}/query{'?format=arrow' if arrow else ''}", data=sql.encode()
+    )
+    with urlopen(request) as response:
+        return response.headers, response.read()
+
+
+def test_normalize_sql():
+    # assert
+    assert normalize_sql(
+        "SELECT  borough, COUNT(*)\n-- per borough\nFROM taxi_zone_lookup WHERE zone = 'Jamaica  Bay';"
+    ) == normalize_sql(
+        "select borough, count(*) from TAXI_ZONE_LOOKUP where zone = 'Jamaica  Bay'"
+    )
+    assert normalize_sql("SELECT 'A'") != normalize_sql("SELECT 'a'")
+
+
+def test_query_service_caches_by_snapshot_version(query_server, test_warehouse):
+    # arrange
+    server, url = query_server
+    sql = f"SELECT COUNT(*) AS trips FROM {table_names.YELLOW_TAXI_TRIPS}"
+
+    # act
+    # the warehouse is written while the queries read the snapshot
+    with duckdb.connect(test_warehouse) as writer:
+        miss_headers, miss_body = post_query(url, sql)
+        hit_headers, hit_body = post_query(
+            url, f"select count(*)  AS trips\nfrom {table_names.YELLOW_TAXI_TRIPS};"
+        )
+        arrow_headers, arrow_body = post_query(url, sql, arrow=True)
+
+        writer.sql(f"DELETE FROM {table_names.YELLOW_TAXI_TRIPS} WHERE trip_id <= 100")
+        table_helper.bump_table_version(writer, table_names.YELLOW_TAXI_TRIPS)
+        snapshot_helper.publish_snapshot(writer, server.service.snapshot_dir)
+        new_snapshot_headers, new_snapshot_body = post_query(url, sql)
+
+    # assert
+    assert miss_headers["X-Cache"] == "MISS"
+    assert hit_headers["X-Cache"] == "HIT"
+    assert arrow_headers["X-Cache"] == "HIT"
+    assert (
+        json.loads(miss_body)
+        == json.loads(hit_body)
+        == {
+            "columns": ["trips"],
+            "rows": [{"trips": 500}],
+        }
+    )
+    assert pa.ipc.open_stream(arrow_body).read_all()["trips"].to_pylist() == [500]
+
+    assert new_snapshot_headers["X-Cache"] == "MISS"
+    assert (
+        new_snapshot_headers["X-Snapshot-Version"] != miss_headers["X-Snapshot-Version"]
+    )
+    assert json.loads(new_snapshot_body)["rows"] == [{"trips": 400}]
+
+
+def test_query_service_is_read_only(query_server, tmp_path):
+    # arrange
+    _, url = query_server
+
+    # act / assert
+    for sql in [
+        f"DROP TABLE {table_names.YELLOW_TAXI_TRIPS}",
+        f"COPY {table_names.YELLOW_TAXI_TRIPS} TO '{tmp_path / 'trips.csv'}'",
+        "SET enable_external_access = true",
+    ]:
+        with raises(HTTPError) as e:
+            post_query(url, sql)
+        assert e.value.code == 400
@@ -0,0 +1,56 @@
+import duckdb
+import pytest
+
+from ..de_portfolio_nyc_tlc.resources import DuckDBProfile, RetryingDuckDBResource
+
+
+def test_duckdb_profile_settings(tmp_path):
+    # arrange
+    spill_dir = str(tmp_path / "spill")
+    resource = RetryingDuckDBResource(
+        database=str(tmp_path / "test.duckdb"),
+        temp_directory=spill_dir,
+        profiles={"small": DuckDBProfile(threads=1, memory_limit="500MB")},
+    )
+
+    # act
+    with resource.get_connection(profile="small") as conn:
+        threads, memory_limit, temp_directory = conn.sql(
+            """--sql
+            SELECT
+                current_setting('threads'),
+                current_setting('memory_limit'),
+                current_setting('temp_directory')
+            """
+        ).fetchone()
+    with resource.get_connection(profile="bulk_load") as conn:
+        preserve_insertion_order = conn.sql(
+            "SELECT current_setting('preserve_insertion_order')"
+        ).fetchone()[0]
+
+    # assert
+    assert threads == 1
+    # DuckDB reports the limit in 1024^i units
+    assert memory_limit == "476.8 MiB"
+    assert temp_directory == spill_dir
+    assert preserve_insertion_order is False
+
+
+def test_duckdb_read_only_profile(test_warehouse):
+    # arrange
+    resource = RetryingDuckDBResource(database=test_warehouse)
+
+    # act / assert
+    with resource.get_connection(profile="read_only") as conn:
+        with pytest.raises(duckdb.InvalidInputException):
+            conn.sql("CREATE TABLE should_fail (id INTEGER)")
+
+
+def test_duckdb_unknown_profile(tmp_path):
+    # arrange
+    resource = RetryingDuckDBResource(database=str(tmp_path / "test.duckdb"))
+
+    # act / assert
+    with pytest.raises(ValueError, match="Unknown DuckDB profile"):
+        with resource.get_connection(profile="missing"):
+            pass
@@ -0,0 +1,296 @@
+import multiprocessing
+
+import duckdb
+from dagster import AssetSelection, DagsterInstance, materialize
+
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data import (
+    dim_table_assets,
+    dim_table_single_scan_assets,
+    maintenance_assets,
+    parquet_assets,
+    table_assets,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.constants import table_names
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    table_helpers as table_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers.dim_table_helpers import (
+    DIM_SOURCE_COLUMNS,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers.parquet_asset_helpers import (
+    TRIP_ID_MONTH_MULTIPLIER,
+)
+from ..de_portfolio_nyc_tlc.io_managers import ArrowIOManager
+from ..de_portfolio_nyc_tlc.resources import RetryingDuckDBResource
+
+from .conftest import create_test_warehouse
+
+DIM_ASSETS = {
+    table_names.DIM_TRIP_DATETIME: dim_table_assets.dim_trip_datetime,
+    table_names.DIM_TRIP_LOCATION: dim_table_assets.dim_trip_location,
+    table_names.DIM_TRANSACTION_FEES: dim_table_assets.dim_transaction_fees,
+    table_names.DIM_TRIP_MISC_DETAILS: dim_table_assets.dim_trip_misc_details,
+}
+
+
+def materialize_dim(dim_name: str, database: str) -> bool:
+    # each call runs in its own process, the same way as the steps of the multiprocess_executor
+    result = materialize(
+        [DIM_ASSETS[dim_name]],
+        resources={
+            "duckdb": RetryingDuckDBResource(
+                database=database, lock_retry_interval=0.05
+            )
+        },
+    )
+    return result.success
+
+
+def test_materialize_dims_concurrently(test_warehouse):
+    # arrange
+    with duckdb.connect(test_warehouse) as conn:
+        expected_counts = {
+            table_names.DIM_TRIP_DATETIME: conn.sql(
+                f"SELECT COUNT(*) FROM (SELECT DISTINCT pickup_dtime, dropoff_dtime FROM {table_names.YELLOW_TAXI_TRIPS})"
+            ).fetchone()[0],
+            table_names.DIM_TRIP_MISC_DETAILS: conn.sql(
+                f"SELECT COUNT(*) FROM (SELECT DISTINCT vendor_id, store_and_fwd_flag FROM {table_names.YELLOW_TAXI_TRIPS})"
+            ).fetchone()[0],
+        }
+
+    # act
+    pool = multiprocessing.get_context("spawn").Pool(len(DIM_ASSETS))
+    results = pool.starmap(
+        materialize_dim, [(dim_name, test_warehouse) for dim_name in DIM_ASSETS]
+    )
+    pool.close()
+    pool.join()
+
+    # assert
+    assert all(results)
+    with duckdb.connect(test_warehouse, read_only=True) as conn:
+        for dim_name in DIM_ASSETS:
+            count = conn.sql(f"SELECT COUNT(*) FROM {dim_name}").fetchone()[0]
+            assert count > 0
+            if dim_name in expected_counts:
+                assert count == expected_counts[dim_name]
+
+
+def get_dim_rows(database: str, dim_name: str) -> list[tuple]:
+    # compare the dims without their surrogate keys, since these depend on the insertion order
+    with duckdb.connect(database, read_only=True) as conn:
+        columns = [
+            col_name
+            for col_name, *_ in conn.sql(f"DESCRIBE {dim_name}").fetchall()
+        ][1:]
+        return sorted(
+            conn.sql(f"SELECT {', '.join(columns)} FROM {dim_name}").fetchall(),
+            key=str,
+        )
+
+
+def test_single_scan_dims_match_per_table_dims(tmp_path):
+    # arrange
+    per_table_db = create_test_warehouse(str(tmp_path / "per_table.duckdb"))
+    single_scan_db = create_test_warehouse(str(tmp_path / "single_scan.duckdb"))
+
+    # act
+    per_table_result = materialize(
+        list(DIM_ASSETS.values()),
+        resources={"duckdb": RetryingDuckDBResource(database=per_table_db)},
+    )
+    single_scan_result = materialize(
+        [dim_table_single_scan_assets.dim_tables_single_scan],
+        resources={"duckdb": RetryingDuckDBResource(database=single_scan_db)},
+    )
+
+    # assert
+    assert per_table_result.success and single_scan_result.success
+    assert len(single_scan_result.get_asset_materialization_events()) == len(
+        DIM_SOURCE_COLUMNS
+    )
+    for dim_name in DIM_ASSETS:
+        assert get_dim_rows(single_scan_db, dim_name) == get_dim_rows(
+            per_table_db, dim_name
+        )
+
+
+def test_single_scan_dims_subset(test_warehouse):
+    # act
+    result = materialize(
+        [dim_table_single_scan_assets.dim_tables_single_scan],
+        selection=AssetSelection.keys(table_names.DIM_TRIP_MISC_DETAILS),
+        resources={"duckdb": RetryingDuckDBResource(database=test_warehouse)},
+    )
+
+    # assert
+    materialized = [
+        event.asset_key.path[-1]
+        for event in result.get_asset_materialization_events()
+    ]
+    assert materialized == [table_names.DIM_TRIP_MISC_DETAILS]
+
+
+def test_storage_compaction(test_warehouse):
+    # arrange
+    with duckdb.connect(test_warehouse) as conn:
+        # the blocks of the replaced table are freed, but the file keeps its size since they are
+        #   followed by the blocks of the table created after it
+        conn.sql(
+            "CREATE OR REPLACE TABLE scratch AS SELECT range AS i, md5(range::VARCHAR) AS s FROM range(500000)"
+        )
+        conn.sql("CREATE OR REPLACE TABLE scratch_tail AS SELECT range AS i FROM range(100000)")
+        conn.sql("CREATE OR REPLACE TABLE scratch AS SELECT 1 AS i")
+        expected_trips = conn.sql(
+            f"SELECT COUNT(*) FROM {table_names.YELLOW_TAXI_TRIPS}"
+        ).fetchone()[0]
+    resources = {"duckdb": RetryingDuckDBResource(database=test_warehouse)}
+    instance = DagsterInstance.ephemeral()
+
+    # act
+    results = [
+        materialize(
+            [maintenance_assets.taxi_trip_records_storage],
+            resources=resources,
+            instance=instance,
+        )
+        for _ in range(2)
+    ]
+
+    # assert
+    compaction, remeasure = [
+        result.asset_materializations_for_node("taxi_trip_records_storage")[0].metadata
+        for result in results
+    ]
+    assert compaction["Compacted"].value
+    assert compaction["File size (MB)"].value < compaction["File size before compaction (MB)"].value
+    assert not remeasure["Compacted"].value
+    assert remeasure["File size change since last run (MB)"].value == 0
+    with duckdb.connect(test_warehouse, read_only=True) as conn:
+        assert (
+            conn.sql(f"SELECT COUNT(*) FROM {table_names.YELLOW_TAXI_TRIPS}").fetchone()[0]
+            == expected_trips
+        )
+
+
+def test_snapshot_is_published_once_per_table_version(test_warehouse, tmp_path):
+    # arrange
+    resources = {"duckdb": RetryingDuckDBResource(database=test_warehouse)}
+    run_config = {
+        "ops": {
+            "taxi_trip_records_snapshot": {
+                "config": {"snapshot_dir": str(tmp_path / "snapshots")}
+            }
+        }
+    }
+
+    # act
+    published = []
+    for bump in [True, False, True]:
+        if bump:
+            with duckdb.connect(test_warehouse) as conn:
+                table_helper.bump_table_version(conn, table_names.YELLOW_TAXI_TRIPS)
+        result = materialize(
+            [maintenance_assets.taxi_trip_records_snapshot],
+            resources=resources,
+            run_config=run_config,
+        )
+        metadata = result.asset_materializations_for_node("taxi_trip_records_snapshot")[
+            0
+        ].metadata
+        published.append(metadata["Published"].value)
+
+    # assert
+    assert published == [True, False, True]
+    assert metadata["Table versions"].value == {table_names.YELLOW_TAXI_TRIPS: 2}
+
+
+# the number of rows of a DuckDB row group
+ROW_GROUP_SIZE = 122_880
+
+
+def write_monthly_trips(
+    io_manager: ArrowIOManager, partition_key: str, num_trips: int
+) -> None:
+    # the cleaned trips of a month, in a shuffled arrival order
+    month_prefix = int(partition_key[:7].replace("-", "")) * TRIP_ID_MONTH_MULTIPLIER
+    monthly_trips = duckdb.sql(
+        f"""--sql
+        SELECT
+            {month_prefix} + i AS trip_id,
+            (i % 2 + 1)::TINYINT AS vendor_id,
+            TIMESTAMP '{partition_key}' + INTERVAL (i) SECOND AS pickup_dtime,
+            TIMESTAMP '{partition_key}' + INTERVAL (i + 600) SECOND AS dropoff_dtime,
+            (i % 3 + 1)::TINYINT AS passenger_count,
+            (i % 7 + 1) * 0.5 AS trip_distance,
+            (i % 4 + 1)::SMALLINT AS pickup_lid,
+            ((i + 1) % 4 + 1)::SMALLINT AS dropoff_lid,
+            (i % 7 + 1) * 2.5 AS total_amount
+        FROM range(1, {num_trips + 1}) AS t(i)
+        ORDER BY hash(i)
+        """
+    ).fetch_arrow_table()
+    io_manager.write_table(
+        monthly_trips,
+        io_manager.get_path(
+            parquet_assets.YT_monthly_parquet_2022.key.path, partition_key
+        ),
+    )
+
+
+def test_clustered_load_keeps_the_months_in_their_own_row_groups(monkeypatch, tmp_path):
+    # arrange
+    database = str(tmp_path / "taxi_trip_records.duckdb")
+    io_manager = ArrowIOManager(
+        base_dir=str(tmp_path / "arrow"), skip_missing_partitions=True
+    )
+    # each month fills one row group, so a row group that spans both months would have both prefixes
+    for partition_key in ["2022-01-01", "2022-02-01"]:
+        write_monthly_trips(io_manager, partition_key, ROW_GROUP_SIZE)
+    monkeypatch.setattr(table_assets, "TRIPS_LOAD_ORDER", "clustered")
+
+    # act
+    result = materialize(
+        [
+            parquet_assets.YT_monthly_parquet_2022,
+            table_assets.table_YT_trip_records_2022,
+        ],
+        selection=[table_assets.table_YT_trip_records_2022],
+        resources={
+            "duckdb": RetryingDuckDBResource(database=database),
+            "arrow_io_manager": io_manager,
+        },
+    )
+
+    # assert
+    assert result.success
+    with duckdb.connect(database, read_only=True) as conn:
+        trip_ids = [
+            trip_id
+            for trip_id, in conn.sql(
+                f"SELECT trip_id FROM {table_names.YELLOW_TAXI_TRIPS}"
+            ).fetchall()
+        ]
+        # the min/max zone maps of the trip_id column, per row group
+        row_group_months = conn.sql(
+            f"""--sql
+            SELECT
+                row_group_id,
+                MIN(zone_map.min::BIGINT) // {TRIP_ID_MONTH_MULTIPLIER} AS min_month,
+                MAX(zone_map.max::BIGINT) // {TRIP_ID_MONTH_MULTIPLIER} AS max_month
+            FROM (
+                SELECT
+                    row_group_id,
+                    regexp_extract(stats, 'Min: (\\d+), Max: (\\d+)', ['min', 'max']) AS zone_map
+                FROM pragma_storage_info('{table_names.YELLOW_TAXI_TRIPS}')
+                WHERE column_name = 'trip_id' AND segment_type = 'BIGINT'
+            )
+            GROUP BY ALL
+            ORDER BY ALL
+            """
+        ).fetchall()
+    assert len(trip_ids) == 2 * ROW_GROUP_SIZE
+    assert trip_ids == sorted(trip_ids)
+    assert [
+        (min_month, max_month) for _, min_month, max_month in row_group_months
+    ] == [(202201, 202201), (202202, 202202)]
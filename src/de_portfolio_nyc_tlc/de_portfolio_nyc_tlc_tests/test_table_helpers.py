@@ -0,0 +1,457 @@
+import duckdb
+import numpy as np
+from pytest import mark, raises
+
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.constants import table_names
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    zone_lookup_helpers as helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    rollup_helpers as rollup_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    sample_helpers as sample_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers import (
+    staging_helpers as staging_helper,
+)
+from ..de_portfolio_nyc_tlc.assets.yellow_taxi_data.helpers.parquet_asset_helpers import (
+    TRIP_ID_MONTH_MULTIPLIER,
+)
+
+from .conftest import create_test_warehouse
+
+
+def test_zone_lookup_arrays_enrich(tmp_path):
+    # arrange
+    database = create_test_warehouse(str(tmp_path / "zone_lookup.duckdb"))
+    with duckdb.connect(database) as conn:
+        lookup = helper.load_zone_lookup_arrays(conn)
+
+    # act
+    enriched = lookup.enrich_all(np.array([4, 1, 99, 2, 4]), prefix="pickup_")
+
+    # assert
+    assert list(enriched.columns) == [
+        "pickup_borough",
+        "pickup_zone",
+        "pickup_service_zone",
+    ]
+    assert list(enriched["pickup_borough"].astype(object)) == [
+        "Manhattan",
+        "EWR",
+        np.nan,
+        "Queens",
+        "Manhattan",
+    ]
+    assert enriched["pickup_zone"].iloc[1] == "Newark Airport"
+
+
+def build_test_rollups(tmp_path) -> duckdb.DuckDBPyConnection:
+    database = create_test_warehouse(str(tmp_path / "rollups.duckdb"))
+    parquet_file = str(tmp_path / "2022-01.parquet")
+    conn = duckdb.connect(database)
+    conn.sql(f"COPY yellow_taxi_trips TO '{parquet_file}' (FORMAT PARQUET)")
+
+    conn.sql(rollup_helper.query_create_rollup_source(parquet_file))
+    # run twice to verify that a partition replaces its own rows
+    for _ in range(2):
+        for rollup in rollup_helper.ROLLUPS:
+            conn.sql(rollup_helper.query_upsert_rollup_partition(rollup, "2022-01-01"))
+
+    return conn
+
+
+@mark.parametrize(
+    "dims, expected_rollup",
+    [
+        (["pickup_lid"], table_names.ROLLUP_HOURLY_PICKUP_ZONE),
+        (
+            ["pickup_borough", "pickup_hour_of_day"],
+            table_names.ROLLUP_HOURLY_PICKUP_BOROUGH,
+        ),
+        (["payment_type", "pickup_date"], table_names.ROLLUP_DAILY_BOROUGH_PAYMENT),
+    ],
+)
+def test_route_rollup(tmp_path, dims, expected_rollup):
+    # arrange
+    conn = build_test_rollups(tmp_path)
+
+    # act
+    rollup = rollup_helper.route_rollup(conn, dims)
+
+    # assert
+    assert rollup.table_name == expected_rollup
+
+
+def test_query_rollup_matches_trips(tmp_path):
+    # arrange
+    conn = build_test_rollups(tmp_path)
+    expected = conn.sql(
+        """--sql
+        SELECT
+            taxi_zone.borough AS pickup_borough,
+            COUNT(*) AS trip_count,
+            SUM(tip_amount) / SUM(fare_amount) AS tip_rate
+        FROM yellow_taxi_trips AS trips
+            LEFT JOIN taxi_zone_lookup AS taxi_zone
+                ON trips.pickup_lid = taxi_zone.location_id
+        WHERE payment_type = 1
+        GROUP BY 1
+        ORDER BY 1
+        """
+    ).df()
+
+    # act
+    result = rollup_helper.query_rollup(
+        conn,
+        group_by=["pickup_borough"],
+        measures=["trip_count", "tip_rate"],
+        filters={"payment_type": 1},
+    )
+
+    # assert
+    assert result["pickup_borough"].tolist() == expected["pickup_borough"].tolist()
+    assert result["trip_count"].tolist() == expected["trip_count"].tolist()
+    assert np.allclose(result["tip_rate"], expected["tip_rate"])
+
+
+def test_route_rollup_without_answering_rollup(tmp_path):
+    # arrange
+    conn = build_test_rollups(tmp_path)
+
+    # act, assert
+    with raises(ValueError):
+        rollup_helper.route_rollup(conn, ["dropoff_lid"])
+
+
+def test_upsert_rollup_partition_rolls_back(tmp_path):
+    # arrange
+    conn = build_test_rollups(tmp_path)
+    rollup = rollup_helper.ROLLUPS[0]
+    expected_rows = conn.sql(f"SELECT COUNT(*) FROM {rollup.table_name}").fetchone()[0]
+    # the INSERT fails after the DELETE, on a source without the trips' columns
+    conn.sql("CREATE TABLE broken_source AS SELECT 1 AS trip_id")
+
+    # act
+    with raises(duckdb.BinderException):
+        conn.sql(
+            rollup_helper.query_upsert_rollup_partition(rollup, "2022-01-01", "broken_source")
+        )
+    conn.sql("ROLLBACK")
+
+    # assert: the rows of the month were not deleted
+    assert conn.sql(f"SELECT COUNT(*) FROM {rollup.table_name}").fetchone()[0] == expected_rows
+
+
+def build_test_samples(tmp_path) -> duckdb.DuckDBPyConnection:
+    database = create_test_warehouse(str(tmp_path / "samples.duckdb"))
+    parquet_file = str(tmp_path / "2022-01.parquet")
+    conn = duckdb.connect(database)
+    conn.sql(f"COPY yellow_taxi_trips TO '{parquet_file}' (FORMAT PARQUET)")
+
+    # run twice to verify that a partition replaces its own rows
+    for _ in range(2):
+        conn.sql(sample_helper.query_create_sample_source(parquet_file, "2022-01-01"))
+        for sample in sample_helper.SAMPLES:
+            conn.sql(sample_helper.query_upsert_sample_partition(sample, "2022-01-01"))
+
+    return conn
+
+
+def test_upsert_sample_partition_rolls_back(tmp_path):
+    # arrange
+    conn = build_test_samples(tmp_path)
+    sample = sample_helper.SAMPLES[0]
+    expected_rows = conn.sql(f"SELECT COUNT(*) FROM {sample.table_name}").fetchone()[0]
+    # the INSERT fails after the DELETE, on a source without the size of the strata
+    conn.sql("CREATE TABLE broken_source AS SELECT 1 AS trip_id, 1 AS stratum_rank")
+
+    # act
+    with raises(duckdb.BinderException):
+        conn.sql(
+            sample_helper.query_upsert_sample_partition(sample, "2022-01-01", "broken_source")
+        )
+    conn.sql("ROLLBACK")
+
+    # assert: the trips of the month were not deleted
+    assert conn.sql(f"SELECT COUNT(*) FROM {sample.table_name}").fetchone()[0] == expected_rows
+
+
+def test_samples_are_stratified_and_nested(tmp_path):
+    # arrange
+    conn = build_test_samples(tmp_path)
+
+    # act
+    strata = conn.sql(
+        f"""--sql
+        SELECT pickup_borough, payment_type, COUNT(*), ANY_VALUE(sample_rows)
+        FROM {table_names.YELLOW_TAXI_TRIPS_SAMPLE_1_PCT}
+        GROUP BY ALL
+        """
+    ).fetchall()
+    trip_ids = {
+        sample.table_name: {
+            row[0] for row in conn.sql(f"SELECT trip_id FROM {sample.table_name}").fetchall()
+        }
+        for sample in sample_helper.SAMPLES
+    }
+
+    # assert
+    # the payment type of the test trips follows their pickup borough, and each stratum of 125 trips keeps
+    #   the minimum number of trips
+    assert len(strata) == 4
+    assert all(
+        count == sample_rows == sample_helper.MIN_STRATUM_SAMPLE_ROWS
+        for _, _, count, sample_rows in strata
+    )
+    assert (
+        trip_ids[table_names.YELLOW_TAXI_TRIPS_SAMPLE_0_1_PCT]
+        <= trip_ids[table_names.YELLOW_TAXI_TRIPS_SAMPLE_1_PCT]
+    )
+
+
+def test_query_sample_estimates(tmp_path):
+    # arrange
+    conn = build_test_samples(tmp_path)
+    expected = conn.sql(
+        """--sql
+        SELECT
+            taxi_zone.borough AS pickup_borough,
+            COUNT(*) AS trip_count,
+            SUM(fare_amount) AS fare_amount,
+            AVG(fare_amount) AS avg_fare_amount
+        FROM yellow_taxi_trips AS trips
+            LEFT JOIN taxi_zone_lookup AS taxi_zone
+                ON trips.pickup_lid = taxi_zone.location_id
+        GROUP BY 1
+        ORDER BY 1
+        """
+    ).df()
+
+    # act
+    result = sample_helper.query_sample(
+        conn,
+        group_by=["pickup_borough"],
+        measures=["trip_count", "fare_amount", "avg_fare_amount"],
+    )
+
+    # assert
+    assert result["pickup_borough"].tolist() == expected["pickup_borough"].tolist()
+    # the boroughs are strata, so their counts are exact
+    assert np.allclose(result["trip_count"], expected["trip_count"])
+    assert np.allclose(result["trip_count_stderr"], 0)
+    for measure in ["fare_amount", "avg_fare_amount"]:
+        assert (result[f"{measure}_stderr"] > 0).all()
+        assert (
+            abs(result[measure] - expected[measure]) <= 4 * result[f"{measure}_stderr"]
+        ).all()
+
+
+def test_query_sample_unknown_measure(tmp_path):
+    # arrange
+    conn = build_test_samples(tmp_path)
+
+    # act, assert
+    with raises(ValueError):
+        sample_helper.query_sample(conn, ["pickup_borough"], ["tip_rate"])
+
+
+def stage_test_month(
+    database: str, partition_key: str, staging_dir: str, socrata_ids: list[str]
+) -> dict[str, bool]:
+    """
+    Stages the trips of the test warehouse as the trips of the month of `partition_key`
+    """
+    month_prefix = int(partition_key[:7].replace("-", "")) * TRIP_ID_MONTH_MULTIPLIER
+    with duckdb.connect(database, read_only=True) as source:
+        monthly_trips = source.sql(
+            f"""--sql
+            SELECT * REPLACE ({month_prefix} + trip_id AS trip_id), NULL::TEXT AS socrata_id
+            FROM yellow_taxi_trips
+            """
+        ).fetch_arrow_table()
+    monthly_trips = monthly_trips.set_column(
+        monthly_trips.schema.get_field_index("socrata_id"),
+        "socrata_id",
+        [socrata_ids + [None] * (monthly_trips.num_rows - len(socrata_ids))],
+    )
+    duplicate_trips = monthly_trips.select(["trip_id"]).slice(0, 0)
+
+    with duckdb.connect(staging_helper.get_staging_path(partition_key, staging_dir)) as conn:
+        conn.register("monthly_trips", monthly_trips)
+        conn.register("duplicate_trips", duplicate_trips)
+        conn.sql(staging_helper.query_create_staging_table("ORDER BY trip_id"))
+
+        return staging_helper.validate_staged_month(conn, partition_key, 500)
+
+
+def test_publish_staged_months(tmp_path):
+    # arrange
+    database = create_test_warehouse(str(tmp_path / "staging.duckdb"))
+    staging_dir = str(tmp_path / "staging")
+    (tmp_path / "staging").mkdir()
+    # the first trip of February was already seen in January
+    validations = [
+        stage_test_month(database, "2022-01-01", staging_dir, ["row-1", "row-2"]),
+        stage_test_month(database, "2022-02-01", staging_dir, ["row-2", "row-3"]),
+    ]
+
+    # act
+    with duckdb.connect(database) as conn:
+        rows_per_month, replaced_keys = staging_helper.publish_staged_months(
+            conn, ["2022-01-01", "2022-02-01"], "ORDER BY trip_id", staging_dir
+        )
+        published_trips, socrata_ids = conn.sql(
+            """--sql
+            SELECT COUNT(*), COUNT(DISTINCT socrata_id) FROM yellow_taxi_trips
+            """
+        ).fetchone()
+        attached = conn.sql(
+            "SELECT COUNT(*) FROM duckdb_databases() WHERE database_name LIKE 'staging_%'"
+        ).fetchone()[0]
+
+    # assert
+    assert all(all(validation.values()) for validation in validations)
+    assert rows_per_month == {"2022-01-01": 500, "2022-02-01": 499}
+    assert replaced_keys == ["2022-01-01", "2022-02-01"]
+    assert published_trips == 999
+    assert socrata_ids == 3
+    assert attached == 0
+
+
+def test_publish_staged_months_keeps_the_table_on_failure(tmp_path):
+    # arrange
+    database = create_test_warehouse(str(tmp_path / "staging.duckdb"))
+    staging_dir = str(tmp_path / "staging")
+    (tmp_path / "staging").mkdir()
+    stage_test_month(database, "2022-01-01", staging_dir, [])
+    stage_test_month(database, "2022-02-01", staging_dir, [])
+    # the staging file of February lost its trips, which fails the load after the table was replaced
+    with duckdb.connect(staging_helper.get_staging_path("2022-02-01", staging_dir)) as conn:
+        conn.sql(f"DROP TABLE {staging_helper.STAGING_TABLE}")
+
+    # act
+    with duckdb.connect(database) as conn:
+        with raises(ValueError):
+            staging_helper.publish_staged_months(
+                conn, ["2022-01-01", "2022-03-01"], "", staging_dir
+            )
+        with raises(duckdb.Error):
+            staging_helper.publish_staged_months(
+                conn, ["2022-01-01", "2022-02-01"], "", staging_dir
+            )
+        trips = conn.sql("SELECT COUNT(*), MAX(trip_id) FROM yellow_taxi_trips").fetchone()
+
+    # assert
+    assert trips == (500, 500)
+
+
+def test_publish_staged_months_keeps_the_merged_changes(tmp_path):
+    # arrange
+    database = create_test_warehouse(str(tmp_path / "staging.duckdb"))
+    staging_dir = str(tmp_path / "staging")
+    (tmp_path / "staging").mkdir()
+    stage_test_month(database, "2022-01-01", staging_dir, ["row-1", "row-2"])
+    month_prefix = 202201 * TRIP_ID_MONTH_MULTIPLIER
+    # row-1 is corrected, row-2 is removed, and row-new is a new trip of the month
+    with duckdb.connect(staging_helper.get_staging_path("2022-01-01", staging_dir)) as conn:
+        changed_trips = conn.sql(
+            f"""--sql
+            SELECT * REPLACE (99.0 AS total_amount) FROM {staging_helper.STAGING_TABLE}
+            WHERE socrata_id = 'row-1'
+            UNION ALL
+            SELECT * REPLACE ({month_prefix + 501} AS trip_id, 'row-new' AS socrata_id)
+            FROM {staging_helper.STAGING_TABLE}
+            WHERE socrata_id = 'row-2'
+            """
+        ).fetch_arrow_table()
+
+    # act
+    is_staged = staging_helper.merge_changes_into_staged_month(
+        "2022-01-01", ["row-1", "row-2", "row-new"], changed_trips, staging_dir
+    )
+    with duckdb.connect(database) as conn:
+        staging_helper.publish_staged_months(
+            conn, ["2022-01-01"], "ORDER BY trip_id", staging_dir
+        )
+        trips = conn.sql(
+            """--sql
+            SELECT socrata_id, trip_id, total_amount FROM yellow_taxi_trips
+            WHERE socrata_id IS NOT NULL
+            ORDER BY trip_id
+            """
+        ).fetchall()
+        num_trips = conn.sql("SELECT COUNT(*) FROM yellow_taxi_trips").fetchone()[0]
+
+    # assert
+    assert is_staged
+    assert not staging_helper.merge_changes_into_staged_month(
+        "2022-02-01", ["row-1"], changed_trips, staging_dir
+    )
+    assert [trip[:2] for trip in trips] == [
+        ("row-1", month_prefix + 1),
+        ("row-new", month_prefix + 501),
+    ]
+    assert trips[0][2] == 99.0
+    assert num_trips == 500
+
+
+def test_publish_staged_months_replaces_the_changed_months(tmp_path):
+    # arrange
+    source = create_test_warehouse(str(tmp_path / "source.duckdb"))
+    database = str(tmp_path / "staging.duckdb")
+    rebuilt_database = str(tmp_path / "rebuilt.duckdb")
+    staging_dir = str(tmp_path / "staging")
+    (tmp_path / "staging").mkdir()
+    partition_keys = ["2022-01-01", "2022-02-01", "2022-03-01"]
+    # the first trip of February was already seen in January, which leaves it out
+    stage_test_month(source, "2022-01-01", staging_dir, ["row-1", "row-2"])
+    stage_test_month(source, "2022-02-01", staging_dir, ["row-2", "row-3"])
+    stage_test_month(source, "2022-03-01", staging_dir, ["row-4"])
+    with duckdb.connect(database) as conn:
+        staging_helper.publish_staged_months(conn, partition_keys, "", staging_dir)
+
+    # act
+    with duckdb.connect(database) as conn:
+        _, unchanged_keys = staging_helper.publish_staged_months(
+            conn, partition_keys, "", staging_dir
+        )
+    # January is staged again without row-2, so the trip of February is kept instead
+    stage_test_month(source, "2022-01-01", staging_dir, ["row-1"])
+    with duckdb.connect(database) as conn:
+        rows_per_month, replaced_keys = staging_helper.publish_staged_months(
+            conn, partition_keys, "", staging_dir
+        )
+        trips = conn.sql("SELECT * FROM yellow_taxi_trips ORDER BY trip_id").fetchall()
+    with duckdb.connect(rebuilt_database) as conn:
+        staging_helper.publish_staged_months(conn, partition_keys, "", staging_dir)
+        rebuilt_trips = conn.sql("SELECT * FROM yellow_taxi_trips ORDER BY trip_id").fetchall()
+
+    # assert
+    assert unchanged_keys == []
+    assert replaced_keys == ["2022-01-01"]
+    assert rows_per_month == {"2022-01-01": 500, "2022-02-01": 500, "2022-03-01": 500}
+    assert trips == rebuilt_trips
+
+
+def test_validate_staged_month(tmp_path):
+    # arrange
+    database = create_test_warehouse(str(tmp_path / "staging.duckdb"))
+    staging_dir = str(tmp_path / "staging")
+    (tmp_path / "staging").mkdir()
+
+    # act
+    # the trips of January staged as the trips of March
+    stage_test_month(database, "2022-01-01", staging_dir, [])
+    with duckdb.connect(staging_helper.get_staging_path("2022-01-01", staging_dir)) as conn:
+        validations = staging_helper.validate_staged_month(conn, "2022-03-01", 500)
+
+    # assert
+    assert validations == {
+        "has_trips": True,
+        "has_expected_row_count": True,
+        "has_unique_trip_ids": True,
+        "has_only_trips_of_the_month": False,
+        "has_pickup_times": True,
+    }
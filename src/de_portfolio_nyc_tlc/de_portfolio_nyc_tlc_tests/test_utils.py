@@ -0,0 +1,160 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import httpx
+import numpy as np
+import pytest
+
+from ..de_portfolio_nyc_tlc.utils.log_utils import ProgressReporter
+from ..de_portfolio_nyc_tlc.utils.memory_utils import recommend_concurrency
+from ..de_portfolio_nyc_tlc.utils.dedup_utils import StreamingDeduplicator
+from ..de_portfolio_nyc_tlc.utils import http_cache_utils as http_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_progress_reporter_is_rate_limited():
+    # arrange
+    clock = FakeClock()
+    log = MagicMock()
+    progress = ProgressReporter(log, "2022-01.csv", interval=10, clock=clock)
+
+    # act
+    logged = []
+    for _ in range(30):
+        clock.now += 1
+        logged.append(progress.update(rows=1_000, num_bytes=1_000_000))
+
+    # assert
+    assert logged.count(True) == 3
+    assert log.info.call_count == 3
+    assert progress.rows == 30_000
+
+
+def test_progress_reporter_throughput_and_eta():
+    # arrange
+    clock = FakeClock()
+    progress = ProgressReporter(
+        MagicMock(), "2022-01.csv", expected_rows=10_000, clock=clock
+    )
+
+    # act
+    clock.now = 5
+    progress.update(rows=2_500, num_bytes=5_000_000)
+    stats = progress.stats()
+
+    # assert
+    assert stats["rows_per_s"] == 500
+    assert stats["MB_per_s"] == 1
+    assert progress.eta() == 15
+    assert "ETA: 15s" in progress.format_progress()
+
+
+@pytest.mark.parametrize(
+    "peak_rss_gb, available_gb, limit, expected",
+    [
+        # plenty of memory, capped by the configured limit
+        (2, 64, 5, 5),
+        # 80% of 16 GB fits 3 steps of 4 GB
+        (4, 16, 5, 3),
+        # at least one step can always run
+        (8, 4, 2, 1),
+    ],
+)
+def test_recommend_concurrency(peak_rss_gb, available_gb, limit, expected):
+    # act
+    recommended = recommend_concurrency(
+        peak_rss_bytes=peak_rss_gb * 1_000_000_000,
+        available_bytes=available_gb * 1_000_000_000,
+        limit=limit,
+    )
+
+    # assert
+    assert recommended == expected
+
+
+@pytest.mark.parametrize("expected_keys", [1_000_000, 10])
+def test_streaming_deduplicator(expected_keys):
+    # arrange
+    # an undersized Bloom filter (expected_keys=10) flags most of the new keys, which the exact set must keep
+    rng = np.random.default_rng(0)
+    keys = rng.integers(0, 2**63, 10_000, dtype=np.uint64)
+    batches = [
+        keys[:4_000],
+        # duplicates within the batch and of the previous batch
+        np.concatenate([keys[4_000:7_000], keys[4_000:4_010], keys[:25]]),
+        keys[7_000:],
+    ]
+    dedup = StreamingDeduplicator(expected_keys)
+
+    # act
+    kept = [batch[dedup.add(batch)] for batch in batches]
+
+    # assert
+    assert np.array_equal(np.concatenate(kept), keys)
+    assert dedup.duplicates == 35
+    assert dedup.num_keys == len(keys)
+
+
+def test_fetch_cached_revalidates(tmp_path):
+    # arrange
+    # a server with an ETag, whose content changes after the second request
+    bodies = [b"LocationID,Borough\n1,EWR\n", b"LocationID,Borough\n1,Newark\n"]
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        body = bodies[0] if len(requests) <= 2 else bodies[1]
+        etag = f'"{len(body)}-{body[-5:].hex()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, content=body, headers={"ETag": etag})
+
+    file_path = str(tmp_path / "csv" / "taxi_zone_lookup.csv")
+
+    async def fetch_three_times():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return [
+                await http_cache.fetch_cached(client, "https://example.com/lookup.csv", file_path)
+                for _ in range(3)
+            ]
+
+    # act
+    first, second, third = asyncio.run(fetch_three_times())
+
+    # assert
+    assert [first["changed"], second["changed"], third["changed"]] == [True, False, True]
+    assert "If-None-Match" not in requests[0].headers
+    assert requests[1].headers["If-None-Match"] == first["etag"]
+    assert first["sha256"] == second["sha256"] != third["sha256"]
+    with open(file_path, "rb") as f:
+        assert f.read() == bodies[1]
+    assert http_cache.read_cache_info(file_path)["sha256"] == third["sha256"]
+
+
+def test_fetch_cached_keeps_the_cached_copy_on_error(tmp_path):
+    # arrange
+    file_path = str(tmp_path / "taxi_zone_lookup.csv")
+    responses = [httpx.Response(200, content=b"cached"), httpx.Response(503)]
+
+    async def fetch_twice():
+        transport = httpx.MockTransport(lambda request: responses.pop(0))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await http_cache.fetch_cached(client, "https://example.com/lookup.csv", file_path)
+            await http_cache.fetch_cached(client, "https://example.com/lookup.csv", file_path)
+
+    # act / assert
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fetch_twice())
+    with open(file_path, "rb") as f:
+        assert f.read() == b"cached"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "taxi_zone_lookup.csv",
+        "taxi_zone_lookup.csv.cache.json",
+    ]